@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import os
 import re
 import json
@@ -5,23 +7,102 @@ import time
 from typing import List, Dict, Any
 import tempfile
 import hashlib
-from threading import Lock, Event
-from openai import OpenAI
+from threading import Event, RLock, local
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import logging
 
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
+from lazy_loader import lazy_import
+from ocr_engine import OCREngine, preprocess_image_for_ocr
+from chunker import split_into_chunks
+from token_budget import TokenBudgetPlanner
+from stream_parser import IncrementalJSONArrayParser
+from dedup_index import filter_near_duplicates
+from file_hasher import get_digest_cache
+from collection_store import write_collection
+from resilience import AUTH, ApiCallError, BackoffPolicy, EmptyResponseError, classify_error, get_circuit_breaker
+from request_scheduler import BACKGROUND, INTERACTIVE, get_request_scheduler
+from chat_session import ChatSession, ChatSessionStore
+from profiler import span, traced
 
 try:
     from config import API_KEY
 except ImportError:
     API_KEY = None
 
+try:
+    from config import MODELSCOPE_BASE_URL
+except ImportError:
+    MODELSCOPE_BASE_URL = "https://api-inference.modelscope.cn/v1/"
+
+try:
+    from config import FILE_HASH_CACHE
+except ImportError:
+    FILE_HASH_CACHE = "file_hash_cache.json"
+
+try:
+    from config import COLLECTION_FORMAT
+except ImportError:
+    COLLECTION_FORMAT = "jsonl"
+
+# openai（连同httpx、pydantic）导入约需半秒，创建客户端时才导入
+openai = lazy_import('openai')
+
+COLLECTION_COMPRESSION = {"jsonl": None, "jsonl.gz": "gzip", "jsonl.zst": "zstd"}
+# library_index.json 的读-改-写在进程内串行进行
+_library_index_lock = RLock()
+
 logging.getLogger('pdfplumber').setLevel(logging.WARNING)
 logging.getLogger('PyPDF2').setLevel(logging.WARNING)
 logging.getLogger('pdfminer').setLevel(logging.WARNING)
 
+EXTRACTION_SYSTEM_PROMPT = "你是一个专业的题目提取助手，请严格按照要求的JSON格式返回结果。"
+
+
+def _count_pdf_pages(pdf_path: str) -> int:
+    try:
+        import pypdfium2 as pdfium
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    except ImportError:
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+
+def _extract_pdf_page_range(pdf_path: str, start: int, end: int, layout: bool = True) -> List[str]:
+    # 在子进程中独立打开PDF，按页序返回 [start, end) 范围内每一页的文本
+    if not layout:
+        try:
+            import pypdfium2 as pdfium
+            pdf = pdfium.PdfDocument(pdf_path)
+            try:
+                texts = []
+                for index in range(start, end):
+                    page = pdf[index]
+                    textpage = page.get_textpage()
+                    texts.append(textpage.get_text_range().replace('\r\n', '\n').strip())
+                    textpage.close()
+                    page.close()
+                return texts
+            finally:
+                pdf.close()
+        except ImportError:
+            pass
+
+    import pdfplumber
+    texts = []
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, end + 1))) as pdf:
+        for page in pdf.pages:
+            texts.append(page.extract_text() or "")
+            page.close()
+    return texts
+
+
 class AIAssistant:
     def __init__(self, api_keys: List[str] = None, base_url: str = None,
                  model: str = "Qwen/Qwen2.5-Coder-32B-Instruct",
@@ -46,7 +127,8 @@ class AIAssistant:
             )
 
         self.api_keys = api_keys
-        self.base_url = base_url or "https://api-inference.modelscope.cn/v1/"
+        # 环境变量 AI_BASE_URL 可把请求指向本地模拟接口（见 mock_server.py）
+        self.base_url = base_url or os.getenv('AI_BASE_URL') or MODELSCOPE_BASE_URL
         self.model = model
         self.questions_dir = questions_dir
         self.stream = stream
@@ -56,19 +138,47 @@ class AIAssistant:
         print(f"流式输出: {'启用' if self.stream else '禁用'}")
         print(f"使用模型: {self.model}")
 
-        self.client = OpenAI(
+        # 重试由 call_with_retries 统一负责，关闭SDK内置的重试
+        self.client = openai.OpenAI(
             api_key=self.api_keys[0],
-            base_url=self.base_url
+            base_url=self.base_url,
+            max_retries=0
         )
+        self.backoff = BackoffPolicy()
+        self.circuit_breaker = get_circuit_breaker(self.base_url)
 
-        self.last_api_call_time = 0
+        # 调用频率由共享调度器控制：对话请求优先，批量提取使用剩余的速率
         self.min_call_interval = 2.0
-        self.api_call_lock = Lock()
+        self.scheduler = get_request_scheduler(self.base_url)
 
         self.client_stats = {0: {'success': 0, 'failures': 0, 'last_used': 0}}
         self.current_client_index = 0
+        # 最近的API调用记录：耗时、尝试次数、首个token时间，供基准测试统计
+        self.call_records = deque(maxlen=1000)
+        self.chunk_interval = 1.0
+        self.chunk_retry_rounds = 2
 
         self.file_cache = {}
+        self.digest_cache = get_digest_cache(FILE_HASH_CACHE)
+        self.collection_format = COLLECTION_FORMAT
+
+        self.pdf_workers = max(1, (os.cpu_count() or 2) - 1)
+        self.pdf_parallel_min_pages = 8
+        self.pdf_layout = True
+        self.ocr_engine = OCREngine()
+        self.ocr_scanned_pdf = True
+        self.min_page_text_length = 10
+        self.chunk_overlap_tokens = 60
+        self.budget_planner = TokenBudgetPlanner(model=self.model)
+        self.default_max_tokens = 4000
+        self.stream_include_usage = True
+        # 是否把流式输出逐字打印到控制台，调试时再打开
+        self.stream_echo = False
+        self.last_budget_report = {}
+        self._local = local()
+        self.chat_sessions = ChatSessionStore(
+            session_factory=lambda question: ChatSession(question, count_tokens=self.budget_planner.count_tokens))
+        self.chat_max_tokens = 1000
 
         self.cancel_event = Event()
         self.is_cancelled = False
@@ -92,18 +202,19 @@ class AIAssistant:
 
     def process_file_and_save_questions(self, file_path: str, file_type: str,
                                         target_dir: str = None,
-                                        max_chunk_size: int = 800,
-                                        progress_callback=None) -> Dict[str, Any]:
+                                        max_chunk_size: int = None,
+                                        progress_callback=None,
+                                        question_callback=None) -> Dict[str, Any]:
         if target_dir is None:
             target_dir = self.questions_dir
 
         os.makedirs(target_dir, exist_ok=True)
 
         questions = self.process_large_file_and_extract_questions(
-            file_path, file_type, max_chunk_size, progress_callback
+            file_path, file_type, max_chunk_size, progress_callback, question_callback
         )
 
-        result = self.save_questions_to_directory(questions, target_dir, os.path.basename(file_path))
+        result = self.save_questions_to_directory(questions, target_dir, self.get_document_name(file_path))
         return result
 
     def save_questions_to_directory(self, questions: List[Dict[str, Any]],
@@ -122,38 +233,59 @@ class AIAssistant:
             question_subdir = os.path.join(target_dir, f"{source_name}_{timestamp}")
             os.makedirs(question_subdir, exist_ok=True)
 
-            saved_files = []
-            for i, question in enumerate(questions):
-                question_type = question.get('type', 'unknown').replace('/', '_')
-                category = question.get('category', 'unknown').replace('/', '_')
-                filename = f"Q{i + 1:03d}_{question_type}_{category}.json"
-                filepath = os.path.join(question_subdir, filename)
+            extraction_time = datetime.now().isoformat()
+            question_ids = [f"Q{i + 1:03d}" for i in range(len(questions))]
+            if self.collection_format == "files":
+                saved_files = []
+                for i, question in enumerate(questions):
+                    question_type = question.get('type', 'unknown').replace('/', '_')
+                    category = question.get('category', 'unknown').replace('/', '_')
+                    filename = f"{question_ids[i]}_{question_type}_{category}.json"
+                    filepath = os.path.join(question_subdir, filename)
+
+                    question_with_meta = question.copy()
+                    question_with_meta['_metadata'] = {
+                        'source_file': source_filename,
+                        'extraction_time': extraction_time,
+                        'question_id': question_ids[i],
+                        'file_path': filepath
+                    }
 
-                question_with_meta = question.copy()
-                question_with_meta['_metadata'] = {
-                    'source_file': source_filename,
-                    'extraction_time': datetime.now().isoformat(),
-                    'question_id': f"Q{i + 1:03d}",
-                    'file_path': filepath
-                }
+                    with open(filepath, 'w', encoding='utf-8') as f:
+                        json.dump(question_with_meta, f, ensure_ascii=False, indent=2)
 
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(question_with_meta, f, ensure_ascii=False, indent=2)
+                    saved_files.append(filepath)
+                question_locations = [{"file": os.path.basename(path)} for path in saved_files]
+            else:
+                records = []
+                for i, question in enumerate(questions):
+                    question_with_meta = question.copy()
+                    question_with_meta['_metadata'] = {
+                        'source_file': source_filename,
+                        'extraction_time': extraction_time,
+                        'question_id': question_ids[i]
+                    }
+                    records.append(question_with_meta)
 
-                saved_files.append(filepath)
+                data_path = write_collection(question_subdir, records,
+                                             compression=COLLECTION_COMPRESSION.get(self.collection_format))
+                saved_files = [data_path]
+                question_locations = [{"file": os.path.basename(data_path), "line": i}
+                                      for i in range(len(questions))]
 
             summary_file = os.path.join(question_subdir, "questions_summary.json")
             summary = {
                 "source_file": source_filename,
-                "extraction_time": datetime.now().isoformat(),
+                "extraction_time": extraction_time,
+                "format": self.collection_format,
                 "total_questions": len(questions),
                 "questions_summary": [
                     {
-                        "question_id": f"Q{i + 1:03d}",
+                        "question_id": question_ids[i],
                         "type": q.get('type', 'unknown'),
                         "category": q.get('category', 'unknown'),
                         "difficulty": q.get('difficulty', 3),
-                        "file": os.path.basename(saved_files[i])
+                        **question_locations[i]
                     }
                     for i, q in enumerate(questions)
                 ]
@@ -162,7 +294,7 @@ class AIAssistant:
             with open(summary_file, 'w', encoding='utf-8') as f:
                 json.dump(summary, f, ensure_ascii=False, indent=2)
 
-            self.update_questions_library_index(target_dir)
+            self.update_questions_library_index(target_dir, collection_dir=question_subdir)
 
             return {
                 "success": True,
@@ -170,7 +302,8 @@ class AIAssistant:
                 "saved_count": len(questions),
                 "target_dir": question_subdir,
                 "summary_file": summary_file,
-                "question_files": saved_files
+                # 旧格式是每题一个文件，JSONL格式只有一个数据文件
+                "saved_files": saved_files
             }
 
         except Exception as e:
@@ -181,54 +314,125 @@ class AIAssistant:
                 "target_dir": target_dir
             }
 
-    def update_questions_library_index(self, library_dir: str):
-        try:
-            index_file = os.path.join(library_dir, "library_index.json")
-            index_data = {
-                "last_updated": datetime.now().isoformat(),
-                "total_collections": 0,
-                "collections": []
-            }
+    def update_questions_library_index(self, library_dir: str, collection_dir: str = None,
+                                       full_rebuild: bool = False):
+        """更新题目库索引
 
-            if os.path.exists(index_file):
-                with open(index_file, 'r', encoding='utf-8') as f:
-                    index_data = json.load(f)
-
-            collections = []
-            for item in os.listdir(library_dir):
-                item_path = os.path.join(library_dir, item)
-                if os.path.isdir(item_path) and not item.startswith('.'):
-                    summary_file = os.path.join(item_path, "questions_summary.json")
-                    if os.path.exists(summary_file):
-                        with open(summary_file, 'r', encoding='utf-8') as f:
-                            summary = json.load(f)
-                            collections.append({
-                                "name": item,
-                                "path": item_path,
-                                "source_file": summary.get("source_file", "unknown"),
-                                "extraction_time": summary.get("extraction_time", ""),
-                                "question_count": summary.get("total_questions", 0)
-                            })
-
-            index_data["collections"] = collections
-            index_data["total_collections"] = len(collections)
-            index_data["last_updated"] = datetime.now().isoformat()
-
-            with open(index_file, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
-
-            print(f"题目库索引已更新，共有 {len(collections)} 个题目集合")
+        传入 collection_dir 时只替换/追加该集合的条目；否则（或 full_rebuild=True 时）扫描全部集合，
+        目录与汇总文件的 mtime 未变的集合直接沿用旧条目，不再解析 questions_summary.json。
+        """
+        try:
+            with _library_index_lock:
+                index_data = self.read_library_index(library_dir)
+                collections = index_data.get("collections", [])
+
+                if collection_dir and not full_rebuild and index_data.get("collections") is not None:
+                    name = os.path.basename(os.path.normpath(collection_dir))
+                    entry = self.build_collection_entry(library_dir, name)
+                    collections = [c for c in collections if c.get("name") != name]
+                    if entry:
+                        collections.append(entry)
+                else:
+                    existing = {c.get("name"): c for c in collections}
+                    collections = []
+                    reused = 0
+                    for item in sorted(os.listdir(library_dir)):
+                        item_path = os.path.join(library_dir, item)
+                        if not os.path.isdir(item_path) or item.startswith('.'):
+                            continue
+                        old_entry = existing.get(item)
+                        if old_entry and self.collection_unchanged(item_path, old_entry):
+                            collections.append(old_entry)
+                            reused += 1
+                            continue
+                        entry = self.build_collection_entry(library_dir, item)
+                        if entry:
+                            collections.append(entry)
+                    print(f"题目库索引重建: {len(collections)} 个集合，{reused} 个未变化已跳过")
+
+                index_data["collections"] = collections
+                index_data["total_collections"] = len(collections)
+                index_data["total_questions"] = sum(c.get("question_count", 0) for c in collections)
+                index_data["last_updated"] = datetime.now().isoformat()
+                self.write_library_index(library_dir, index_data)
+
+                print(f"题目库索引已更新，共有 {len(collections)} 个题目集合")
 
         except Exception as e:
             print(f"更新题目库索引失败: {e}")
 
+    def read_library_index(self, library_dir: str) -> Dict[str, Any]:
+        index_file = os.path.join(library_dir, "library_index.json")
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"读取题目库索引失败，将重建: {e}")
+        return {
+            "last_updated": datetime.now().isoformat(),
+            "total_collections": 0,
+            "total_questions": 0,
+        }
+
+    def write_library_index(self, library_dir: str, index_data: Dict[str, Any]):
+        index_file = os.path.join(library_dir, "library_index.json")
+        temp_file = f"{index_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(index_data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, index_file)
+
+    def build_collection_entry(self, library_dir: str, name: str):
+        item_path = os.path.join(library_dir, name)
+        summary_file = os.path.join(item_path, "questions_summary.json")
+        if not os.path.exists(summary_file):
+            return None
+
+        with open(summary_file, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        return {
+            "name": name,
+            "path": item_path,
+            "source_file": summary.get("source_file", "unknown"),
+            "extraction_time": summary.get("extraction_time", ""),
+            "question_count": summary.get("total_questions", 0),
+            "dir_mtime_ns": os.stat(item_path).st_mtime_ns,
+            "summary_mtime_ns": os.stat(summary_file).st_mtime_ns
+        }
+
+    def collection_unchanged(self, item_path: str, entry: Dict[str, Any]) -> bool:
+        try:
+            summary_file = os.path.join(item_path, "questions_summary.json")
+            return (entry.get("dir_mtime_ns") == os.stat(item_path).st_mtime_ns
+                    and entry.get("summary_mtime_ns") == os.stat(summary_file).st_mtime_ns)
+        except OSError:
+            return False
+
+    def list_collections(self, library_dir: str = None) -> List[Dict[str, Any]]:
+        """从索引读取题目集合列表，不访问各集合目录；索引不存在时先重建一次"""
+        library_dir = library_dir or self.questions_dir
+        index_data = self.read_library_index(library_dir)
+        if index_data.get("collections") is None:
+            self.update_questions_library_index(library_dir, full_rebuild=True)
+            index_data = self.read_library_index(library_dir)
+        return index_data.get("collections", [])
+
+    @traced('ai')
     def process_large_file_and_extract_questions(self, file_path: str, file_type: str,
-                                                 max_chunk_size: int = 800,
-                                                 progress_callback=None) -> List[Dict[str, Any]]:
+                                                 max_chunk_size: int = None,
+                                                 progress_callback=None,
+                                                 question_callback=None) -> List[Dict[str, Any]]:
+        """question_callback(question) 会在流式输出中每解析出一道完整题目时被调用（在工作线程中）"""
         try:
             self.reset_cancel()
+            self._local.failed_chunks = []
 
-            file_hash = self.get_file_hash(file_path)
+            if isinstance(file_path, (list, tuple)):
+                file_hash = hashlib.blake2b("".join(self.get_file_hash(p) for p in file_path).encode(),
+                                            digest_size=20).hexdigest()
+            else:
+                file_hash = self.get_file_hash(file_path)
+            self.digest_cache.flush()
             if file_hash in self.file_cache:
                 print("使用缓存的处理结果")
                 return self.file_cache[file_hash]
@@ -251,6 +455,11 @@ class AIAssistant:
             print(f"预处理后内容长度: {len(processed_content)} 字符")
 
             self.check_cancelled()
+            if max_chunk_size is None:
+                max_chunk_size = self.budget_planner.plan_chunk_tokens(self.prompt_overhead_tokens())
+            document_name = self.get_document_name(file_path)
+            self.budget_planner.start_document(document_name, max_chunk_size)
+
             chunks = self.split_content_into_chunks(processed_content, max_chunk_size)
             print(f"将内容分割成 {len(chunks)} 个块")
 
@@ -258,6 +467,9 @@ class AIAssistant:
                 progress_callback(0, f"文件已分割成 {len(chunks)} 个块")
 
             all_questions = []
+            failed_chunks = []
+            # 参数错误、鉴权失败等不可重试的块不进入重试队列
+            abandoned_chunks = []
             for i, chunk in enumerate(chunks):
                 try:
                     self.check_cancelled()
@@ -269,17 +481,42 @@ class AIAssistant:
                     progress_callback((i + 1) / len(chunks) * 100, f"正在处理第 {i + 1}/{len(chunks)} 个块...")
 
                 print(f"处理第 {i + 1}/{len(chunks)} 个块 (长度: {len(chunk)} 字符)...")
-                chunk_questions = self.extract_questions_from_chunk(chunk, i + 1)
+                try:
+                    chunk_questions = self.extract_questions_from_chunk(chunk, i + 1, document_name,
+                                                                        question_callback)
+                except ApiCallError as e:
+                    if e.failure.kind == AUTH:
+                        print(f"API密钥无效或无权限，停止处理: {e}")
+                        abandoned_chunks.extend(enumerate(chunks[i:], start=i))
+                        break
+                    if not e.failure.retryable:
+                        print(f"第{i + 1}块请求无法处理({e.failure.kind})，不再重试")
+                        abandoned_chunks.append((i, chunk))
+                        continue
+                    failed_chunks.append((i, chunk))
+                    print(f"第{i + 1}块请求失败，已加入重试队列")
+                    continue
                 all_questions.extend(chunk_questions)
 
-                if i < len(chunks) - 1:
-                    time.sleep(1)
+                if i < len(chunks) - 1 and self.chunk_interval:
+                    time.sleep(self.chunk_interval)
+
+            failed_chunks = self.retry_failed_chunks(failed_chunks, all_questions, document_name,
+                                                     question_callback)
+            failed_chunks = sorted(abandoned_chunks + failed_chunks, key=lambda item: item[0])
+            self._local.failed_chunks = failed_chunks
 
             self.check_cancelled()
             filtered_questions = self.post_process_questions(all_questions)
             print(f"提取到 {len(all_questions)} 道题目，过滤后剩余 {len(filtered_questions)} 道")
 
-            self.file_cache[file_hash] = filtered_questions
+            self.last_budget_report = self.budget_planner.report(document_name)
+            self.print_budget_report(document_name, self.last_budget_report)
+
+            if failed_chunks:
+                print(f"仍有 {len(failed_chunks)} 个块未能处理，本次结果不缓存")
+            else:
+                self.file_cache[file_hash] = filtered_questions
             return filtered_questions
 
         except Exception as e:
@@ -300,6 +537,8 @@ class AIAssistant:
             elif file_type == 'pdf':
                 return self.extract_text_from_pdf(file_path)
             elif file_type == 'image':
+                if isinstance(file_path, (list, tuple)):
+                    return self.extract_text_from_images(list(file_path))
                 return self.extract_text_from_image(file_path)
             else:
                 print(f"暂不支持的文件类型: {file_type}")
@@ -308,30 +547,92 @@ class AIAssistant:
             print(f"提取文件文本失败: {e}")
             return ""
 
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    def extract_text_from_pdf(self, pdf_path: str, workers: int = None, layout: bool = None) -> str:
         try:
-            import pdfplumber
-            text = ""
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text
+            pages = self.extract_pdf_pages(pdf_path, workers, layout)
+            if self.ocr_scanned_pdf:
+                pages = self.ocr_image_only_pages(pdf_path, pages)
+            return "".join(page_text + "\n" for page_text in pages if page_text)
         except ImportError:
             print("请安装pdfplumber: pip install pdfplumber")
             return ""
         except Exception as e:
+            if "处理已被用户取消" in str(e):
+                raise e
             print(f"PDF文本提取失败: {e}")
             return ""
 
+    def ocr_image_only_pages(self, pdf_path: str, pages: List[str]) -> List[str]:
+        # 没有文本层（或文本极少）的页面视为扫描页，栅格化后交给OCR引擎识别
+        scanned = [i for i, page_text in enumerate(pages)
+                   if len(page_text.strip()) < self.min_page_text_length]
+        if not scanned:
+            return pages
+
+        print(f"检测到 {len(scanned)} 个扫描页，开始OCR识别（{self.ocr_engine.workers} 个进程）...")
+        try:
+            ocr_texts = self.ocr_engine.ocr_pdf_pages(
+                pdf_path, scanned,
+                progress_callback=lambda done, total: print(f"OCR进度: {done}/{total}"),
+                cancel_check=self.check_cancelled
+            )
+        except ImportError as e:
+            # 缺少OCR依赖时只用文本层，不能让外层当作缺少pdfplumber而丢掉整份PDF
+            print(f"缺少OCR依赖（pytesseract/pypdfium2），扫描页跳过识别: {e}")
+            return pages
+        pages = list(pages)
+        for index, text in ocr_texts.items():
+            if len(text.strip()) > len(pages[index].strip()):
+                pages[index] = text
+        return pages
+
+    def extract_pdf_pages(self, pdf_path: str, workers: int = None, layout: bool = None) -> List[str]:
+        if workers is None:
+            workers = self.pdf_workers
+        if layout is None:
+            layout = self.pdf_layout
+
+        page_count = _count_pdf_pages(pdf_path)
+        if page_count == 0:
+            return []
+
+        workers = max(1, min(workers, page_count))
+        if workers == 1 or page_count < self.pdf_parallel_min_pages:
+            return _extract_pdf_page_range(pdf_path, 0, page_count, layout)
+
+        # 每个进程分到若干连续页段，段数略多于进程数以平衡各页耗时差异
+        segment_count = min(page_count, workers * 2)
+        bounds = [page_count * i // segment_count for i in range(segment_count + 1)]
+        print(f"PDF共 {page_count} 页，使用 {workers} 个进程并行提取 ({'布局模式' if layout else '快速模式'})")
+
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            try:
+                futures = [
+                    executor.submit(_extract_pdf_page_range, pdf_path, bounds[i], bounds[i + 1], layout)
+                    for i in range(segment_count)
+                ]
+                pages = []
+                for future in futures:
+                    self.check_cancelled()
+                    pages.extend(future.result())
+                return pages
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+        except Exception as e:
+            if "处理已被用户取消" in str(e):
+                raise e
+            print(f"多进程提取PDF失败，改为单进程提取: {e}")
+            return _extract_pdf_page_range(pdf_path, 0, page_count, layout)
+
     def extract_text_from_image(self, image_path: str, lang: str = 'chi_sim+eng') -> str:
+        return self.extract_text_from_images([image_path], lang)
+
+    def extract_text_from_images(self, image_paths: List[str], lang: str = 'chi_sim+eng') -> str:
         try:
-            img = Image.open(image_path)
-            img = self.preprocess_image_for_ocr(img)
-            text = pytesseract.image_to_string(img, lang=lang)
-            text = text.replace('\x0c', '').strip()
-            print(f"图片OCR识别完成，提取文本长度: {len(text)} 字符")
+            texts = self.ocr_engine.ocr_images(image_paths, lang=lang, cancel_check=self.check_cancelled)
+            text = "\n\n".join(t for t in texts if t)
+            print(f"图片OCR识别完成（{len(image_paths)} 张），提取文本长度: {len(text)} 字符")
             return text
         except ImportError:
             print("请安装pytesseract和Pillow: pip install pytesseract pillow")
@@ -341,76 +642,94 @@ class AIAssistant:
             print("  - Linux: sudo apt-get install tesseract-ocr tesseract-ocr-chinese-simplified")
             return ""
         except Exception as e:
+            if "处理已被用户取消" in str(e):
+                raise e
             print(f"图片OCR识别失败: {e}")
             return ""
 
     def preprocess_image_for_ocr(self, img: Image.Image) -> Image.Image:
-        img = img.convert('L')
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(2.0)
-        img = img.filter(ImageFilter.MedianFilter())
-        threshold = 128
-        img = img.point(lambda x: 255 if x > threshold else 0)
-        width, height = img.size
-        img = img.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
-        return img
+        return preprocess_image_for_ocr(img)
 
     def preprocess_content(self, content: str) -> str:
         if not content:
             return ""
 
-        content = re.sub(r'\s+', ' ', content)
-        content = re.sub(r'[^\w\u4e00-\u9fff\s\.,\?\!，。？！：；""''\(\)\[\]\-\+\*/=<>]', '', content)
-        content = re.sub(r'\n\s*\n', '\n\n', content)
+        # 保留换行，题号、选项的分行信息是分块时判断题目边界的依据
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+        content = re.sub(r'[ \t\f\v\u3000]+', ' ', content)
+        content = re.sub(r'[^\w\u4e00-\u9fff\s\.,\?\!，。？！：；、．（）【】""''\(\)\[\]\-\+\*/=<>]', '', content)
+        content = re.sub(r' *\n *', '\n', content)
+        content = re.sub(r'\n{3,}', '\n\n', content)
 
         return content.strip()
 
     def split_content_into_chunks(self, content: str, max_chunk_size: int) -> List[str]:
-        if len(content) <= max_chunk_size:
+        """按题目边界分块，max_chunk_size 为每块的token预算"""
+        content_tokens = self.budget_planner.count_tokens(content)
+        if content_tokens <= max_chunk_size:
             return [content]
 
-        print(f"内容长度: {len(content)} 字符，最大块大小: {max_chunk_size} 字符")
-        chunks_fixed = self._split_fixed_length(content, max_chunk_size)
-        print(f"按固定长度分割成 {len(chunks_fixed)} 个块")
-        return chunks_fixed
+        print(f"内容约 {content_tokens} tokens，每块预算: {max_chunk_size} tokens")
+        chunks = split_into_chunks(content,
+                                   self.budget_planner.to_estimate_units(max_chunk_size),
+                                   self.budget_planner.to_estimate_units(self.chunk_overlap_tokens))
+        print(f"按题目边界分割成 {len(chunks)} 个块")
+        return chunks
 
-    def _split_fixed_length(self, content: str, max_chunk_size: int) -> List[str]:
-        chunks = []
-        start = 0
+    def get_failed_chunks(self):
+        """当前线程最近一次处理中重试后仍失败的块 [(序号, 内容)]"""
+        return getattr(self._local, 'failed_chunks', [])
 
-        while start < len(content):
-            end = start + max_chunk_size
+    def retry_failed_chunks(self, failed_chunks, all_questions, document_name, question_callback=None):
+        """重试队列：主流程结束后再处理请求失败的块，返回仍失败的块
 
-            if end >= len(content):
-                chunks.append(content[start:])
+        重试中遇到不可重试的错误（参数错误、鉴权失败）的块不再进入下一轮，鉴权失败时整个队列停止。
+        """
+        abandoned = []
+        for retry_round in range(self.chunk_retry_rounds):
+            if not failed_chunks:
                 break
+            print(f"第 {retry_round + 1} 轮重试 {len(failed_chunks)} 个失败的块...")
+            self.sleep_with_cancel(self.backoff.delay(retry_round + 1))
 
-            for split_point in range(end, start, -1):
-                if split_point >= len(content):
-                    continue
-
-                char = content[split_point]
-                prev_char = content[split_point - 1] if split_point > 0 else ''
-
-                if prev_char in '。！？.!?':
-                    end = split_point
-                    break
-                elif char == '\n' and split_point - start > max_chunk_size * 0.8:
-                    end = split_point
-                    break
-                elif char in '，,;；:' and split_point - start > max_chunk_size * 0.8:
-                    end = split_point
-                    break
-                elif char in ' \t' and split_point - start > max_chunk_size * 0.9:
-                    end = split_point
-                    break
-
-            chunks.append(content[start:end])
-            start = end
-
-        return chunks
-
-    def extract_questions_from_chunk(self, chunk: str, chunk_number: int) -> List[Dict[str, Any]]:
+            remaining = []
+            for position, (index, chunk) in enumerate(failed_chunks):
+                self.check_cancelled()
+                try:
+                    all_questions.extend(self.extract_questions_from_chunk(chunk, index + 1, document_name,
+                                                                           question_callback))
+                except ApiCallError as e:
+                    if e.failure.kind == AUTH:
+                        print(f"API密钥无效或无权限，停止重试: {e}")
+                        return abandoned + remaining + failed_chunks[position:]
+                    if not e.failure.retryable:
+                        abandoned.append((index, chunk))
+                        continue
+                    remaining.append((index, chunk))
+            failed_chunks = remaining
+        return abandoned + failed_chunks
+
+    def get_document_name(self, file_path) -> str:
+        if isinstance(file_path, (list, tuple)):
+            return f"{os.path.basename(file_path[0])} 等{len(file_path)}个文件"
+        return os.path.basename(file_path)
+
+    def prompt_overhead_tokens(self) -> int:
+        return (self.budget_planner.count_tokens(self.build_extraction_prompt("", 0))
+                + self.budget_planner.count_tokens(EXTRACTION_SYSTEM_PROMPT))
+
+    def print_budget_report(self, document_name: str, report: Dict[str, Any]):
+        print(f"\n=== token用量: {document_name} ===")
+        print(f"每块预算: {report.get('chunk_budget', 0)} tokens，请求数: {report.get('chunks', 0)}")
+        print(f"估算输入: {report.get('estimated_prompt_tokens', 0)} tokens，"
+              f"实际输入: {report.get('prompt_tokens', 0)} tokens，"
+              f"实际输出: {report.get('completion_tokens', 0)} tokens")
+        print(f"max_tokens合计: {report.get('max_tokens_requested', 0)}，估算校准系数: {report.get('calibration')}")
+
+    @traced('ai')
+    def extract_questions_from_chunk(self, chunk: str, chunk_number: int,
+                                     document_name: str = None,
+                                     question_callback=None) -> List[Dict[str, Any]]:
         if chunk is None:
             print(f"第{chunk_number}块: chunk为None，跳过处理")
             return []
@@ -426,24 +745,52 @@ class AIAssistant:
             print(f"第{chunk_number}块: 提示词生成失败")
             return []
 
+        chunk_tokens = self.budget_planner.count_tokens(chunk)
+        prompt_tokens = (self.budget_planner.count_tokens(prompt)
+                         + self.budget_planner.count_tokens(EXTRACTION_SYSTEM_PROMPT))
+        max_tokens = self.budget_planner.plan_max_tokens(chunk_tokens, prompt_tokens)
+
         print(f"\n=== 第{chunk_number}块提取提示 (长度: {len(chunk)} 字符) ===")
-        print(f"提示词长度: {len(prompt)} 字符")
+        print(f"提示词约 {prompt_tokens} tokens，max_tokens: {max_tokens}")
 
         try:
             self.check_cancelled()
 
+            self._local.last_usage = None
+            parser = None
             if self.stream:
                 print(f"\n--- 第{chunk_number}块AI响应 ---")
-                response = self.call_ai_api_stream(prompt)
+                parser = IncrementalJSONArrayParser(
+                    on_object=self.make_live_question_callback(question_callback))
+                response = self.call_ai_api_stream(prompt, max_tokens=max_tokens, parser=parser)
+                parser.finish()
                 print(f"\n--- 第{chunk_number}块处理完成 ---")
             else:
-                response = self.call_ai_api(prompt)
+                response = self.call_ai_api(prompt, max_tokens=max_tokens)
                 print(f"第{chunk_number}块AI返回结果长度: {len(response)} 字符")
 
-            questions = self.parse_ai_response(response, chunk_number)
+            if document_name:
+                self.budget_planner.record_request(document_name, prompt_tokens, max_tokens,
+                                                   getattr(self._local, 'last_usage', None))
+
+            if parser is not None and parser.objects:
+                questions = parser.objects
+                if parser.errors:
+                    print(f"第{chunk_number}块: {parser.errors} 个对象解析失败已跳过")
+            else:
+                questions = self.parse_ai_response(response, chunk_number)
+                # 非流式或流式解析未得到结果时，整块解析完再推送
+                live_callback = self.make_live_question_callback(question_callback)
+                if live_callback:
+                    for question in questions:
+                        if isinstance(question, dict):
+                            live_callback(question)
             print(f"第{chunk_number}块提取到 {len(questions)} 道题目")
             return questions
 
+        except ApiCallError:
+            # 交给调用方放入重试队列，而不是当作“没有题目”
+            raise
         except Exception as e:
             if "处理已被用户取消" in str(e):
                 raise e
@@ -452,11 +799,35 @@ class AIAssistant:
             traceback.print_exc()
             return []
 
+    def make_live_question_callback(self, question_callback):
+        """包装实时回调：只推送完整题目，并按指纹去重（重试时流会从头再来）"""
+        if question_callback is None:
+            return None
+        seen = set()
+
+        def on_object(question):
+            if not self.is_complete_question(question):
+                return
+            fingerprint = self.create_question_fingerprint(str(question['question']))
+            if fingerprint in seen:
+                return
+            seen.add(fingerprint)
+            try:
+                question_callback(question)
+            except Exception as e:
+                print(f"题目回调失败: {e}")
+
+        return on_object
+
     def build_extraction_prompt(self, chunk: str, chunk_number: int) -> str:
         chunk_str = str(chunk) if chunk is not None else ""
-        max_chunk_length = 2000
-        if len(chunk_str) > max_chunk_length:
-            chunk_str = chunk_str[:max_chunk_length] + "... [内容已截断]"
+        if chunk_str:
+            chunk_tokens = self.budget_planner.count_tokens(chunk_str)
+            limit = self.budget_planner.max_input_tokens(self.prompt_overhead_tokens())
+            if chunk_tokens > limit:
+                keep = int(len(chunk_str) * limit / chunk_tokens)
+                print(f"第{chunk_number}块约 {chunk_tokens} tokens，超出上下文可用的 {limit} tokens，已截断")
+                chunk_str = chunk_str[:keep] + "... [内容已截断]"
 
         return f"""
 你是一个专业的题目提取助手。请从以下文本中分解成若干所有完整的题目：
@@ -492,122 +863,155 @@ class AIAssistant:
 ]
 """
 
-    def call_ai_api(self, prompt: str, max_retries: int = 3) -> str:
+    def record_api_call(self, started: float, attempts: int, success: bool, first_token: float = None):
+        finished = time.perf_counter()
+        self.call_records.append({
+            'duration': finished - started,
+            'attempts': attempts,
+            'success': success,
+            'first_token': first_token - started if first_token else None,
+        })
+
+    def call_with_retries(self, request, description: str, max_retries: int):
+        """统一的重试入口：按错误类型决定是否重试，带抖动的指数退避，并经过共享熔断器
+
+        request(attempt) 返回 (内容, 首个token时间)。重试用尽或遇到不可重试的错误时抛出 ApiCallError。
+        """
+        started = time.perf_counter()
+        failure = None
+        max_retries = max(1, max_retries)
         for attempt in range(max_retries):
+            self.check_cancelled()
+            self.circuit_breaker.before_call(self.check_cancelled)
+            settled = False
             try:
-                self.check_cancelled()
-
-                with self.api_call_lock:
-                    current_time = time.time()
-                    time_since_last_call = current_time - self.last_api_call_time
-
-                    if time_since_last_call < self.min_call_interval:
-                        wait_time = self.min_call_interval - time_since_last_call
-                        print(f"API调用频率控制，等待 {wait_time:.2f} 秒...")
-                        time.sleep(wait_time)
-
-                    print(f"调用API (尝试 {attempt + 1}/{max_retries})...")
-
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "你是一个专业的题目提取助手，请严格按照要求的JSON格式返回结果。"
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt if prompt else ""
-                            }
-                        ],
-                        temperature=0.1,
-                        max_tokens=4000,
-                        stream=False
-                    )
-
-                    self.last_api_call_time = time.time()
-                    self.client_stats[self.current_client_index]['last_used'] = time.time()
-                    self.client_stats[self.current_client_index]['success'] += 1
-
-                content = response.choices[0].message.content
-
-                if content:
-                    return content
-                else:
-                    raise Exception("API返回内容为空")
-
+                content, first_token = request(attempt)
             except Exception as e:
-                print(f"API请求异常 (尝试 {attempt + 1}/{max_retries}): {e}")
+                if "处理已被用户取消" in str(e):
+                    raise e
+                failure = classify_error(e)
                 self.client_stats[self.current_client_index]['failures'] += 1
-                if attempt < max_retries - 1:
-                    wait_time = 2 * (attempt + 1)
-                    print(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
+                self.circuit_breaker.record_failure(failure)
+                settled = True
+                print(f"{description}异常 (尝试 {attempt + 1}/{max_retries}, {failure.kind}): {e}")
+                if not failure.retryable or attempt == max_retries - 1:
+                    break
+                wait_time = self.backoff.delay(attempt, failure.retry_after)
+                print(f"等待 {wait_time:.1f} 秒后重试...")
+                self.sleep_with_cancel(wait_time)
+                continue
+            else:
+                self.circuit_breaker.record_success()
+                settled = True
+                self.client_stats[self.current_client_index]['success'] += 1
+                self.record_api_call(started, attempt + 1, True, first_token)
+                return content
+            finally:
+                if not settled:
+                    # 被取消（包括在排队时取消）的请求没有结果，归还可能持有的半开探测名额
+                    self.circuit_breaker.release_probe()
+
+        self.record_api_call(started, attempt + 1, False)
+        raise ApiCallError(failure, f"所有{description}尝试失败: {failure.kind}")
+
+    def sleep_with_cancel(self, seconds: float):
+        if self.cancel_event.wait(seconds):
+            self.check_cancelled()
 
-        raise Exception("所有API请求尝试失败")
+    def wait_for_rate_limit(self, priority: str = BACKGROUND):
+        self.scheduler.set_min_interval(self.min_call_interval)
+        with span('ai.queue_wait', 'ai', priority=priority):
+            waited = self.scheduler.acquire(priority, self.check_cancelled)
+        if waited >= 0.1:
+            print(f"API调用频率控制，已等待 {waited:.2f} 秒")
+
+    def build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": EXTRACTION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt if prompt else ""
+            }
+        ]
+
+    @traced('ai')
+    def call_ai_api(self, prompt: str, max_retries: int = 3, max_tokens: int = None,
+                    priority: str = BACKGROUND, messages: List[Dict[str, str]] = None,
+                    temperature: float = 0.1) -> str:
+        """messages 不为空时直接发送这组消息（对话用），否则用提取提示词包装 prompt"""
+        def request(attempt):
+            self.wait_for_rate_limit(priority)
+            print(f"调用API (尝试 {attempt + 1}/{max_retries})...")
+
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages or self.build_messages(prompt),
+                temperature=temperature,
+                max_tokens=max_tokens or self.default_max_tokens,
+                stream=False
+            )
+            self.client_stats[self.current_client_index]['last_used'] = time.time()
+
+            self._local.last_usage = getattr(response, 'usage', None)
+            content = response.choices[0].message.content
+            if not content:
+                raise EmptyResponseError("API返回内容为空")
+            return content, None
+
+        return self.call_with_retries(request, "API请求", max_retries)
+
+    @traced('ai')
+    def call_ai_api_stream(self, prompt: str, max_retries: int = 3, max_tokens: int = None,
+                           parser: IncrementalJSONArrayParser = None, priority: str = BACKGROUND) -> str:
+        def request(attempt):
+            if parser is not None:
+                parser.reset()
+
+            self.wait_for_rate_limit(priority)
+            print(f"调用API (流式, 尝试 {attempt + 1}/{max_retries})...")
+
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=self.build_messages(prompt),
+                stream=True,
+                temperature=0.1,
+                max_tokens=max_tokens or self.default_max_tokens,
+                **({"stream_options": {"include_usage": True}} if self.stream_include_usage else {})
+            )
+            self.client_stats[self.current_client_index]['last_used'] = time.time()
 
-    def call_ai_api_stream(self, prompt: str, max_retries: int = 3) -> str:
-        for attempt in range(max_retries):
-            try:
+            parts = []
+            first_token = None
+            for chunk in response:
                 self.check_cancelled()
 
-                with self.api_call_lock:
-                    current_time = time.time()
-                    time_since_last_call = current_time - self.last_api_call_time
-
-                    if time_since_last_call < self.min_call_interval:
-                        wait_time = self.min_call_interval - time_since_last_call
-                        print(f"API调用频率控制，等待 {wait_time:.2f} 秒...")
-                        time.sleep(wait_time)
-
-                    print(f"调用API (流式, 尝试 {attempt + 1}/{max_retries})...")
-
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "你是一个专业的题目提取助手，请严格按照要求的JSON格式返回结果。"
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt if prompt else ""
-                            }
-                        ],
-                        stream=True,
-                        temperature=0.1,
-                        max_tokens=4000
-                    )
-
-                    self.last_api_call_time = time.time()
-                    self.client_stats[self.current_client_index]['last_used'] = time.time()
-
-                full_response = ""
-                for chunk in response:
-                    self.check_cancelled()
-
-                    if chunk.choices[0].delta.content is not None:
-                        content_chunk = chunk.choices[0].delta.content
+                # 开启include_usage后，最后一个数据块只携带用量、没有choices
+                if getattr(chunk, 'usage', None):
+                    self._local.last_usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].delta.content is not None:
+                    content_chunk = chunk.choices[0].delta.content
+                    if first_token is None and content_chunk:
+                        first_token = time.perf_counter()
+                    if self.stream_echo:
                         print(content_chunk, end='', flush=True)
-                        full_response += content_chunk
+                    parts.append(content_chunk)
+                    if parser is not None:
+                        parser.feed(content_chunk)
 
+            if self.stream_echo:
                 print()
 
-                if full_response:
-                    self.client_stats[self.current_client_index]['success'] += 1
-                    return full_response
-                else:
-                    raise Exception("API返回内容为空")
+            full_response = "".join(parts)
+            if not full_response:
+                raise EmptyResponseError("API返回内容为空")
+            return full_response, first_token
 
-            except Exception as e:
-                print(f"API流式请求异常 (尝试 {attempt + 1}/{max_retries}): {e}")
-                self.client_stats[self.current_client_index]['failures'] += 1
-                if attempt < max_retries - 1:
-                    wait_time = 2 * (attempt + 1)
-                    print(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-
-        raise Exception("所有API流式请求尝试失败")
+        return self.call_with_retries(request, "API流式请求", max_retries)
 
     def parse_ai_response(self, response: str, chunk_number: int) -> List[Dict[str, Any]]:
         try:
@@ -736,19 +1140,19 @@ class AIAssistant:
                 seen_fingerprints.add(fingerprint)
                 unique_questions.append(question)
 
-        return unique_questions
+        # 再去掉改写过措辞的近似重复题
+        kept = filter_near_duplicates(str(q['question']) for q in unique_questions)
+        return [unique_questions[i] for i in kept]
 
     def create_question_fingerprint(self, question_text: str) -> str:
         text = question_text.lower().strip()
         text = re.sub(r'[^\w\u4e00-\u9fff]', '', text)
-        text_hash = hashlib.md5(text[:100].encode()).hexdigest()
+        text_hash = hashlib.md5(text.encode()).hexdigest()
         return text_hash
 
     def get_file_hash(self, file_path: str) -> str:
         try:
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-                return hashlib.md5(file_content).hexdigest()
+            return self.digest_cache.digest(file_path)
         except:
             try:
                 mtime = os.path.getmtime(file_path)
@@ -766,7 +1170,9 @@ class AIAssistant:
             print(f"最后更新: {index_data.get('last_updated', '未知')}")
             print(f"题目集合数量: {index_data.get('total_collections', 0)}")
 
-            total_questions = sum(coll.get('question_count', 0) for coll in index_data.get('collections', []))
+            total_questions = index_data.get('total_questions')
+            if total_questions is None:
+                total_questions = sum(coll.get('question_count', 0) for coll in index_data.get('collections', []))
             print(f"总题目数量: {total_questions}")
 
             print("\n题目集合列表:")
@@ -776,7 +1182,10 @@ class AIAssistant:
             print("题目库索引文件不存在")
 
     def extract_multiple_questions_from_image(self, image_path: str) -> List[Dict[str, Any]]:
-        return self.process_large_file_and_extract_questions(image_path, 'image', max_chunk_size=800)
+        return self.process_large_file_and_extract_questions(image_path, 'image')
+
+    def extract_multiple_questions_from_images(self, image_paths: List[str]) -> List[Dict[str, Any]]:
+        return self.process_large_file_and_extract_questions(list(image_paths), 'image')
 
     def extract_multiple_questions_from_text(self, text: str) -> List[Dict[str, Any]]:
         with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', suffix='.txt', delete=False) as f:
@@ -784,7 +1193,7 @@ class AIAssistant:
             temp_path = f.name
 
         try:
-            return self.process_large_file_and_extract_questions(temp_path, 'file', max_chunk_size=800)
+            return self.process_large_file_and_extract_questions(temp_path, 'file')
         finally:
             try:
                 os.unlink(temp_path)
@@ -792,32 +1201,26 @@ class AIAssistant:
                 pass
 
     def extract_multiple_questions_from_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
-        return self.process_large_file_and_extract_questions(pdf_path, 'pdf', max_chunk_size=800)
+        return self.process_large_file_and_extract_questions(pdf_path, 'pdf')
 
     def extract_multiple_questions_from_document(self, document_path: str) -> List[Dict[str, Any]]:
-        return self.process_large_file_and_extract_questions(document_path, 'file', max_chunk_size=800)
-
-    def chat_with_question(self, question, user_query):
-        try:
-            prompt = f"""你是一个学习助手，请根据以下题目帮助解答用户的问题。
+        return self.process_large_file_and_extract_questions(document_path, 'file')
 
-题目内容：
-{question}
+    def get_chat_session(self, question: str) -> ChatSession:
+        return self.chat_sessions.get(question)
 
-用户的问题：
-{user_query}
-
-请根据题目内容，提供详细的解答和解释。如果用户的问题与题目无关，也请尽量提供有帮助的回答。
-
-你的回答："""
-
-            response = self.call_ai_api(prompt)
-
-            if not response:
-                return f"我已收到您的问题：'{user_query}'，但我暂时无法提供详细的解答。请检查网络连接或稍后再试。"
-
-            return response.strip()
+    def chat_in_session(self, session: ChatSession, user_message: str) -> str:
+        """在会话中提问一次，成功后把这一轮写入会话历史；请求失败时抛出 ApiCallError"""
+        messages = session.build_messages(user_message)
+        response = self.call_ai_api("", max_retries=2, max_tokens=self.chat_max_tokens, priority=INTERACTIVE,
+                                    messages=messages, temperature=0.7)
+        reply = response.strip()
+        session.add_turn(user_message, reply)
+        return reply
 
+    def chat_with_question(self, question, user_query):
+        try:
+            return self.chat_in_session(self.get_chat_session(question), user_query)
         except Exception as e:
             print(f"AI对话失败: {e}")
             return f"抱歉，处理您的请求时出现错误：{str(e)}"
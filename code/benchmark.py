@@ -0,0 +1,477 @@
+"""性能基准测试脚本
+
+用法:
+    python benchmark.py pdf <PDF文件> [--workers 1,2,4] [--repeat 1]
+    python benchmark.py ocr <图片目录> [--threshold otsu|sauvola] [--deskew] [--crop]
+    python benchmark.py chunk <文本文件...> [--legacy-size 800] [--budget 800]
+    python benchmark.py stream [--questions 20] [--tokens-per-second 40]
+    python benchmark.py collection [--questions 10000] [--dir bench_collections]
+    python benchmark.py extraction [文本/PDF文件] [--questions 200] [--latency 0.5] [--tokens-per-second 200]
+                                   [--error-rate 0.1] [--no-stream] [--repeat 2]
+    python benchmark.py chat [--questions 400] [--chats 5] [--min-interval 0.5] [--workers 2]
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+
+from ai_assistant import AIAssistant
+from stream_parser import IncrementalJSONArrayParser
+from collection_store import iter_questions, read_question
+from mock_server import start_mock_server
+from request_scheduler import BACKGROUND, INTERACTIVE
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+
+
+def _parse_int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def _make_assistant(**kwargs):
+    return AIAssistant(api_keys=['benchmark'], stream=False, **kwargs)
+
+
+def bench_pdf(args):
+    """PDF文本提取：不同进程数下的页/秒"""
+    assistant = _make_assistant()
+    cpu_count = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({1, 2, 4, cpu_count})
+    assistant.pdf_parallel_min_pages = 1
+
+    print(f"\n{'模式':<8}{'进程数':>8}{'页数':>8}{'耗时(秒)':>12}{'页/秒':>10}")
+    for layout in (True, False):
+        mode = '布局' if layout else '快速'
+        for workers in worker_counts:
+            best = None
+            pages = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                pages = assistant.extract_pdf_pages(args.path, workers=workers, layout=layout)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            rate = len(pages) / best if best else 0
+            print(f"{mode:<8}{workers:>8}{len(pages):>8}{best:>12.3f}{rate:>10.1f}")
+
+
+def _legacy_preprocess_image_for_ocr(img):
+    from PIL import Image, ImageEnhance, ImageFilter
+    img = img.convert('L')
+    img = ImageEnhance.Contrast(img).enhance(2.0)
+    img = img.filter(ImageFilter.MedianFilter())
+    img = img.point(lambda x: 255 if x > 128 else 0)
+    width, height = img.size
+    return img.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
+
+
+def _char_accuracy(text, reference):
+    strip = lambda t: "".join(t.split())
+    return difflib.SequenceMatcher(None, strip(text), strip(reference), autojunk=False).ratio()
+
+
+def bench_ocr(args):
+    """OCR预处理：旧版固定阈值+2倍放大 与 向量化自适应预处理 的耗时和准确率对比
+
+    目录中与图片同名的 .txt 文件视为标注文本，用于计算字符准确率。
+    """
+    import pytesseract
+    from PIL import Image
+    from ocr_engine import preprocess_image_for_ocr
+
+    images = sorted(name for name in os.listdir(args.path) if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not images:
+        print("目录中没有图片")
+        return
+
+    pipelines = {
+        '旧版': _legacy_preprocess_image_for_ocr,
+        '新版': lambda img: preprocess_image_for_ocr(img, threshold=args.threshold,
+                                                     deskew=args.deskew, crop=args.crop),
+    }
+    totals = {name: {'prep': 0.0, 'ocr': 0.0, 'pixels': 0, 'accuracy': []} for name in pipelines}
+
+    for image_name in images:
+        image_path = os.path.join(args.path, image_name)
+        reference_path = os.path.splitext(image_path)[0] + '.txt'
+        reference = None
+        if os.path.exists(reference_path):
+            with open(reference_path, 'r', encoding='utf-8') as f:
+                reference = f.read()
+
+        original = Image.open(image_path)
+        original.load()
+        for name, preprocess in pipelines.items():
+            start = time.perf_counter()
+            prepared = preprocess(original)
+            prep_time = time.perf_counter() - start
+            start = time.perf_counter()
+            text = pytesseract.image_to_string(prepared, lang=args.lang)
+            ocr_time = time.perf_counter() - start
+
+            stats = totals[name]
+            stats['prep'] += prep_time
+            stats['ocr'] += ocr_time
+            stats['pixels'] += prepared.width * prepared.height
+            if reference is not None:
+                stats['accuracy'].append(_char_accuracy(text, reference))
+
+    print(f"\n共 {len(images)} 张图片")
+    print(f"{'流程':<6}{'预处理(秒)':>12}{'OCR(秒)':>10}{'总耗时(秒)':>12}{'百万像素':>10}{'字符准确率':>12}")
+    for name, stats in totals.items():
+        accuracy = (f"{sum(stats['accuracy']) / len(stats['accuracy']):.3f}"
+                    if stats['accuracy'] else '-')
+        print(f"{name:<6}{stats['prep']:>12.2f}{stats['ocr']:>10.2f}{stats['prep'] + stats['ocr']:>12.2f}"
+              f"{stats['pixels'] / 1e6:>10.1f}{accuracy:>12}")
+
+
+def _legacy_preprocess_content(content):
+    content = re.sub(r'\s+', ' ', content)
+    content = re.sub(r'[^\w\u4e00-\u9fff\s\.,\?\!，。？！：；""''\(\)\[\]\-\+\*/=<>]', '', content)
+    return content.strip()
+
+
+def _legacy_split_fixed_length(content, max_chunk_size):
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = start + max_chunk_size
+        if end >= len(content):
+            chunks.append(content[start:])
+            break
+        for split_point in range(end, start, -1):
+            if split_point >= len(content):
+                continue
+            char = content[split_point]
+            prev_char = content[split_point - 1] if split_point > 0 else ''
+            if prev_char in '。！？.!?':
+                end = split_point
+                break
+            elif char == '\n' and split_point - start > max_chunk_size * 0.8:
+                end = split_point
+                break
+            elif char in '，,;；:' and split_point - start > max_chunk_size * 0.8:
+                end = split_point
+                break
+            elif char in ' \t' and split_point - start > max_chunk_size * 0.9:
+                end = split_point
+                break
+        chunks.append(content[start:end])
+        start = end
+    return chunks
+
+
+def bench_chunk(args):
+    """分块：旧版按字符定长切分 与 按题目边界打包 的块数、token量与题目完整性对比"""
+    from chunker import estimate_tokens, find_question_starts
+
+    assistant = _make_assistant()
+    print(f"{'文件':<24}{'流程':<6}{'块数':>6}{'总tokens':>10}{'平均tokens':>12}{'题首开块率':>12}{'耗时(ms)':>10}")
+    for path in args.paths:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            raw = f.read()
+
+        runs = {
+            '旧版': lambda: _legacy_split_fixed_length(_legacy_preprocess_content(raw), args.legacy_size),
+            '新版': lambda: assistant.split_content_into_chunks(assistant.preprocess_content(raw), args.budget),
+        }
+        for name, run in runs.items():
+            start = time.perf_counter()
+            chunks = run()
+            elapsed = (time.perf_counter() - start) * 1000
+            tokens = [estimate_tokens(chunk) for chunk in chunks]
+            # 以题号开头的块占比，越高说明越少有题目被拦腰截断
+            aligned = sum(1 for chunk in chunks if find_question_starts(chunk.lstrip()[:12])[:1] == [0])
+            ratio = aligned / len(chunks) if chunks else 0
+            average = sum(tokens) / len(tokens) if tokens else 0
+            print(f"{os.path.basename(path)[:22]:<24}{name:<6}{len(chunks):>6}{sum(tokens):>10}"
+                  f"{average:>12.0f}{ratio:>12.1%}{elapsed:>10.1f}")
+
+
+def bench_stream(args):
+    """流式解析：按模拟的生成速度计算首题可见时间与整块完成时间"""
+    questions = [{
+        "type": "选择题",
+        "category": "数学",
+        "question": f"第{i + 1}题：下列关于函数单调性的说法正确的是？\nA. 选项一\nB. 选项二\nC. 选项三\nD. 选项四",
+        "answer": "B",
+        "notes": "",
+        "difficulty": 3,
+    } for i in range(args.questions)]
+    response = "```json\n" + json.dumps(questions, ensure_ascii=False, indent=2) + "\n```"
+    # 约4个字符视为一个token，逐token喂入
+    pieces = [response[i:i + 4] for i in range(0, len(response), 4)]
+
+    emitted_at = []
+    parser = IncrementalJSONArrayParser()
+    start = time.perf_counter()
+    for index, piece in enumerate(pieces):
+        for _ in parser.feed(piece):
+            emitted_at.append(index + 1)
+    parser.finish()
+    incremental_cpu = time.perf_counter() - start
+
+    assistant = _make_assistant()
+    start = time.perf_counter()
+    full_response = ""
+    for piece in pieces:
+        full_response += piece
+    assistant.parse_ai_response(full_response, 1)
+    legacy_cpu = time.perf_counter() - start
+
+    total_seconds = len(pieces) / args.tokens_per_second
+    first_seconds = emitted_at[0] / args.tokens_per_second if emitted_at else total_seconds
+    print(f"{args.questions} 道题目，约 {len(pieces)} tokens，生成速度 {args.tokens_per_second} tokens/s")
+    print(f"旧版: 首题可见 {total_seconds:.1f}s，解析耗时 {legacy_cpu * 1000:.2f}ms")
+    print(f"新版: 首题可见 {first_seconds:.1f}s，解析出 {len(parser.objects)} 道，"
+          f"解析耗时 {incremental_cpu * 1000:.2f}ms")
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files)
+
+
+def bench_collection(args):
+    """题目集合存储：每题一个文件与JSONL（含压缩）的写入、全量读取、随机读取耗时"""
+    questions = [{
+        "type": "选择题",
+        "category": "数学",
+        "question": f"第{i + 1}题：已知函数f(x)=x^2-{i % 7}x+3，求其在区间[0,3]上的最小值。\nA. 1\nB. 2\nC. 3\nD. 4",
+        "answer": "B",
+        "notes": "",
+        "difficulty": i % 5 + 1,
+    } for i in range(args.questions)]
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    print(f"{args.questions} 道题目")
+    for collection_format in ('files', 'jsonl', 'jsonl.gz', 'jsonl.zst'):
+        target = os.path.join(args.dir, collection_format.replace('.', '_'))
+        os.makedirs(target, exist_ok=True)
+        assistant = _make_assistant(questions_dir=target)
+        assistant.collection_format = collection_format
+
+        start = time.perf_counter()
+        result = assistant.save_questions_to_directory(questions, target, "bench.pdf")
+        write_seconds = time.perf_counter() - start
+        collection_dir = result["target_dir"]
+
+        start = time.perf_counter()
+        loaded = sum(1 for _ in iter_questions(collection_dir))
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for position in range(0, args.questions, max(1, args.questions // 100)):
+            read_question(collection_dir, position)
+        random_seconds = time.perf_counter() - start
+
+        print(f"{collection_format:>10}: 写入 {write_seconds:.2f}s，全量读取 {load_seconds:.2f}s（{loaded} 道），"
+              f"随机读取100次 {random_seconds * 1000:.1f}ms，"
+              f"占用 {_dir_size(collection_dir) / 1024:.0f}KB / {len(os.listdir(collection_dir))} 个文件")
+    shutil.rmtree(args.dir, ignore_errors=True)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, int(round(percent / 100 * (len(ordered) - 1)))))
+    return ordered[position]
+
+
+def _synthetic_exam(count):
+    lines = []
+    for i in range(count):
+        lines.append(f"{i + 1}. 已知函数f(x)=x^2-{i % 7}x+{i % 5}，下列关于f(x)在区间[0,{i % 4 + 1}]上单调性的说法正确的是？")
+        lines.extend(["A. 单调递增", "B. 单调递减", "C. 先减后增", "D. 无法确定"])
+    return "\n".join(lines)
+
+
+def bench_extraction(args):
+    """题目提取全流程：对本地模拟接口统计块/秒、首题时间、请求延迟分位数与重试次数"""
+    server, base_url = start_mock_server(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                                         error_rate=args.error_rate, error_status=args.error_status, seed=1)
+
+    temp_path = None
+    path, file_type = args.path, args.type
+    if not path:
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as f:
+            f.write(_synthetic_exam(args.questions))
+            temp_path = path = f.name
+        file_type = 'file'
+
+    try:
+        assistant = AIAssistant(api_keys=['mock'], base_url=base_url, stream=not args.no_stream)
+        assistant.min_call_interval = args.min_interval
+        assistant.chunk_interval = args.chunk_interval
+        if args.max_chunk_tokens:
+            assistant.budget_planner.max_chunk_tokens = args.max_chunk_tokens
+
+        results = []
+        for run in range(args.repeat):
+            assistant.call_records.clear()
+            first_question = []
+            start = time.perf_counter()
+
+            def on_question(question):
+                if not first_question:
+                    first_question.append(time.perf_counter() - start)
+
+            questions = assistant.process_large_file_and_extract_questions(path, file_type,
+                                                                           question_callback=on_question)
+            elapsed = time.perf_counter() - start
+            records = list(assistant.call_records)
+            durations = [r['duration'] for r in records]
+            chunks = assistant.last_budget_report.get('chunks', 0) if records else 0
+            results.append({
+                "run": run + 1,
+                "elapsed": elapsed,
+                "questions": len(questions),
+                "chunks": chunks,
+                "ttfq": first_question[0] if first_question else None,
+                "p50": _percentile(durations, 50),
+                "p95": _percentile(durations, 95),
+                "retries": sum(r['attempts'] - 1 for r in records),
+                "failed_calls": sum(1 for r in records if not r['success']),
+                "cached": not records,
+            })
+
+        with urllib.request.urlopen(base_url + "stats") as response:
+            server_stats = json.loads(response.read())
+    finally:
+        server.shutdown()
+        if temp_path:
+            os.unlink(temp_path)
+
+    print(f"\n模拟接口: 延迟 {args.latency}s，{args.tokens_per_second} tokens/s，错误率 {args.error_rate}，"
+          f"{'流式' if not args.no_stream else '非流式'}")
+    for r in results:
+        ttfq = f"{r['ttfq']:.2f}s" if r['ttfq'] is not None else "-"
+        rate = r['chunks'] / r['elapsed'] if r['elapsed'] else 0
+        print(f"第{r['run']}轮: 用时 {r['elapsed']:.2f}s，{r['chunks']} 块（{rate:.2f} 块/秒），{r['questions']} 道题目，"
+              f"首题 {ttfq}，请求延迟 p50 {r['p50']:.2f}s / p95 {r['p95']:.2f}s，"
+              f"重试 {r['retries']} 次，失败 {r['failed_calls']} 次{'（命中缓存）' if r['cached'] else ''}")
+    print(f"服务端: 请求 {server_stats['requests']} 次，注入错误 {server_stats['errors']} 次")
+
+
+def bench_chat(args):
+    """批量提取进行中的对话延迟：后台按 --workers 并发提取模拟试卷，期间定时发起对话请求"""
+    server, base_url = start_mock_server(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                                         canned=[], seed=1)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as f:
+        f.write(_synthetic_exam(args.questions))
+        path = f.name
+
+    try:
+        extractors = []
+        for _ in range(args.workers):
+            assistant = AIAssistant(api_keys=['mock'], base_url=base_url, stream=False)
+            assistant.min_call_interval = args.min_interval
+            assistant.chunk_interval = 0
+            assistant.budget_planner.max_chunk_tokens = args.max_chunk_tokens
+            extractors.append(assistant)
+        chat_assistant = AIAssistant(api_keys=['mock'], base_url=base_url, stream=False)
+        chat_assistant.min_call_interval = args.min_interval
+
+        threads = [threading.Thread(target=a.process_large_file_and_extract_questions, args=(path, 'file'),
+                                    daemon=True) for a in extractors]
+        for thread in threads:
+            thread.start()
+
+        latencies = []
+        time.sleep(args.warmup)
+        for _ in range(args.chats):
+            start = time.perf_counter()
+            chat_assistant.call_ai_api("这道题为什么选C？", max_retries=1, priority=INTERACTIVE)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(args.chat_gap)
+
+        for assistant in extractors:
+            assistant.cancel_processing()
+        for thread in threads:
+            thread.join(timeout=10)
+        scheduler_stats = chat_assistant.scheduler.stats()
+    finally:
+        server.shutdown()
+        os.unlink(path)
+
+    background = scheduler_stats[BACKGROUND]
+    print(f"\n最小调用间隔 {args.min_interval}s，后台提取并发 {args.workers}，模拟接口延迟 {args.latency}s")
+    print(f"对话 {len(latencies)} 次: p50 {_percentile(latencies, 50):.2f}s，max {max(latencies):.2f}s，"
+          f"排队平均 {scheduler_stats[INTERACTIVE]['mean_wait']:.2f}s")
+    print(f"后台请求 {background['count']} 次: 排队平均 {background['mean_wait']:.2f}s，"
+          f"最长 {background['max_wait']:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="学习空间性能基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pdf_parser = subparsers.add_parser('pdf', help='PDF多进程文本提取')
+    pdf_parser.add_argument('path')
+    pdf_parser.add_argument('--workers', type=_parse_int_list, default=None)
+    pdf_parser.add_argument('--repeat', type=int, default=1)
+    pdf_parser.set_defaults(func=bench_pdf)
+
+    ocr_parser = subparsers.add_parser('ocr', help='OCR预处理耗时与准确率')
+    ocr_parser.add_argument('path', help='图片目录，可放置同名.txt作为标注')
+    ocr_parser.add_argument('--lang', default='chi_sim+eng')
+    ocr_parser.add_argument('--threshold', choices=['otsu', 'sauvola'], default='otsu')
+    ocr_parser.add_argument('--deskew', action='store_true')
+    ocr_parser.add_argument('--crop', action='store_true')
+    ocr_parser.set_defaults(func=bench_ocr)
+
+    chunk_parser = subparsers.add_parser('chunk', help='文本分块块数与题目完整性')
+    chunk_parser.add_argument('paths', nargs='+')
+    chunk_parser.add_argument('--legacy-size', type=int, default=800, help='旧版每块字符数')
+    chunk_parser.add_argument('--budget', type=int, default=800, help='新版每块token预算')
+    chunk_parser.set_defaults(func=bench_chunk)
+
+    stream_parser = subparsers.add_parser('stream', help='流式JSON解析首题延迟')
+    stream_parser.add_argument('--questions', type=int, default=20)
+    stream_parser.add_argument('--tokens-per-second', type=float, default=40)
+    stream_parser.set_defaults(func=bench_stream)
+
+    collection_parser = subparsers.add_parser('collection', help='题目集合存储格式写入/读取耗时')
+    collection_parser.add_argument('--questions', type=int, default=10000)
+    collection_parser.add_argument('--dir', default='bench_collections')
+    collection_parser.set_defaults(func=bench_collection)
+
+    extraction_parser = subparsers.add_parser('extraction', help='对本地模拟接口跑完整题目提取流程')
+    extraction_parser.add_argument('path', nargs='?', help='待提取文件，不指定时生成模拟试卷')
+    extraction_parser.add_argument('--type', default='file', choices=['file', 'pdf', 'image'])
+    extraction_parser.add_argument('--questions', type=int, default=200, help='模拟试卷题数')
+    extraction_parser.add_argument('--latency', type=float, default=0.5)
+    extraction_parser.add_argument('--tokens-per-second', type=float, default=200)
+    extraction_parser.add_argument('--error-rate', type=float, default=0.0)
+    extraction_parser.add_argument('--error-status', type=int, default=500)
+    extraction_parser.add_argument('--no-stream', action='store_true')
+    extraction_parser.add_argument('--repeat', type=int, default=2, help='重复次数，第二轮起可观察缓存效果')
+    extraction_parser.add_argument('--min-interval', type=float, default=0.0, help='API最小调用间隔')
+    extraction_parser.add_argument('--chunk-interval', type=float, default=0.0, help='块间等待时间')
+    extraction_parser.add_argument('--max-chunk-tokens', type=int, default=1000, help='每块token上限，0表示按模型计算')
+    extraction_parser.set_defaults(func=bench_extraction)
+
+    chat_parser = subparsers.add_parser('chat', help='批量提取期间的对话延迟')
+    chat_parser.add_argument('--questions', type=int, default=400, help='模拟试卷题数')
+    chat_parser.add_argument('--workers', type=int, default=2, help='后台提取并发数')
+    chat_parser.add_argument('--chats', type=int, default=5)
+    chat_parser.add_argument('--chat-gap', type=float, default=1.0, help='两次对话之间的间隔')
+    chat_parser.add_argument('--warmup', type=float, default=2.0, help='提取开始后多久发起第一次对话')
+    chat_parser.add_argument('--latency', type=float, default=0.3)
+    chat_parser.add_argument('--tokens-per-second', type=float, default=0)
+    chat_parser.add_argument('--min-interval', type=float, default=0.5, help='API最小调用间隔')
+    chat_parser.add_argument('--max-chunk-tokens', type=int, default=300)
+    chat_parser.set_defaults(func=bench_chat)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
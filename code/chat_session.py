@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from chunker import estimate_tokens
+
+CHAT_SYSTEM_PROMPT = """你是一个学习助手，帮助用户理解题目。请直接回答用户的问题，不要使用"我已收到您的问题"这样的开场白。
+如果用户的问题与题目无关，请引导用户回到题目上来；无法回答时请表达歉意。正常对话，不要使用JSON格式。"""
+
+# 摘要中每条旧对话保留的字符数
+SUMMARY_EXCERPT_CHARS = 80
+
+
+class ChatSession:
+    """围绕一道题目的多轮对话
+
+    发送的消息依次为：系统提示+题目（整个会话内保持不变，便于服务端缓存前缀）、
+    较早对话的摘要（如有）、最近几轮原文、本次提问。历史超出 history_budget 时，
+    最早的几轮折叠为摘要，摘要本身超出预算时丢弃最旧的条目。
+    """
+
+    def __init__(self, question: str = "", history_budget: int = 1500, min_recent_turns: int = 2,
+                 count_tokens: Callable[[str], int] = None):
+        self.question = (question or "").strip()
+        self.history_budget = history_budget
+        self.min_recent_turns = min_recent_turns
+        self.count_tokens = count_tokens or estimate_tokens
+        self.turns: List[Dict[str, str]] = []
+        self.summary_lines: List[str] = []
+
+        self.prefix = [{"role": "system", "content": self.build_system_prompt()}]
+
+    def build_system_prompt(self) -> str:
+        if not self.question:
+            return CHAT_SYSTEM_PROMPT
+        return f"{CHAT_SYSTEM_PROMPT}\n\n题目内容：\n{self.question}"
+
+    def build_messages(self, user_message: str) -> List[Dict[str, str]]:
+        messages = list(self.prefix)
+        if self.summary_lines:
+            messages.append({"role": "system", "content": "此前对话摘要：\n" + "\n".join(self.summary_lines)})
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["assistant"]})
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def add_turn(self, user_message: str, reply: str):
+        self.turns.append({"user": user_message, "assistant": reply})
+        self.trim()
+
+    def history_tokens(self) -> int:
+        tokens = sum(self.count_tokens(line) for line in self.summary_lines)
+        for turn in self.turns:
+            tokens += self.count_tokens(turn["user"]) + self.count_tokens(turn["assistant"])
+        return tokens
+
+    def trim(self):
+        while len(self.turns) > self.min_recent_turns and self.history_tokens() > self.history_budget:
+            turn = self.turns.pop(0)
+            self.summary_lines.append(f"用户问：{self._excerpt(turn['user'])}；助手答：{self._excerpt(turn['assistant'])}")
+        while self.summary_lines and self.history_tokens() > self.history_budget:
+            self.summary_lines.pop(0)
+
+    @staticmethod
+    def _excerpt(text: str) -> str:
+        text = " ".join(text.split())
+        if len(text) <= SUMMARY_EXCERPT_CHARS:
+            return text
+        return text[:SUMMARY_EXCERPT_CHARS] + "…"
+
+    def clear(self):
+        self.turns = []
+        self.summary_lines = []
+
+
+class ChatSessionStore:
+    """按题目内容保存对话，最多保留 max_sessions 个，最久未使用的先淘汰"""
+
+    def __init__(self, max_sessions: int = 20, session_factory: Callable[[str], ChatSession] = ChatSession):
+        self.max_sessions = max_sessions
+        self.session_factory = session_factory
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def get(self, question: str) -> ChatSession:
+        key = (question or "").strip()
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.session_factory(key)
+            self.sessions[key] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(key)
+        return session
+
+    def discard(self, question: str) -> Optional[ChatSession]:
+        return self.sessions.pop((question or "").strip(), None)
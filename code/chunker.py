@@ -0,0 +1,168 @@
+import re
+import math
+from typing import List, Tuple
+
+# 中日韩文字及全角标点，按约0.7个token/字估算；其余字符按约0.3个token/字估算
+CJK_RE = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+CJK_TOKENS_PER_CHAR = 0.7
+OTHER_TOKENS_PER_CHAR = 0.3
+
+# 题号：1. / 1、 / （1） / (1) / 一、 / 第一题，须位于行首、空白或句末标点之后
+QUESTION_START_RE = re.compile(
+    r'(?:^|(?<=[\s。！？!?；;]))[ \t]*'
+    r'(?:\d{1,3}[.．、](?!\d)'
+    r'|[（(]\d{1,3}[)）]'
+    r'|[一二三四五六七八九十百]{1,3}[、.．]'
+    r'|第[一二三四五六七八九十百\d]{1,4}[题部章节])',
+    re.M
+)
+# 选项：A. / B、 / C） 等，选项块内部不作为切分点
+OPTION_START_RE = re.compile(r'(?:^|(?<=[\s。；;]))[ \t]*(?P<marker>[A-HＡ-Ｈ][.．、)）])', re.M)
+SENTENCE_END_RE = re.compile(r'[。！？!?]+[”’"』」)）]?|\.(?=\s)|[；;]|\n')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数"""
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR)
+
+
+def find_question_starts(content: str) -> List[int]:
+    """返回所有题号出现的位置（升序）"""
+    return [m.start() for m in QUESTION_START_RE.finditer(content)]
+
+
+def find_sentence_breaks(content: str) -> List[int]:
+    """返回句末切分点（切分点之后的位置，升序），紧跟选项标记的切分点会被排除"""
+    option_starts = set()
+    marker_ends = set()
+    for m in OPTION_START_RE.finditer(content):
+        option_starts.add(m.start('marker'))
+        marker_ends.add(m.end('marker'))
+    marker_ends.update(m.end() for m in QUESTION_START_RE.finditer(content))
+
+    breaks = []
+    for m in SENTENCE_END_RE.finditer(content):
+        end = m.end()
+        # 题号和选项标记里的点号不是句末
+        if end in marker_ends:
+            continue
+        # 跳过空白后若紧跟选项，说明仍在题目的选项块内
+        next_pos = end
+        while next_pos < len(content) and content[next_pos] in ' \t\r\n':
+            next_pos += 1
+        if next_pos in option_starts:
+            continue
+        breaks.append(end)
+    return breaks
+
+
+def split_into_chunks(content: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """按题目边界把文本打包成不超过 max_tokens 的块
+
+    先一次性找出所有题号位置，把文本切成以题目为单位的片段，再贪心地把完整题目装入块中。
+    单道题超出预算时才在句末切开，并把上一段末尾不超过 overlap_tokens 的句子带入下一段，
+    避免一道题被截断后丢失上下文。
+    """
+    if not content:
+        return []
+    if estimate_tokens(content) <= max_tokens:
+        return [content]
+
+    starts = find_question_starts(content)
+    bounds = sorted(set([0] + starts + [len(content)]))
+    units = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+    chunks = []
+    current_start, current_end, current_tokens = None, None, 0
+
+    def flush():
+        if current_start is not None:
+            text = content[current_start:current_end].strip()
+            if text:
+                chunks.append(text)
+
+    for start, end in units:
+        tokens = estimate_tokens(content[start:end])
+        if tokens > max_tokens:
+            flush()
+            current_start, current_end, current_tokens = None, None, 0
+            chunks.extend(_split_oversized_unit(content, start, end, max_tokens, overlap_tokens))
+            continue
+
+        if current_start is not None and current_tokens + tokens > max_tokens:
+            flush()
+            current_start, current_tokens = None, 0
+
+        if current_start is None:
+            current_start = start
+        current_end = end
+        current_tokens += tokens
+
+    flush()
+    return chunks
+
+
+def _split_oversized_unit(content: str, start: int, end: int, max_tokens: int,
+                          overlap_tokens: int) -> List[str]:
+    text = content[start:end]
+    breaks = [b for b in find_sentence_breaks(text) if 0 < b < len(text)]
+    sentences = _spans(breaks, len(text))
+
+    pieces = []
+    piece: List[Tuple[int, int, int]] = []
+    piece_tokens = 0
+    for s_start, s_end in sentences:
+        tokens = estimate_tokens(text[s_start:s_end])
+        if tokens > max_tokens:
+            if piece:
+                pieces.append(piece)
+            pieces.extend([[span] for span in _hard_split(text, s_start, s_end, max_tokens)])
+            piece, piece_tokens = [], 0
+            continue
+
+        if piece and piece_tokens + tokens > max_tokens:
+            pieces.append(piece)
+            # 把上一段末尾的若干句带入新段作为重叠上下文
+            carried, carried_tokens = [], 0
+            for span in reversed(piece):
+                span_tokens = span[2]
+                if carried_tokens + span_tokens > overlap_tokens or \
+                        carried_tokens + span_tokens + tokens > max_tokens:
+                    break
+                carried.insert(0, span)
+                carried_tokens += span_tokens
+            piece, piece_tokens = carried, carried_tokens
+
+        piece.append((s_start, s_end, tokens))
+        piece_tokens += tokens
+
+    if piece:
+        pieces.append(piece)
+
+    result = []
+    for piece in pieces:
+        chunk = text[piece[0][0]:piece[-1][1]].strip()
+        if chunk:
+            result.append(chunk)
+    return result
+
+
+def _spans(breaks: List[int], length: int) -> List[Tuple[int, int]]:
+    points = [0] + breaks + [length]
+    return [(points[i], points[i + 1]) for i in range(len(points) - 1) if points[i] < points[i + 1]]
+
+
+def _hard_split(text: str, start: int, end: int, max_tokens: int) -> List[Tuple[int, int, int]]:
+    # 没有任何句末标点的超长段落，只能按估算的字符数硬切
+    spans = []
+    position = start
+    while position < end:
+        sample = text[position:min(end, position + 500)]
+        tokens_per_char = max(estimate_tokens(sample) / len(sample), 0.01)
+        length = max(1, int(max_tokens / tokens_per_char))
+        spans.append((position, min(end, position + length), max_tokens))
+        position += length
+    return spans
@@ -0,0 +1,167 @@
+import os
+import io
+import json
+import gzip
+import glob
+import re
+from typing import Any, Dict, Iterator, List
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COLLECTION_BASENAME = "questions.jsonl"
+INDEX_FILENAME = "questions_index.json"
+# 压缩格式按块写入，每块是一个独立的gzip成员/zstd帧，随机读取时只需解压一块
+DEFAULT_BLOCK_RECORDS = 256
+
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def resolve_compression(compression: str = None):
+    if compression == "zstd" and zstandard is None:
+        print("未安装zstandard，改用gzip压缩。可运行: pip install zstandard")
+        return "gzip"
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"不支持的压缩格式: {compression}")
+    return compression
+
+
+def write_collection(collection_dir: str, questions: List[Dict[str, Any]], compression: str = None,
+                     block_records: int = DEFAULT_BLOCK_RECORDS) -> str:
+    """把一个题目集合写成单个JSONL文件（可选压缩）并生成偏移索引，返回数据文件路径"""
+    compression = resolve_compression(compression)
+    os.makedirs(collection_dir, exist_ok=True)
+    filename = COLLECTION_BASENAME + COMPRESSION_SUFFIXES[compression]
+    data_path = os.path.join(collection_dir, filename)
+
+    lines = [json.dumps(q, ensure_ascii=False).encode('utf-8') + b"\n" for q in questions]
+
+    index = {"version": 1, "file": filename, "compression": compression, "count": len(lines)}
+    with open(data_path, 'wb') as f:
+        if compression is None:
+            offsets = []
+            position = 0
+            for line in lines:
+                offsets.append(position)
+                position += len(line)
+            f.write(b"".join(lines))
+            index["offsets"] = offsets
+        else:
+            blocks = []
+            for start in range(0, len(lines), block_records):
+                payload = _compress(b"".join(lines[start:start + block_records]), compression)
+                blocks.append([f.tell(), len(payload), start])
+                f.write(payload)
+            index["block_records"] = block_records
+            index["blocks"] = blocks
+
+    index_path = os.path.join(collection_dir, INDEX_FILENAME)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return data_path
+
+
+_index_cache: Dict[str, Any] = {}
+
+
+def load_index(collection_dir: str):
+    """读取偏移索引，按文件mtime缓存，避免随机读取时反复解析"""
+    index_path = os.path.join(collection_dir, INDEX_FILENAME)
+    try:
+        mtime_ns = os.stat(index_path).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _index_cache.get(index_path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    _index_cache[index_path] = (mtime_ns, index)
+    return index
+
+
+_LEGACY_NUMBER_RE = re.compile(r'Q(\d+)')
+
+
+def _legacy_sort_key(path: str):
+    # 按Q后面的数字排序，Q1000.json 排在 Q101.json 之后
+    name = os.path.basename(path)
+    return int(_LEGACY_NUMBER_RE.match(name).group(1)), name
+
+
+def _legacy_question_files(collection_dir: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(collection_dir, "Q[0-9]*.json")), key=_legacy_sort_key)
+
+
+def iter_questions(collection_dir: str) -> Iterator[Dict[str, Any]]:
+    """流式读取集合中的题目，同时支持JSONL格式和旧的每题一个文件的格式"""
+    index = load_index(collection_dir)
+    if index is None:
+        for path in _legacy_question_files(collection_dir):
+            with open(path, 'r', encoding='utf-8') as f:
+                yield json.load(f)
+        return
+
+    data_path = os.path.join(collection_dir, index["file"])
+    compression = index.get("compression")
+    with open(data_path, 'rb') as f:
+        if compression is None:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        for offset, length, _ in index["blocks"]:
+            f.seek(offset)
+            for line in io.BytesIO(_decompress(f.read(length), compression)):
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_question(collection_dir: str, position: int) -> Dict[str, Any]:
+    """按序号随机读取单道题目，只读取/解压所需的那一行或那一块"""
+    index = load_index(collection_dir)
+    if index is None:
+        with open(_legacy_question_files(collection_dir)[position], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    if not 0 <= position < index["count"]:
+        raise IndexError(f"题目序号超出范围: {position}")
+
+    data_path = os.path.join(collection_dir, index["file"])
+    compression = index.get("compression")
+    with open(data_path, 'rb') as f:
+        if compression is None:
+            f.seek(index["offsets"][position])
+            return json.loads(f.readline())
+
+        block_number = position // index["block_records"]
+        offset, length, first = index["blocks"][block_number]
+        f.seek(offset)
+        lines = _decompress(f.read(length), compression).split(b"\n")
+        return json.loads(lines[position - first])
+
+
+def count_questions(collection_dir: str) -> int:
+    index = load_index(collection_dir)
+    if index is not None:
+        return index["count"]
+    return len(_legacy_question_files(collection_dir))
@@ -1,10 +1,12 @@
 from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
+from kivy.app import App
 from kivy.clock import Clock
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.properties import StringProperty, NumericProperty, ObjectProperty, BooleanProperty, ListProperty
+from text_cache import CachedTextLabel
 
 
 class CategoryCard(BoxLayout):
@@ -187,8 +189,8 @@ class PathBreadcrumb(BoxLayout):
             self.navigate_callback(item_id)
 
 
-class AutoHeightLabel(Label):
-    """自适应高度的标签"""
+class AutoHeightLabel(CachedTextLabel):
+    """自适应高度的标签，相同内容与宽度复用缓存的纹理"""
 
     def __init__(self, **kwargs):
         super(AutoHeightLabel, self).__init__(**kwargs)
@@ -398,11 +400,25 @@ class TaskDetailPopup(Popup):
         save_btn = Button(text='保存')
         save_btn.bind(on_press=self.save_task)
         button_layout.add_widget(cancel_btn)
+        if self.task_id:
+            focus_btn = Button(text='专注')
+            focus_btn.bind(on_press=self.start_focus)
+            button_layout.add_widget(focus_btn)
         button_layout.add_widget(save_btn)
         layout.add_widget(button_layout)
 
         self.content = layout
 
+    def start_focus(self, instance):
+        """为该任务开始一次专注，专注记录关联到任务"""
+        self.dismiss()
+        app = App.get_running_app()
+        if not app or not app.root:
+            return
+        app.root.current = 'focus'
+        focus_screen = app.root.get_screen('focus')
+        focus_screen.start_focus_mode(task_id=self.task_id, task_text=self.name_input.text.strip())
+
     def save_task(self, instance):
         name = self.name_input.text.strip()
         description = self.desc_input.text.strip()
@@ -9,4 +9,21 @@ SUPPORTED_IMAGE_FORMATS = ['.png', '.jpg', '.jpeg', '.bmp', '.gif']
 MAX_IMAGE_SIZE = (1024, 1024)  # 最大图片尺寸
 
 SUPPORTED_IMAGE_FORMATS = ['.png', '.jpg', '.jpeg', '.bmp', '.gif']
-MAX_IMAGE_SIZE_MB = 5  # 最大图片大小5MB
\ No newline at end of file
+MAX_IMAGE_SIZE_MB = 5  # 最大图片大小5MB
+
+# OCR配置
+OCR_WORKERS = None  # OCR进程数，None表示使用全部CPU核心
+OCR_CACHE_DIR = "ocr_cache"  # OCR结果缓存目录
+FILE_HASH_CACHE = "file_hash_cache.json"  # 文件摘要缓存，按路径/大小/修改时间/inode判断文件是否变化
+
+# 题目集合存储格式: "jsonl" 单文件, "jsonl.gz"/"jsonl.zst" 分块压缩, "files" 每题一个JSON文件（旧格式）
+COLLECTION_FORMAT = "jsonl"
+
+# 学习记录：原始事件保留的月数，更早的事件在启动时删除（按天/分类的汇总保留）
+EVENT_RETENTION_MONTHS = 6
+
+# 文字纹理缓存上限（MB），按纹理占用的显存淘汰最久未用的
+TEXT_CACHE_MB = 64
+
+# 启动时使用 font_manager.py subset 生成的子集字体；子集不含之后新导入题目中的字，导入后需重新生成
+USE_FONT_SUBSET = False
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import re
+import hashlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+
+from lazy_loader import lazy_import
+
+np = lazy_import('numpy')
+
+# 64个哈希函数，分成16段、每段4行做LSH：
+# Jaccard相似度0.8的两题至少落入同一桶的概率约99.9%，0.3的约12%
+NUM_PERM = 64
+BAND_COUNT = 16
+ROWS_PER_BAND = NUM_PERM // BAND_COUNT
+DEFAULT_THRESHOLD = 0.7
+SHINGLE_SIZE = 2
+# 全库查重时跳过成员过多的桶（多为极短或模板化的题目），避免桶内两两比较的平方级耗时
+MAX_BUCKET_SIZE = 200
+# IN (...) 每次最多带的参数个数，低于SQLite的变量数上限
+LOOKUP_CHUNK = 500
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_NORMALIZE_RE = re.compile(r'[^\w\u4e00-\u9fff]')
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+@lru_cache(maxsize=1)
+def _permutations():
+    # 参数固定，保证已存入数据库的签名在不同进程间可比；首次计算签名时才生成，避免启动时导入numpy
+    rng = np.random.RandomState(20240601)
+    perm_a = rng.randint(1, _MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+    perm_b = rng.randint(0, _MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+    return perm_a, perm_b
+
+
+def normalize_question_text(text: str) -> str:
+    return _NORMALIZE_RE.sub('', str(text or '').lower())
+
+
+def shingles(text: str) -> Set[str]:
+    """归一化后的字符2-gram集合"""
+    text = normalize_question_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """计算MinHash签名，空文本返回None"""
+    grams = shingles(text)
+    if not grams:
+        return None
+    digests = b"".join(hashlib.blake2b(g.encode('utf-8'), digest_size=4).digest() for g in grams)
+    base = np.frombuffer(digests, dtype='<u4').astype(np.uint64) % _MERSENNE_PRIME
+    perm_a, perm_b = _permutations()
+    # (a*x + b) mod p，x与a均小于2^31，乘积不会溢出uint64
+    hashed = (np.outer(base, perm_a) + perm_b) % _MERSENNE_PRIME
+    return hashed.min(axis=0).astype(np.uint32)
+
+
+def numbers_in(text: str) -> Tuple[str, ...]:
+    """题目中出现的数字；只有数字不同的两道题（如换了系数的计算题）不算重复"""
+    return tuple(_NUMBER_RE.findall(str(text or '')))
+
+
+def estimate_similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    """每段签名压缩成一个有符号64位整数作为桶键"""
+    keys = []
+    for band in range(BAND_COUNT):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(rows.astype('<u4').tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def _to_blob(signature: np.ndarray) -> bytes:
+    return signature.astype('<u4').tobytes()
+
+
+def _from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype='<u4')
+
+
+def filter_near_duplicates(texts: Iterable[str], threshold: float = DEFAULT_THRESHOLD) -> List[int]:
+    """在一批文本内部去掉近似重复项，返回保留项的下标"""
+    buckets: List[Dict[int, List[int]]] = [{} for _ in range(BAND_COUNT)]
+    kept_signatures: List[np.ndarray] = []
+    kept_numbers: List[Tuple[str, ...]] = []
+    kept = []
+    for index, text in enumerate(texts):
+        signature = minhash_signature(text)
+        if signature is None:
+            kept.append(index)
+            continue
+        keys = band_keys(signature)
+        numbers = numbers_in(text)
+
+        candidates = set()
+        for key, bucket in zip(keys, buckets):
+            candidates.update(bucket.get(key, ()))
+        if any(kept_numbers[c] == numbers and estimate_similarity(signature, kept_signatures[c]) >= threshold
+               for c in candidates):
+            continue
+
+        slot = len(kept_signatures)
+        kept_signatures.append(signature)
+        kept_numbers.append(numbers)
+        for key, bucket in zip(keys, buckets):
+            bucket.setdefault(key, []).append(slot)
+        kept.append(index)
+    return kept
+
+
+# 主键就是查询用的 (段号, 桶键)，行按桶键聚集存放，不需要另建索引；
+# 删除时由保存的签名重新算出桶键按主键删除，也不需要按题目ID的索引
+_LSH_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        PRIMARY KEY (band, bucket, question_id)
+    ) WITHOUT ROWID
+'''
+
+
+class NearDuplicateIndex:
+    """题库近似重复索引（MinHash LSH）
+
+    question_minhash 保存每道题的签名，question_lsh 保存 (段号, 桶键) -> 题目ID 的倒排，
+    查询时只按16个桶键走主键取候选，再用签名估算相似度，不需要扫描全表。
+    """
+
+    def __init__(self, conn, threshold: float = DEFAULT_THRESHOLD):
+        self.conn = conn
+        self.threshold = threshold
+        self.init_tables()
+
+    def init_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS question_minhash (
+                question_id INTEGER PRIMARY KEY,
+                signature BLOB,
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )
+        ''')
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'question_lsh'").fetchone()
+        if row and 'WITHOUT ROWID' not in row[0].upper():
+            self.migrate_lsh_table()
+        cursor.execute(_LSH_TABLE_SQL.format(name='question_lsh'))
+        self.conn.commit()
+
+    def migrate_lsh_table(self):
+        """旧版 question_lsh 是普通表加两个索引，改为按 (段号, 桶键, 题目ID) 聚集存储的 WITHOUT ROWID 表"""
+        print("近似重复索引升级中...")
+        self.conn.execute("DROP INDEX IF EXISTS idx_question_lsh_bucket")
+        self.conn.execute("DROP INDEX IF EXISTS idx_question_lsh_question")
+        self.conn.execute(_LSH_TABLE_SQL.format(name='question_lsh_new'))
+        self.conn.execute('''
+            INSERT OR IGNORE INTO question_lsh_new (band, bucket, question_id)
+            SELECT band, bucket, question_id FROM question_lsh ORDER BY band, bucket, question_id
+        ''')
+        self.conn.execute("DROP TABLE question_lsh")
+        self.conn.execute("ALTER TABLE question_lsh_new RENAME TO question_lsh")
+        self.conn.commit()
+
+    def add(self, question_id: int, text: str, commit: bool = True):
+        self.add_many([(question_id, text)], commit=commit)
+
+    def add_many(self, items: Iterable[Tuple[int, str]], commit: bool = True):
+        signature_rows = []
+        bucket_rows = []
+        for question_id, text in items:
+            signature = minhash_signature(text)
+            # 空题目也记一行，避免补建时反复处理
+            signature_rows.append((question_id, _to_blob(signature) if signature is not None else None))
+            if signature is not None:
+                bucket_rows.extend((band, key, question_id) for band, key in enumerate(band_keys(signature)))
+
+        self.remove_buckets([row[0] for row in signature_rows])
+        self.conn.executemany("INSERT OR REPLACE INTO question_minhash VALUES (?, ?)", signature_rows)
+        self.conn.executemany("INSERT OR IGNORE INTO question_lsh VALUES (?, ?, ?)", bucket_rows)
+        if commit:
+            self.conn.commit()
+
+    def remove_buckets(self, question_ids: List[int]):
+        """按已保存的签名重新算出这些题目的桶键，按主键删除对应的倒排行"""
+        rows = []
+        for start in range(0, len(question_ids), LOOKUP_CHUNK):
+            chunk = question_ids[start:start + LOOKUP_CHUNK]
+            placeholders = ','.join(['?'] * len(chunk))
+            for question_id, blob in self.conn.execute(f'''
+                    SELECT question_id, signature FROM question_minhash
+                    WHERE question_id IN ({placeholders}) AND signature IS NOT NULL
+                    ''', chunk):
+                rows.extend((band, key, question_id) for band, key in enumerate(band_keys(_from_blob(blob))))
+        self.conn.executemany("DELETE FROM question_lsh WHERE band = ? AND bucket = ? AND question_id = ?", rows)
+
+    def remove_many(self, question_ids: List[int], commit: bool = True):
+        question_ids = list(question_ids)
+        self.remove_buckets(question_ids)
+        self.conn.executemany("DELETE FROM question_minhash WHERE question_id = ?", [(qid,) for qid in question_ids])
+        if commit:
+            self.conn.commit()
+
+    def find(self, text: str, exclude_id: int = None) -> List[Tuple[int, float]]:
+        """返回 (题目ID, 估算相似度) 列表，按相似度降序"""
+        signature = minhash_signature(text)
+        if signature is None:
+            return []
+
+        where = " OR ".join(["(l.band = ? AND l.bucket = ?)"] * BAND_COUNT)
+        params = [value for pair in enumerate(band_keys(signature)) for value in pair]
+        cursor = self.conn.execute(f'''
+            SELECT m.question_id, m.signature, q.question
+            FROM question_minhash m
+            JOIN questions q ON q.id = m.question_id
+            WHERE m.question_id IN (SELECT l.question_id FROM question_lsh l WHERE {where})
+        ''', params)
+
+        numbers = numbers_in(text)
+        matches = []
+        for question_id, blob, candidate_text in cursor.fetchall():
+            if question_id == exclude_id or blob is None or numbers_in(candidate_text) != numbers:
+                continue
+            similarity = estimate_similarity(signature, _from_blob(blob))
+            if similarity >= self.threshold:
+                matches.append((question_id, similarity))
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        return matches
+
+    def find_all_duplicates(self) -> List[List[int]]:
+        """全库扫描近似重复，返回题目ID分组（每组按ID升序）；成员超过 MAX_BUCKET_SIZE 的桶不参与比较"""
+        parent: Dict[int, int] = {}
+
+        def root(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        cursor = self.conn.execute('''
+            SELECT GROUP_CONCAT(question_id)
+            FROM question_lsh
+            GROUP BY band, bucket
+            HAVING COUNT(*) > 1 AND COUNT(*) <= ?
+        ''', (MAX_BUCKET_SIZE,))
+        signatures: Dict[int, np.ndarray] = {}
+        numbers: Dict[int, Tuple[str, ...]] = {}
+        checked = set()
+        for (members,) in cursor:
+            ids = sorted(int(qid) for qid in members.split(','))
+            missing = [qid for qid in ids if qid not in signatures]
+            for start in range(0, len(missing), LOOKUP_CHUNK):
+                chunk = missing[start:start + LOOKUP_CHUNK]
+                placeholders = ','.join(['?'] * len(chunk))
+                for question_id, blob, text in self.conn.execute(f'''
+                        SELECT m.question_id, m.signature, q.question
+                        FROM question_minhash m
+                        JOIN questions q ON q.id = m.question_id
+                        WHERE m.question_id IN ({placeholders})
+                        ''', chunk):
+                    signatures[question_id] = _from_blob(blob)
+                    numbers[question_id] = numbers_in(text)
+
+            for i, id_a in enumerate(ids):
+                for id_b in ids[i + 1:]:
+                    if (id_a, id_b) in checked or id_a not in signatures or id_b not in signatures:
+                        continue
+                    checked.add((id_a, id_b))
+                    if numbers[id_a] == numbers[id_b] and \
+                            estimate_similarity(signatures[id_a], signatures[id_b]) >= self.threshold:
+                        ra, rb = root(id_a), root(id_b)
+                        if ra != rb:
+                            parent[max(ra, rb)] = min(ra, rb)
+
+        groups: Dict[int, List[int]] = {}
+        for question_id in list(parent):
+            groups.setdefault(root(question_id), []).append(question_id)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda g: g[0])
+
+    def backfill(self, batch_size: int = 1000) -> int:
+        """为尚未建索引的已有题目补建签名，返回补建数量
+
+        需要扫描全部题目，只在旧数据库升级时调用一次；之后增删题目时索引随之更新。
+        """
+        total = 0
+        while True:
+            rows = self.conn.execute('''
+                SELECT q.id, q.question FROM questions q
+                LEFT JOIN question_minhash m ON m.question_id = q.id
+                WHERE m.question_id IS NULL
+                LIMIT ?
+            ''', (batch_size,)).fetchall()
+            if not rows:
+                break
+            self.add_many(rows, commit=False)
+            total += len(rows)
+        self.conn.commit()
+        return total
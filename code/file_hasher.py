@@ -0,0 +1,141 @@
+import os
+import json
+import atexit
+import hashlib
+from threading import Lock, get_ident
+from typing import Dict, Any
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path: str, block_size: int = HASH_BLOCK_SIZE) -> str:
+    """分块流式计算文件的blake2b摘要，内存占用与文件大小无关"""
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+class FileDigestCache:
+    """文件摘要缓存
+
+    以 (路径, 大小, mtime_ns, inode) 作为文件未变化的判据，命中时直接返回上次的摘要，
+    不再读取文件内容。缓存持久化为JSON，重启后依然有效。
+    新算出的摘要只标记为待保存，由 flush 一次写入（一批文件算完后调用，退出时也会自动调用），
+    也可以用 with 语句包住一批计算。写入时先合并文件中已有的条目，其他进程算出的摘要不会被覆盖。
+    同一进程内请用 get_digest_cache 取得按路径共享的实例。
+    """
+
+    def __init__(self, cache_path: str = None):
+        self.cache_path = cache_path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        # prune 删除的路径，合并磁盘上的条目时不能再加回来
+        self.removed = set()
+        self.load()
+        if cache_path:
+            atexit.register(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def read_entries(self) -> Dict[str, Dict[str, Any]]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取文件摘要缓存失败，将重新计算: {e}")
+            return {}
+
+    def load(self):
+        self.entries = self.read_entries()
+
+    def save(self):
+        if not self.cache_path:
+            return
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.{get_ident()}.tmp"
+            on_disk = self.read_entries()
+            with self.lock:
+                for path in self.removed:
+                    on_disk.pop(path, None)
+                on_disk.update(self.entries)
+                self.entries = data = on_disk
+                self.removed = set()
+                self.dirty = False
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.cache_path)
+        except Exception as e:
+            self.dirty = True
+            print(f"保存文件摘要缓存失败: {e}")
+
+    def flush(self):
+        """有新摘要时才写回文件"""
+        if self.dirty:
+            self.save()
+
+    def digest(self, file_path: str) -> str:
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns \
+                and entry['inode'] == st.st_ino:
+            self.hits += 1
+            return entry['digest']
+
+        self.misses += 1
+        value = hash_file(path)
+        with self.lock:
+            self.entries[path] = {
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'inode': st.st_ino,
+                'digest': value,
+            }
+            self.dirty = True
+        return value
+
+    def prune(self):
+        """删除已不存在的文件对应的缓存项"""
+        with self.lock:
+            stale = [path for path in self.entries if not os.path.exists(path)]
+            for path in stale:
+                del self.entries[path]
+            self.removed.update(stale)
+            if stale:
+                self.dirty = True
+        self.flush()
+        return len(stale)
+
+
+_shared_caches: Dict[str, FileDigestCache] = {}
+_shared_lock = Lock()
+
+
+def get_digest_cache(cache_path: str) -> FileDigestCache:
+    """同一缓存文件在进程内只对应一个实例，多个 AIAssistant 共用，不会互相覆盖"""
+    key = os.path.abspath(cache_path)
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = _shared_caches[key] = FileDigestCache(cache_path)
+        return cache
@@ -0,0 +1,175 @@
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from profiler import traced
+
+_BUCKET_COLUMNS = ('sessions', 'completed', 'interrupted', 'planned_seconds', 'actual_seconds')
+
+
+def _day_key(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def _empty_totals() -> Dict[str, float]:
+    return dict.fromkeys(_BUCKET_COLUMNS, 0)
+
+
+class FocusHistory:
+    """专注记录
+
+    focus_sessions 每次专注一行（开始时间、计划时长、实际时长、是否中断、关联的待办任务）。
+    focus_day_buckets（按天）与 focus_task_buckets（按任务+天）在保存专注记录的同一事务中累加，
+    按天/周/任务的统计只读这两张表，不扫描全部专注记录。
+    """
+
+    def __init__(self, db_path: str = 'learning_space.db', conn=None):
+        self.conn = conn or sqlite3.connect(db_path, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS focus_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                planned_seconds REAL NOT NULL,
+                actual_seconds REAL NOT NULL,
+                interrupted BOOLEAN NOT NULL DEFAULT 0,
+                task_id INTEGER,
+                day TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS focus_day_buckets (
+                day TEXT PRIMARY KEY,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                interrupted INTEGER NOT NULL DEFAULT 0,
+                planned_seconds REAL NOT NULL DEFAULT 0,
+                actual_seconds REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS focus_task_buckets (
+                task_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                sessions INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                interrupted INTEGER NOT NULL DEFAULT 0,
+                planned_seconds REAL NOT NULL DEFAULT 0,
+                actual_seconds REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (task_id, day)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_focus_sessions_started ON focus_sessions (started_at)")
+        self.conn.commit()
+
+    @traced('db')
+    def record_session(self, started_at: float, planned_seconds: float, actual_seconds: float,
+                       interrupted: bool, task_id: Optional[int] = None) -> Optional[int]:
+        """保存一次专注并累加到按天、按任务的统计，返回记录ID"""
+        # 跨零点的专注计入开始那一天
+        day = _day_key(started_at)
+        values = (1, 0 if interrupted else 1, 1 if interrupted else 0, planned_seconds, actual_seconds)
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _BUCKET_COLUMNS)
+        placeholders = ", ".join("?" * len(_BUCKET_COLUMNS))
+        try:
+            cursor = self.conn.execute('''
+                INSERT INTO focus_sessions (started_at, planned_seconds, actual_seconds, interrupted, task_id, day)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (started_at, planned_seconds, actual_seconds, interrupted, task_id, day))
+            session_id = cursor.lastrowid
+            self.conn.execute(f'''
+                INSERT INTO focus_day_buckets (day, {", ".join(_BUCKET_COLUMNS)}) VALUES (?, {placeholders})
+                ON CONFLICT(day) DO UPDATE SET {updates}
+            ''', (day, *values))
+            if task_id is not None:
+                self.conn.execute(f'''
+                    INSERT INTO focus_task_buckets (task_id, day, {", ".join(_BUCKET_COLUMNS)})
+                    VALUES (?, ?, {placeholders})
+                    ON CONFLICT(task_id, day) DO UPDATE SET {updates}
+                ''', (task_id, day, *values))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"保存专注记录失败: {e}")
+            return None
+        return session_id
+
+    def totals_by_day(self, days: int = 7, today: date = None) -> List[Dict]:
+        """最近 days 天每天的专注统计，没有专注的日期补0，按日期升序"""
+        today = today or date.today()
+        first = today - timedelta(days=days - 1)
+        rows = self.conn.execute(f'''
+            SELECT day, {", ".join(_BUCKET_COLUMNS)} FROM focus_day_buckets
+            WHERE day >= ? AND day <= ?
+        ''', (first.isoformat(), today.isoformat())).fetchall()
+        stored = {row[0]: dict(zip(_BUCKET_COLUMNS, row[1:])) for row in rows}
+
+        result = []
+        for offset in range(days):
+            day = (first + timedelta(days=offset)).isoformat()
+            result.append({'day': day, **(stored.get(day) or _empty_totals())})
+        return result
+
+    def totals_by_week(self, weeks: int = 4, today: date = None) -> List[Dict]:
+        """最近 weeks 周（周一开始）的专注统计，按周升序"""
+        today = today or date.today()
+        this_monday = today - timedelta(days=today.weekday())
+        first = this_monday - timedelta(weeks=weeks - 1)
+        result = []
+        for offset in range(weeks):
+            week_start = first + timedelta(weeks=offset)
+            result.append({'week_start': week_start.isoformat(), **_empty_totals()})
+
+        rows = self.conn.execute(f'''
+            SELECT day, {", ".join(_BUCKET_COLUMNS)} FROM focus_day_buckets
+            WHERE day >= ? AND day <= ?
+        ''', (first.isoformat(), today.isoformat()))
+        for row in rows:
+            index = (datetime.strptime(row[0], '%Y-%m-%d').date() - first).days // 7
+            for column, value in zip(_BUCKET_COLUMNS, row[1:]):
+                result[index][column] += value
+        return result
+
+    def totals_by_task(self, days: int = None, today: date = None) -> List[Dict]:
+        """各待办任务累计的专注统计，days 为空时统计全部，按实际专注时长降序"""
+        condition, params = "", ()
+        if days:
+            today = today or date.today()
+            condition, params = "WHERE b.day >= ?", ((today - timedelta(days=days - 1)).isoformat(),)
+        sums = ", ".join(f"SUM(b.{c})" for c in _BUCKET_COLUMNS)
+        # 任务可能已被删除，名称为空；tasks 表由 TodoManager 创建，可能还不存在
+        has_tasks = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'").fetchone()
+        task_text = "t.text" if has_tasks else "NULL"
+        task_join = "LEFT JOIN tasks t ON t.id = b.task_id" if has_tasks else ""
+        rows = self.conn.execute(f'''
+            SELECT b.task_id, {task_text}, {sums}
+            FROM focus_task_buckets b
+            {task_join}
+            {condition}
+            GROUP BY b.task_id
+            ORDER BY SUM(b.actual_seconds) DESC
+        ''', params).fetchall()
+        return [{'task_id': row[0], 'task_text': row[1] or '', **dict(zip(_BUCKET_COLUMNS, row[2:]))}
+                for row in rows]
+
+    def recent_sessions(self, limit: int = 20) -> List[Dict]:
+        rows = self.conn.execute('''
+            SELECT id, started_at, planned_seconds, actual_seconds, interrupted, task_id
+            FROM focus_sessions ORDER BY started_at DESC LIMIT ?
+        ''', (limit,)).fetchall()
+        return [{
+            'id': row[0],
+            'started_at': row[1],
+            'planned_seconds': row[2],
+            'actual_seconds': row[3],
+            'interrupted': bool(row[4]),
+            'task_id': row[5],
+        } for row in rows]
+
+    def close(self):
+        self.conn.close()
@@ -4,11 +4,14 @@ import time
 class FocusMode:
     """专注模式管理器 - 用于管理专注计时、时长设置及剩余时间计算"""
 
-    def __init__(self):
+    def __init__(self, history=None):
         self.is_active = False  # 专注模式是否激活
-        self.start_time = None  # 专注开始时间戳
+        self.start_time = None  # 专注开始时间戳（墙上时间，用于保存记录）
+        self.start_monotonic = None  # 专注开始时的单调时钟读数，计时不受系统时间调整影响
         self.duration = 25 * 60  # 默认专注时长（秒），25分钟
+        self.task_id = None  # 本次专注关联的待办任务
         self.default_durations = [5, 15, 25, 45, 60]  # 默认可选时长（分钟）
+        self.history = history  # FocusHistory，结束时保存专注记录
 
     def set_duration(self, minutes):
         """设置专注时长（仅在未激活状态下生效）
@@ -32,21 +35,44 @@ class FocusMode:
         """
         return self.default_durations
 
-    def start(self, duration_minutes):
+    def start(self, duration_minutes, task_id=None):
         """启动专注模式，设置并开始计时
 
         Args:
             duration_minutes (int): 本次专注时长（分钟）
+            task_id (int): 关联的待办任务ID，可为空
         """
         self.is_active = True
         self.start_time = time.time()
+        self.start_monotonic = time.monotonic()
         self.duration = duration_minutes * 60
+        self.task_id = task_id
 
-    def stop(self):
-        """停止专注模式，重置计时状态"""
+    def stop(self, completed=False):
+        """停止专注模式，保存专注记录并重置计时状态
+
+        Args:
+            completed (bool): 是否计时结束正常完成，False表示中途退出
+        """
+        if self.is_active and self.history is not None:
+            self.history.record_session(self.start_time, self.duration, self.get_elapsed_time(),
+                                        interrupted=not completed, task_id=self.task_id)
         self.is_active = False
         self.start_time = None
+        self.start_monotonic = None
         self.duration = 0
+        self.task_id = None
+
+    def get_elapsed_time(self):
+        """获取本次专注已进行的时间（秒）
+
+        Returns:
+            float: 已进行秒数（不超过设定时长），未激活时返回0
+        """
+        if not self.is_active or self.start_monotonic is None:
+            return 0
+
+        return min(self.duration, time.monotonic() - self.start_monotonic)
 
     def get_remaining_time(self):
         """获取当前专注模式的剩余时间（秒）
@@ -54,9 +80,9 @@ class FocusMode:
         Returns:
             float: 剩余秒数（最小为0），未激活时返回0
         """
-        if not self.is_active or self.start_time is None:
+        if not self.is_active or self.start_monotonic is None:
             return 0
 
-        elapsed = time.time() - self.start_time
+        elapsed = time.monotonic() - self.start_monotonic
         remaining = self.duration - elapsed
-        return max(0, remaining)
\ No newline at end of file
+        return max(0, remaining)
@@ -0,0 +1,200 @@
+"""字体管理：启动时只注册默认中文字体（界面与 learning_space.kv 只用到这一种），并可生成子集字体
+
+用法（生成子集字体）:
+    python font_manager.py subset [--db learning_space.db] [--font 楷体 ...]
+
+子集字体只保留题库中实际出现的字符、GB2312一级汉字与ASCII/常用标点，
+体积约为原文件的一半以下，加载更快。子集不含生成之后新导入题目里的生僻字（会显示成方框），
+所以默认不使用：在 config.py 中设置 USE_FONT_SUBSET = True 后才优先加载子集文件，
+并且导入新题目后要重新运行一次。
+"""
+import os
+import sys
+import sqlite3
+import argparse
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+try:
+    from config import USE_FONT_SUBSET
+except ImportError:
+    USE_FONT_SUBSET = False
+
+FONT_DIR = str(Path(__file__).parent.parent / 'fonts')
+FONT_SUBSET_DIR = os.path.join(FONT_DIR, 'subset')
+
+# 字体名 -> (常规, 粗体, 斜体, 粗斜体) 文件名，只有常规是必需的；用于挑选默认字体与生成子集
+FONT_FAMILIES: Dict[str, tuple] = {
+    '黑体': ('simhei.ttf',),
+    '微软雅黑': ('msyh.ttf', 'msyhbd.ttf'),
+    '宋体': ('simsun.ttc',),
+    '楷体': ('楷体_GB2312.ttf',),
+    '仿宋': ('仿宋_GB2312.ttf',),
+    'TimesNewRoman': ('times.ttf', 'timesbd.ttf', 'timesi.ttf', 'timesbi.ttf'),
+    'Calibri': ('calibri.ttf', 'calibrib.ttf', 'calibrii.ttf', 'calibriz.ttf'),
+    'DejaVuSansMono': ('DejaVuSansMono.ttf', 'DejaVuSansMono-Bold.ttf',
+                       'DejaVuSansMono-Oblique.ttf', 'DejaVuSansMono-BoldOblique.ttf'),
+    'Monaco': ('Monaco.ttf',),
+    'JamesFajardo': ('James_Fajardo.ttf',),
+    'ComesInHandy': ('comesinhandy.ttf',),
+}
+# 界面与 learning_space.kv 中使用的默认字体名
+DEFAULT_FONT_NAME = 'SimHei'
+# 默认字体按顺序取第一个存在的文件，必须包含中文字形
+DEFAULT_FONT_CANDIDATES = ('黑体', '微软雅黑', '宋体', '楷体', '仿宋')
+
+
+def family_files(name: str, font_dir: str = FONT_DIR, use_subset: bool = None) -> Optional[list]:
+    """返回字体各字重的文件路径，常规字重不存在时返回None；启用子集（USE_FONT_SUBSET）且有子集文件时优先使用"""
+    if use_subset is None:
+        use_subset = USE_FONT_SUBSET
+    files = FONT_FAMILIES.get(name)
+    if not files:
+        return None
+    paths = []
+    for filename in files:
+        subset_path = os.path.join(FONT_SUBSET_DIR, subset_filename(filename))
+        path = os.path.join(font_dir, filename)
+        if use_subset and os.path.exists(subset_path):
+            paths.append(subset_path)
+        elif os.path.exists(path):
+            paths.append(path)
+        else:
+            paths.append(None)
+    return paths if paths[0] else None
+
+
+def _register(name: str, paths: list):
+    from kivy.core.text import LabelBase
+
+    regular = paths[0]
+    LabelBase.register(name=name, fn_regular=regular,
+                       fn_bold=paths[1] if len(paths) > 1 else None,
+                       fn_italic=paths[2] if len(paths) > 2 else None,
+                       fn_bolditalic=paths[3] if len(paths) > 3 else None)
+
+
+def setup_default_font(font_dir: str = FONT_DIR) -> Optional[str]:
+    """启动时调用：只注册默认中文字体，并设为Kivy默认字体，返回所用的字体文件"""
+    from kivy.config import Config
+
+    for family in DEFAULT_FONT_CANDIDATES:
+        paths = family_files(family, font_dir)
+        if paths:
+            break
+    else:
+        print(f"未在 {font_dir} 中找到中文字体，界面中文可能无法显示")
+        return None
+
+    Config.set('kivy', 'default_font', [DEFAULT_FONT_NAME, paths[0]])
+    Config.set('graphics', 'default_font', [DEFAULT_FONT_NAME, paths[0]])
+    try:
+        # 覆盖Kivy内置的Roboto，未指定font_name的控件也能显示中文
+        _register('Roboto', paths)
+        _register(DEFAULT_FONT_NAME, paths)
+        _register(family, paths)
+    except Exception as e:
+        print(f"字体注册失败: {e}")
+    return paths[0]
+
+
+def subset_filename(filename: str) -> str:
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}.subset.ttf"
+
+
+def gb2312_level1_characters() -> str:
+    """GB2312一级汉字（3755个常用字），按区位码生成"""
+    chars = []
+    for high in range(0xB0, 0xD8):
+        for low in range(0xA1, 0xFF):
+            try:
+                chars.append(bytes([high, low]).decode('gb2312'))
+            except UnicodeDecodeError:
+                continue
+    return "".join(chars)
+
+
+BASE_CHARACTERS = "".join(chr(c) for c in range(0x20, 0x7F)) + "，。、；：？！“”‘’（）【】《》—…·￥％＋－×÷＝＜＞"
+
+
+def collect_bank_characters(db_path: str) -> Set[str]:
+    """题库中题目、答案与分类名出现过的所有字符"""
+    characters: Set[str] = set()
+    if not os.path.exists(db_path):
+        return characters
+    conn = sqlite3.connect(db_path)
+    try:
+        for query in ("SELECT question, answer FROM questions", "SELECT name, '' FROM categories"):
+            for row in conn.execute(query):
+                for text in row:
+                    if text:
+                        characters.update(text)
+    except sqlite3.Error as e:
+        print(f"读取题库字符失败: {e}")
+    finally:
+        conn.close()
+    return characters
+
+
+def build_subset(source_path: str, characters: Iterable[str], output_path: str) -> int:
+    """用fontTools生成只含指定字符的字体文件，返回输出文件大小（字节）"""
+    from fontTools import subset
+
+    options = subset.Options()
+    options.layout_features = ['*']
+    options.name_IDs = ['*']
+    options.notdef_outline = True
+    font_file = subset.load_font(source_path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text="".join(sorted(set(characters))))
+    subsetter.subset(font_file)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    subset.save_font(font_file, temp_path, options)
+    os.replace(temp_path, output_path)
+    return os.path.getsize(output_path)
+
+
+def build_subsets(db_path: str, families: Iterable[str] = None, font_dir: str = FONT_DIR):
+    characters = collect_bank_characters(db_path)
+    print(f"题库中共出现 {len(characters)} 个不同字符")
+    characters.update(gb2312_level1_characters())
+    characters.update(BASE_CHARACTERS)
+
+    for family in families or FONT_FAMILIES:
+        paths = family_files(family, font_dir, use_subset=False)
+        if not paths:
+            continue
+        for path in paths:
+            if not path or path.lower().endswith('.ttc'):
+                continue
+            output_path = os.path.join(FONT_SUBSET_DIR, subset_filename(os.path.basename(path)))
+            try:
+                size = build_subset(path, characters, output_path)
+            except ImportError:
+                print("生成子集字体需要fontTools: pip install fonttools")
+                return
+            except Exception as e:
+                print(f"生成子集失败: {path} ({e})")
+                continue
+            original = os.path.getsize(path)
+            print(f"{os.path.basename(path)}: {original / 1024:.0f}KB -> {size / 1024:.0f}KB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="字体管理")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subset_parser = subparsers.add_parser('subset', help='按题库用字生成子集字体')
+    subset_parser.add_argument('--db', default='learning_space.db', help='数据库文件路径')
+    subset_parser.add_argument('--font', action='append', choices=sorted(FONT_FAMILIES), help='只处理指定字体，可重复')
+    args = parser.parse_args(argv)
+
+    if args.command == 'subset':
+        build_subsets(args.db, args.font)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
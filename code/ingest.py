@@ -0,0 +1,205 @@
+"""批量导入题目（无界面）
+
+用法:
+    python ingest.py <目录> --category 数学/函数 [--workers 2] [--no-recursive] [--force]
+    python -m ingest <目录> ...
+
+遍历目录，把PDF、图片、文本文件按类型排队，有限并发地交给AIAssistant提取题目，
+结果批量写入QuestionBankV2的指定分类。已导入过的文件按内容摘要跳过。
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ai_assistant import AIAssistant
+from question_bank import QuestionBankV2
+
+PDF_EXTENSIONS = ('.pdf',)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+TEXT_EXTENSIONS = ('.txt', '.md')
+# 出队顺序：文本最快，先出结果；PDF与图片耗时较长放在后面
+TYPE_ORDER = ('file', 'pdf', 'image')
+
+
+def detect_file_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        return 'pdf'
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension in TEXT_EXTENSIONS:
+        return 'file'
+    return None
+
+
+def collect_files(directory, recursive=True):
+    """返回按类型分组、组内按路径排序的 (路径, 类型) 列表"""
+    jobs = {file_type: [] for file_type in TYPE_ORDER}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in files:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            file_type = detect_file_type(path)
+            if file_type:
+                jobs[file_type].append(path)
+        if not recursive:
+            break
+    return [(path, file_type) for file_type in TYPE_ORDER for path in sorted(jobs[file_type])]
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}秒"
+    if seconds < 3600:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+
+
+class IngestJob:
+    """一次批量导入任务"""
+
+    def __init__(self, assistant, question_bank, category_id, workers=2, force=False):
+        self.assistant = assistant
+        self.question_bank = question_bank
+        self.category_id = category_id
+        self.workers = max(1, workers)
+        self.force = force
+
+        self.total_files = 0
+        self.done_files = 0
+        self.failed_files = 0
+        self.skipped_files = 0
+        self.saved_questions = 0
+        self.duplicate_questions = 0
+        self.started_at = None
+
+    def run(self, files):
+        pending = []
+        for path, file_type in files:
+            try:
+                digest = self.assistant.get_file_hash(path)
+            except Exception as e:
+                print(f"计算文件摘要失败，跳过: {path} ({e})")
+                self.failed_files += 1
+                continue
+            if not self.force and self.question_bank.is_file_ingested(digest):
+                self.skipped_files += 1
+                continue
+            pending.append((path, file_type, digest))
+        # 摘要缓存在整批文件算完后写一次
+        self.assistant.digest_cache.flush()
+
+        self.total_files = len(pending)
+        print(f"待处理 {self.total_files} 个文件，已导入过跳过 {self.skipped_files} 个，并发数 {self.workers}")
+        if not pending:
+            return
+
+        self.started_at = time.time()
+        # 题目提取在线程池中进行，数据库写入统一在当前线程完成
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.extract, path, file_type): (path, digest)
+                for path, file_type, digest in pending
+            }
+            try:
+                for future in as_completed(futures):
+                    path, digest = futures[future]
+                    self.handle_result(path, digest, future)
+            except KeyboardInterrupt:
+                print("\n收到中断，正在取消剩余任务...")
+                self.assistant.cancel_processing()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def extract(self, path, file_type):
+        questions = self.assistant.process_large_file_and_extract_questions(path, file_type)
+        return questions, self.assistant.get_failed_chunks()
+
+    def handle_result(self, path, digest, future):
+        self.done_files += 1
+        name = os.path.basename(path)
+        try:
+            questions, failed_chunks = future.result()
+        except Exception as e:
+            self.failed_files += 1
+            print(f"[{self.done_files}/{self.total_files}] {name}: 处理失败 ({e})")
+            self.print_progress()
+            return
+
+        if not questions:
+            # 不记为已导入，下次运行会重试
+            print(f"[{self.done_files}/{self.total_files}] {name}: 未提取到题目")
+            self.print_progress()
+            return
+
+        question_ids, skipped = self.question_bank.add_questions_bulk(self.category_id, questions)
+        if failed_chunks:
+            # 部分块失败时不记为已导入，下次运行会重新处理，已入库的题目由去重索引跳过
+            self.failed_files += 1
+            print(f"    {len(failed_chunks)} 个块请求失败，该文件下次运行时会重新处理")
+        else:
+            self.question_bank.mark_file_ingested(digest, os.path.abspath(path), self.category_id,
+                                                  len(question_ids))
+        self.saved_questions += len(question_ids)
+        self.duplicate_questions += skipped
+        print(f"[{self.done_files}/{self.total_files}] {name}: 新增 {len(question_ids)} 道，重复 {skipped} 道")
+        self.print_progress()
+
+    def print_progress(self):
+        elapsed = max(time.time() - self.started_at, 1e-6)
+        files_per_minute = self.done_files / elapsed * 60
+        questions_per_minute = self.saved_questions / elapsed * 60
+        remaining = self.total_files - self.done_files
+        eta = elapsed / self.done_files * remaining if self.done_files else 0
+        print(f"    速度: {files_per_minute:.1f} 文件/分钟，{questions_per_minute:.1f} 题/分钟，"
+              f"已用时 {format_duration(elapsed)}，预计剩余 {format_duration(eta)}")
+
+    def print_summary(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        print("\n=== 导入完成 ===")
+        print(f"处理文件: {self.done_files}，失败: {self.failed_files}，跳过(已导入): {self.skipped_files}")
+        print(f"新增题目: {self.saved_questions}，重复跳过: {self.duplicate_questions}")
+        print(f"总用时: {format_duration(elapsed)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量导入目录中的题目文件")
+    parser.add_argument('directory', help='要导入的目录')
+    parser.add_argument('--category', required=True, help='目标分类路径，如 数学/函数，不存在时自动创建')
+    parser.add_argument('--workers', type=int, default=2, help='同时处理的文件数')
+    parser.add_argument('--no-recursive', action='store_true', help='不进入子目录')
+    parser.add_argument('--force', action='store_true', help='忽略导入记录，重新导入所有文件')
+    parser.add_argument('--db', default='learning_space.db', help='数据库文件路径')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"目录不存在: {args.directory}")
+        return 1
+
+    files = collect_files(args.directory, recursive=not args.no_recursive)
+    if not files:
+        print("目录中没有可导入的文件")
+        return 0
+
+    question_bank = QuestionBankV2(db_path=args.db)
+    try:
+        category_id = question_bank.get_or_create_category_path(args.category)
+        assistant = AIAssistant(stream=False)
+        job = IngestJob(assistant, question_bank, category_id, workers=args.workers, force=args.force)
+        try:
+            job.run(files)
+        except KeyboardInterrupt:
+            pass
+        job.print_summary()
+    finally:
+        question_bank.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""延迟导入与启动耗时统计
+
+lazy_import 返回一个模块对象，真正的导入推迟到第一次访问其属性时，
+openai、numpy、PIL、pytesseract 等较重的依赖因此不再拖慢启动。
+
+设置环境变量 LEARNING_SPACE_IMPORT_TIME=1 启动应用时，会记录启动阶段每个模块的导入耗时，
+在首帧绘制后打印类似 python -X importtime 的报告。
+"""
+import os
+import sys
+import time
+import builtins
+import importlib.util
+from threading import get_ident
+
+IMPORT_TIME_ENV = "LEARNING_SPACE_IMPORT_TIME"
+
+
+class MissingModule:
+    """未安装的依赖：导入时不报错，第一次使用时抛出 ImportError"""
+
+    def __init__(self, name: str):
+        self.__name__ = name
+
+    def __getattr__(self, attr):
+        raise ImportError(f"缺少依赖模块 {self.__name__}，请先安装")
+
+    def __bool__(self):
+        return False
+
+
+def lazy_import(name: str, optional: bool = False):
+    """延迟导入模块；未安装时 optional=True 返回 None，否则返回 MissingModule"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None or spec.loader is None:
+        return None if optional else MissingModule(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class ImportTimer:
+    """替换 builtins.__import__，记录主线程中每个模块首次导入的累计耗时与自身耗时"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.records = []
+        self.stack = []
+        self.thread_id = get_ident()
+        self.original_import = None
+
+    def install(self):
+        if self.original_import is None:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or get_ident() != self.thread_id:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        depth = len(self.stack)
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            self.records.append((name, elapsed - children, elapsed, depth))
+
+    def report(self, top: int = 15):
+        total = time.perf_counter() - self.started_at
+        import_total = sum(cumulative for _, _, cumulative, depth in self.records if depth == 0)
+        print("\n=== 启动耗时报告 ===")
+        print(f"启动到首帧: {total:.3f}秒，其中模块导入 {import_total:.3f}秒（{len(self.records)} 个模块）")
+        print(f"{'自身(ms)':>10} | {'累计(ms)':>10} | 模块")
+        ranked = sorted(self.records, key=lambda r: r[2], reverse=True)[:top]
+        for name, own, cumulative, depth in ranked:
+            print(f"{own * 1000:>10.1f} | {cumulative * 1000:>10.1f} | {'  ' * depth}{name}")
+
+
+_timer = None
+
+
+def start_import_timer_from_env():
+    """环境变量开启时安装导入计时器，需在导入其他模块之前调用"""
+    global _timer
+    if _timer is None and os.getenv(IMPORT_TIME_ENV):
+        _timer = ImportTimer()
+        _timer.install()
+    return _timer
+
+
+def report_startup(top: int = 15):
+    """打印启动耗时报告并停止计时，未开启时什么也不做"""
+    global _timer
+    if _timer is None:
+        return
+    _timer.uninstall()
+    _timer.report(top)
+    _timer = None
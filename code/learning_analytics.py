@@ -0,0 +1,267 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from focus_history import FocusHistory
+
+try:
+    from config import EVENT_RETENTION_MONTHS
+except ImportError:
+    EVENT_RETENTION_MONTHS = 6
+
+# 事件类型
+EVENT_VIEW = "view"              # 显示了一道题目
+EVENT_ANSWER = "answer"          # 展开了参考答案
+EVENT_REVIEW = "review"          # 复习评分
+
+# 评分不低于该值视为答对（与SM-2一致）
+CORRECT_GRADE = 3
+
+# 各事件类型计入的汇总字段
+_DAILY_COLUMNS = ('questions_viewed', 'answers_shown', 'reviews', 'correct')
+_CATEGORY_COLUMNS = _DAILY_COLUMNS
+# 专注统计只来自 FocusHistory（focus_sessions / focus_day_buckets），这里不再重复记录
+
+
+def day_key(timestamp: float) -> str:
+    """按本地时间取日期，格式 YYYY-MM-DD"""
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def _event_counts(kind: str, grade: Optional[int]) -> Dict[str, float]:
+    if kind == EVENT_VIEW:
+        return {'questions_viewed': 1}
+    if kind == EVENT_ANSWER:
+        return {'answers_shown': 1}
+    if kind == EVENT_REVIEW:
+        return {'reviews': 1, 'correct': 1 if grade is not None and grade >= CORRECT_GRADE else 0}
+    return {}
+
+
+class LearningAnalytics:
+    """学习记录与统计
+
+    learning_events 只追加，记录每次看题、看答案与复习评分。
+    daily_stats（按天）与 category_stats（按分类+天）是汇总表，与事件在同一个事务里增量更新，
+    连续学习天数、分类正确率等统计只读汇总表，耗时与天数成正比，与事件数量无关。
+    专注记录只保存在 FocusHistory 中，每日汇总里的专注次数与时长从它的按天统计读取。
+    事件先缓存在内存，攒够 flush_size 条、调用 flush 或查询统计前批量写入。
+    超过保留期的原始事件可用 compact 删除，汇总表不受影响。
+    """
+
+    def __init__(self, conn, flush_size: int = 20):
+        self.conn = conn
+        self.flush_size = flush_size
+        self.focus_history = FocusHistory(conn=conn)
+        # (kind, occurred_at, question_id, grade, seconds, completed)
+        self.pending: List[Tuple[str, float, Optional[int], Optional[int], Optional[float], bool]] = []
+        self.init_tables()
+
+    def init_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS learning_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                occurred_at REAL NOT NULL,
+                day TEXT NOT NULL,
+                question_id INTEGER,
+                category_id INTEGER,
+                grade INTEGER,
+                seconds REAL,
+                completed BOOLEAN DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                day TEXT PRIMARY KEY,
+                questions_viewed INTEGER NOT NULL DEFAULT 0,
+                answers_shown INTEGER NOT NULL DEFAULT 0,
+                reviews INTEGER NOT NULL DEFAULT 0,
+                correct INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_stats (
+                category_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                questions_viewed INTEGER NOT NULL DEFAULT 0,
+                answers_shown INTEGER NOT NULL DEFAULT 0,
+                reviews INTEGER NOT NULL DEFAULT 0,
+                correct INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (category_id, day)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_learning_events_time ON learning_events (occurred_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_category_stats_day ON category_stats (day)")
+        self.conn.commit()
+
+    def record(self, kind: str, question_id: int = None, grade: int = None, seconds: float = None,
+               completed: bool = False, now: float = None):
+        now = time.time() if now is None else now
+        self.pending.append((kind, now, question_id, grade, seconds, completed))
+        if len(self.pending) >= self.flush_size:
+            self.flush()
+
+    def record_view(self, question_id: int):
+        self.record(EVENT_VIEW, question_id)
+
+    def record_answer_shown(self, question_id: int):
+        self.record(EVENT_ANSWER, question_id)
+
+    def record_review(self, question_id: int, grade: int):
+        self.record(EVENT_REVIEW, question_id, grade=grade)
+
+    def _category_ids(self, question_ids: Iterable[int]) -> Dict[int, int]:
+        question_ids = list(question_ids)
+        if not question_ids:
+            return {}
+        placeholders = ",".join("?" * len(question_ids))
+        rows = self.conn.execute(f"SELECT id, category_id FROM questions WHERE id IN ({placeholders})",
+                                 question_ids).fetchall()
+        return dict(rows)
+
+    def flush(self):
+        """把缓存的事件写入事件表，并在同一事务中累加到汇总表"""
+        if not self.pending:
+            return
+        events = self.pending
+        categories = self._category_ids({e[2] for e in events if e[2] is not None})
+
+        rows = []
+        daily: Dict[str, Dict[str, float]] = {}
+        by_category: Dict[Tuple[int, str], Dict[str, float]] = {}
+        for kind, occurred_at, question_id, grade, seconds, completed in events:
+            day = day_key(occurred_at)
+            category_id = categories.get(question_id)
+            rows.append((kind, occurred_at, day, question_id, category_id, grade, seconds, completed))
+
+            counts = _event_counts(kind, grade)
+            if not counts:
+                continue
+            totals = daily.setdefault(day, dict.fromkeys(_DAILY_COLUMNS, 0))
+            for column, value in counts.items():
+                totals[column] += value
+            if category_id is not None:
+                totals = by_category.setdefault((category_id, day), dict.fromkeys(_CATEGORY_COLUMNS, 0))
+                for column in _CATEGORY_COLUMNS:
+                    totals[column] += counts.get(column, 0)
+
+        daily_updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _DAILY_COLUMNS)
+        category_updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in _CATEGORY_COLUMNS)
+        try:
+            self.conn.executemany('''
+                INSERT INTO learning_events
+                    (kind, occurred_at, day, question_id, category_id, grade, seconds, completed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.executemany(f'''
+                INSERT INTO daily_stats (day, {", ".join(_DAILY_COLUMNS)})
+                VALUES (?, {", ".join("?" * len(_DAILY_COLUMNS))})
+                ON CONFLICT(day) DO UPDATE SET {daily_updates}
+            ''', [(day, *(totals[c] for c in _DAILY_COLUMNS)) for day, totals in daily.items()])
+            self.conn.executemany(f'''
+                INSERT INTO category_stats (category_id, day, {", ".join(_CATEGORY_COLUMNS)})
+                VALUES (?, ?, {", ".join("?" * len(_CATEGORY_COLUMNS))})
+                ON CONFLICT(category_id, day) DO UPDATE SET {category_updates}
+            ''', [(category_id, day, *(totals[c] for c in _CATEGORY_COLUMNS))
+                  for (category_id, day), totals in by_category.items()])
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"保存学习记录失败: {e}")
+            return
+        self.pending = []
+
+    def compact(self, months: int = EVENT_RETENTION_MONTHS, now: float = None) -> int:
+        """删除早于 months 个月（按每月30天计）的原始事件，返回删除条数；汇总表保留"""
+        self.flush()
+        now = time.time() if now is None else now
+        cutoff = now - months * 30 * 86400
+        try:
+            cursor = self.conn.execute("DELETE FROM learning_events WHERE occurred_at < ?", (cutoff,))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"清理学习记录失败: {e}")
+            return 0
+        return cursor.rowcount
+
+    def daily_summary(self, days: int = 7, today: date = None) -> List[Dict]:
+        """最近 days 天每天的汇总，没有记录的日期补0，按日期升序"""
+        self.flush()
+        today = today or date.today()
+        first = today - timedelta(days=days - 1)
+        rows = self.conn.execute(f'''
+            SELECT day, {", ".join(_DAILY_COLUMNS)} FROM daily_stats
+            WHERE day >= ? AND day <= ?
+        ''', (first.isoformat(), today.isoformat())).fetchall()
+        stored = {row[0]: dict(zip(_DAILY_COLUMNS, row[1:])) for row in rows}
+        focus = self.focus_history.totals_by_day(days, today)
+
+        summary = []
+        for offset, focus_totals in enumerate(focus):
+            day = (first + timedelta(days=offset)).isoformat()
+            totals = stored.get(day) or dict.fromkeys(_DAILY_COLUMNS, 0)
+            summary.append({'day': day, **totals,
+                            'focus_sessions': focus_totals['sessions'],
+                            'focus_completed': focus_totals['completed'],
+                            'focus_seconds': focus_totals['actual_seconds']})
+        return summary
+
+    def focus_minutes_by_day(self, days: int = 7, today: date = None) -> List[Tuple[str, float]]:
+        return [(item['day'], round(item['actual_seconds'] / 60, 1))
+                for item in self.focus_history.totals_by_day(days, today)]
+
+    def streak(self, today: date = None) -> int:
+        """连续学习天数；今天还没有学习时从昨天算起"""
+        self.flush()
+        today = today or date.today()
+        rows = self.conn.execute('''
+            SELECT day FROM daily_stats
+            WHERE day <= ? AND questions_viewed + answers_shown + reviews > 0
+            UNION
+            SELECT day FROM focus_day_buckets
+            WHERE day <= ? AND sessions > 0
+            ORDER BY day DESC
+        ''', (today.isoformat(), today.isoformat()))
+
+        expected = today
+        count = 0
+        for (day,) in rows:
+            current = datetime.strptime(day, '%Y-%m-%d').date()
+            if count == 0 and current == today - timedelta(days=1):
+                expected = current
+            if current != expected:
+                break
+            count += 1
+            expected = current - timedelta(days=1)
+        return count
+
+    def category_accuracy(self, days: int = None, today: date = None) -> List[Dict]:
+        """各分类的复习次数与正确率，days 为空时统计全部，按复习次数降序"""
+        self.flush()
+        condition, params = "", ()
+        if days:
+            today = today or date.today()
+            condition, params = "WHERE s.day >= ?", ((today - timedelta(days=days - 1)).isoformat(),)
+        rows = self.conn.execute(f'''
+            SELECT s.category_id, c.path, SUM(s.questions_viewed), SUM(s.reviews), SUM(s.correct)
+            FROM category_stats s
+            LEFT JOIN categories c ON c.id = s.category_id
+            {condition}
+            GROUP BY s.category_id
+            ORDER BY SUM(s.reviews) DESC
+        ''', params).fetchall()
+
+        result = []
+        for category_id, path, viewed, reviews, correct in rows:
+            result.append({
+                'category_id': category_id,
+                'path': path or '',
+                'questions_viewed': viewed,
+                'reviews': reviews,
+                'correct': correct,
+                'accuracy': correct / reviews if reviews else None,
+            })
+        return result
@@ -1,7 +1,10 @@
+import lazy_loader
+# 需在导入kivy等模块之前安装，才能统计到完整的启动导入耗时
+lazy_loader.start_import_timer_from_env()
+
 import os
+import math
 from pathlib import Path
-from kivy.config import Config
-from kivy.core.text import LabelBase
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.lang import Builder
 from kivy.core.window import Window
@@ -17,11 +20,16 @@ from kivy.uix.floatlayout import FloatLayout
 from kivy.clock import Clock
 from kivy.app import App
 import time
-import pytesseract
+import threading
 from todo_manager import TodoManager
 from focus_mode import FocusMode
+from focus_history import FocusHistory
 from ai_assistant import AIAssistant
+from ocr_engine import set_tesseract_cmd
+from font_manager import setup_default_font
+from profiler import span, traced
 from components import TaskDetailPopup
+from text_cache import CachedTextLabel
 from question_bank import QuestionBankV2
 from question_workshop import QuestionWorkshopScreen
 from popup import *
@@ -30,22 +38,17 @@ from kivy.graphics import Color, Rectangle
 # 配置字体路径
 CURRENT_DIR = Path(__file__).parent
 PROJECT_ROOT = CURRENT_DIR.parent
-FONT_PATH = str(PROJECT_ROOT / 'fonts' / 'simhei.ttf')
 FONT_DIR = str(PROJECT_ROOT / 'fonts')
 TESSERACT_PATH = str(PROJECT_ROOT / 'tesseract.exe')
 
 os.environ['KIVY_TEXT'] = FONT_DIR
-pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
-
-Config.set('kivy', 'default_font', ['SimHei', FONT_PATH])
-Config.set('graphics', 'default_font', ['SimHei', FONT_PATH])
+set_tesseract_cmd(TESSERACT_PATH)
 
-try:
-    LabelBase.register(name='Roboto', fn_regular=FONT_PATH)
-except Exception as e:
-    print(f"字体注册失败: {e}")
+# 启动时只注册默认中文字体，界面与kv文件只使用这一种字体
+setup_default_font(FONT_DIR)
 
-Builder.load_file('learning_space.kv')
+with span('load_kv', 'startup'):
+    Builder.load_file('learning_space.kv')
 
 
 def create_progress_updater(popup):
@@ -68,8 +71,8 @@ def init_application():
         print(f"初始化失败: {e}")
 
 
-class AutoWrapLabel(Label):
-    """自动换行标签"""
+class AutoWrapLabel(CachedTextLabel):
+    """自动换行标签，宽度变回之前的值时直接复用缓存的纹理"""
     def __init__(self, **kwargs):
         super(AutoWrapLabel, self).__init__(**kwargs)
         self.size_hint_y = None
@@ -153,6 +156,7 @@ class TodoScreen(Screen):
         except Exception as e:
             print(f"打开任务弹窗时出错: {e}")
 
+    @traced('ui')
     def refresh_task_list(self, *args):
         """刷新任务列表"""
         try:
@@ -245,7 +249,7 @@ class FocusScreen(Screen):
     """专注模式屏幕"""
     def __init__(self, **kwargs):
         super(FocusScreen, self).__init__(**kwargs)
-        self.focus_mode = FocusMode()
+        self.focus_mode = FocusMode(history=FocusHistory())
         self.timer_event = None
         self.current_duration = 25
         self.confirm_count = 0
@@ -508,8 +512,8 @@ class FocusScreen(Screen):
         popup.open()
         Clock.schedule_once(lambda dt: popup.dismiss(), duration)
 
-    def start_focus_mode(self, duration=None):
-        """启动专注模式"""
+    def start_focus_mode(self, duration=None, task_id=None, task_text=""):
+        """启动专注模式，可关联一个待办任务"""
         try:
             if self.focus_mode.is_active:
                 return
@@ -522,14 +526,15 @@ class FocusScreen(Screen):
 
             if duration_minutes > 0:
                 self.focus_mode.set_duration(duration_minutes)
-                self.focus_mode.start(duration_minutes)
+                self.focus_mode.start(duration_minutes, task_id)
                 self.update_ui_state()
-                if self.timer_event:
-                    self.timer_event.cancel()
-                self.timer_event = Clock.schedule_interval(self.update_timer, 1)
-                self.show_quick_message(f"开始 {duration_minutes} 分钟专注", 1)
+                self.schedule_next_tick()
+                if task_text:
+                    self.show_quick_message(f"开始 {duration_minutes} 分钟专注：{task_text}", 1)
+                else:
+                    self.show_quick_message(f"开始 {duration_minutes} 分钟专注", 1)
         except ValueError:
-            self.start_focus_mode(self.current_duration)
+            self.start_focus_mode(self.current_duration, task_id, task_text)
         except Exception as e:
             print(f"开始专注模式时出错: {e}")
 
@@ -541,19 +546,33 @@ class FocusScreen(Screen):
         self.focus_mode.stop()
         self.update_ui_state()
 
+    def schedule_next_tick(self):
+        """在剩余时间跨过下一个整秒时刷新一次，每次只保留一个定时回调
+
+        按单调时钟计算到下一个整秒的间隔，而不是固定每秒触发，
+        回调的延迟不会累积，显示的秒数也不会跳过或重复。
+        """
+        if self.timer_event:
+            self.timer_event.cancel()
+        remaining = self.focus_mode.get_remaining_time()
+        delay = remaining - math.floor(remaining)
+        if delay < 0.005:
+            delay += 1
+        # 稍晚于整秒触发，保证触发时显示的已经是新的秒数
+        self.timer_event = Clock.schedule_once(self.update_timer, delay + 0.005)
+
     def update_timer(self, dt=None):
         """更新计时器"""
+        self.timer_event = None
         if self.focus_mode.is_active:
             remaining = self.focus_mode.get_remaining_time()
             if remaining <= 0:
-                if self.timer_event:
-                    self.timer_event.cancel()
-                    self.timer_event = None
-                self.focus_mode.stop()
+                self.focus_mode.stop(completed=True)
                 self.update_ui_state()
                 self.show_completion_message()
             else:
                 self.ids.timer_display.text = self.format_time(remaining)
+                self.schedule_next_tick()
 
     def update_ui_state(self):
         """更新UI状态"""
@@ -570,7 +589,8 @@ class FocusScreen(Screen):
             self.ids.timer_display.text = '开始专注'
 
     def format_time(self, seconds):
-        """格式化时间显示"""
+        """格式化时间显示，剩余秒数向上取整，开始时显示完整时长"""
+        seconds = math.ceil(seconds)
         minutes = int(seconds // 60)
         seconds = int(seconds % 60)
         return f"{minutes:02d}:{seconds:02d}"
@@ -617,19 +637,27 @@ class AIChatScreen(Screen):
     """AI聊天屏幕"""
     def __init__(self, **kwargs):
         super(AIChatScreen, self).__init__(**kwargs)
-        self.ai_assistant = AIAssistant()
+        self._ai_assistant = None
         self.chat_history = []
+        self.chat_session = None
         self.source_type = None
         self.source_data = None
         self.original_question = None
         self.create_ui()
 
+    @property
+    def ai_assistant(self):
+        """首次对话时才创建AIAssistant（会导入openai），不拖慢应用启动"""
+        if self._ai_assistant is None:
+            self._ai_assistant = AIAssistant()
+        return self._ai_assistant
+
     def set_question_with_source(self, question_text, source_type, source_data=None):
         """设置问题来源"""
         self.original_question = question_text
         self.source_type = source_type
         self.source_data = source_data
-        self.input_field.text = f"关于这道题：{question_text}\n\n请帮我解释一下："
+        self.set_question_in_input(question_text)
         Clock.schedule_once(lambda dt: setattr(self.input_field, 'focus', True), 0.1)
         app = App.get_running_app()
         if app:
@@ -736,8 +764,12 @@ class AIChatScreen(Screen):
             instance.rect.size = instance.size
 
     def set_question_in_input(self, question_text):
-        """在输入框中设置问题"""
-        self.input_field.text = f"关于这道题：{question_text}\n\n请帮我解释一下："
+        """切换到该题目的对话会话；题目只在会话开头发送一次，之后的追问不必重复粘贴"""
+        session = self.ai_assistant.get_chat_session(question_text)
+        if session is not self.chat_session:
+            self.chat_session = session
+            self.add_message("ai", f"当前题目：\n{session.question}")
+        self.input_field.text = "请帮我解释一下这道题" if not session.turns else ""
         Clock.schedule_once(lambda dt: setattr(self.input_field, 'focus', True), 0.1)
 
     def add_message(self, sender, message):
@@ -804,85 +836,37 @@ class AIChatScreen(Screen):
         self.chat_layout.add_widget(thinking_bubble)
         Clock.schedule_once(self.scroll_to_bottom, 0.1)
 
-        current_context = ""
-        if self.chat_history and len(self.chat_history) > 0:
-            for msg in reversed(self.chat_history):
-                if msg['sender'] == 'user' and '关于这道题：' in msg['message']:
-                    parts = msg['message'].split('关于这道题：')
-                    if len(parts) > 1:
-                        current_context = parts[1].split('\n')[0]
-                        break
+        # 兼容手动输入“关于这道题：……”的写法：标记后到第一个空行为题目，其余为提问
+        if message.startswith('关于这道题：'):
+            question, _, user_message = message[len('关于这道题：'):].partition('\n\n')
+            self.chat_session = self.ai_assistant.get_chat_session(question)
+            message = user_message.strip() or "请帮我解释一下这道题"
+        if self.chat_session is None:
+            self.chat_session = self.ai_assistant.get_chat_session("")
 
-        Clock.schedule_once(lambda dt: self.get_ai_response_improved(message, current_context), 0.5)
+        threading.Thread(target=self.get_ai_response_improved, args=(message, self.chat_session),
+                         daemon=True).start()
 
-    def get_ai_response_improved(self, user_message, question_context):
-        """获取AI响应"""
+    def get_ai_response_improved(self, user_message, session):
+        """在后台线程获取AI回复，完成后回到主线程显示"""
         try:
-            if hasattr(self, 'thinking_bubble') and self.thinking_bubble in self.chat_layout.children:
-                self.chat_layout.remove_widget(self.thinking_bubble)
-
-            if question_context:
-                full_prompt = f"""
-题目内容：
-{question_context}
-
-用户的具体问题：
-{user_message}
-请根据用户的具体问题回答，如果是无关问题请引导用户用户到题目上来，无法回答请表达你的抱歉，正常对话，不要用json格式
-"""
-                try:
-                    if hasattr(self.ai_assistant, 'call_ai_api'):
-                        response = self.ai_assistant.call_ai_api(full_prompt)
-                    elif hasattr(self.ai_assistant, 'chat_with_question'):
-                        response = self.ai_assistant.chat_with_question(question_context, user_message)
-                    else:
-                        import requests
-                        import json
-                        api_key = self.ai_assistant.api_keys[0] if self.ai_assistant.api_keys else ""
-                        headers = {
-                            "Authorization": f"Bearer {api_key}",
-                            "Content-Type": "application/json"
-                        }
-                        data = {
-                            "model": "gpt-3.5-turbo",
-                            "messages": [
-                                {
-                                    "role": "system",
-                                    "content": "你是一个学习助手，请直接回答用户的问题，不要使用'我已收到您的问题'这样的开场白。"
-                                },
-                                {
-                                    "role": "user",
-                                    "content": full_prompt
-                                }
-                            ],
-                            "temperature": 0.7,
-                            "max_tokens": 1000
-                        }
-                        response = requests.post(
-                            "https://api.openai.com/v1/chat/completions",
-                            headers=headers,
-                            json=data
-                        )
-                        if response.status_code == 200:
-                            result = response.json()
-                            response = result['choices'][0]['message']['content']
-                        else:
-                            raise Exception(f"API请求失败: {response.status_code}")
-                except Exception as api_error:
-                    print(f"API调用失败: {api_error}")
-                    response = f"关于您的问题：{user_message}\n\n基于题目内容：{question_context}\n\n我的解答是：由于这是一个示例，我建议您查阅相关资料或向老师请教以获得更详细的解答。"
-            else:
-                response = f"关于您的问题：{user_message}\n\n我建议您提供更多上下文信息，这样我能更好地为您解答。"
-
-            self.add_message("ai", response)
+            response = self.ai_assistant.chat_in_session(session, user_message)
         except Exception as e:
             print(f"获取AI回复时出错: {e}")
-            self.add_message("ai", f"我尝试为您解答这个问题，但遇到了一些困难。\n\n请尝试重新表述您的问题，或者检查网络连接。")
+            response = "我尝试为您解答这个问题，但遇到了一些困难。\n\n请尝试重新表述您的问题，或者检查网络连接。"
+        Clock.schedule_once(lambda dt: self.show_ai_response(response), 0)
+
+    def show_ai_response(self, response):
+        if hasattr(self, 'thinking_bubble') and self.thinking_bubble in self.chat_layout.children:
+            self.chat_layout.remove_widget(self.thinking_bubble)
+        self.add_message("ai", response)
 
     def clear_chat(self, instance):
         """清除聊天历史"""
         self.chat_layout.clear_widgets()
         self.chat_history = []
+        if self.chat_session is not None:
+            self.chat_session.clear()
         self.input_field.text = ""
 
     def reopen_quick_quiz(self, dt):
@@ -898,27 +882,72 @@ class AIChatScreen(Screen):
             self.manager.current = 'main'
 
 
+class LazyScreenManager(ScreenManager):
+    """按需构建屏幕：先登记屏幕类，第一次切换到或获取该屏幕时才创建"""
+
+    def __init__(self, **kwargs):
+        self.screen_factories = {}
+        super(LazyScreenManager, self).__init__(**kwargs)
+
+    def register_screen(self, name, factory):
+        self.screen_factories[name] = factory
+
+    def ensure_screen(self, name):
+        factory = self.screen_factories.pop(name, None)
+        if factory is not None:
+            with span(f'build.{name}', 'startup'):
+                self.add_widget(factory(name=name))
+
+    def get_screen(self, name):
+        self.ensure_screen(name)
+        return super(LazyScreenManager, self).get_screen(name)
+
+    def has_screen(self, name):
+        return name in self.screen_factories or super(LazyScreenManager, self).has_screen(name)
+
+    def prewarm(self, names=None):
+        """空闲时预先构建尚未创建的屏幕，每帧只建一个，避免卡顿"""
+        pending = [name for name in (names or list(self.screen_factories)) if name in self.screen_factories]
+
+        def build_next(dt):
+            if not pending:
+                return
+            self.ensure_screen(pending.pop(0))
+            if pending:
+                Clock.schedule_once(build_next, 0)
+
+        Clock.schedule_once(build_next, 0)
+
+
 class LearningSpaceApp(App):
     """学习空间应用"""
+    # 主界面显示后多久开始预构建其他屏幕，None表示不预构建
+    prewarm_delay = 1.5
+    prewarm_order = ('workshop', 'todo', 'focus', 'ai_chat')
+
+    @traced('startup')
     def build(self):
         """构建应用"""
         init_application()
         Window.size = (400, 600)
         self.global_question_bank = None
-        sm = ScreenManager()
+        sm = LazyScreenManager()
 
-        sm.add_widget(MainScreen(name='main'))
-        sm.add_widget(TodoScreen(name='todo'))
-        sm.add_widget(FocusScreen(name='focus'))
-        sm.add_widget(QuestionWorkshopScreen(name='workshop'))
-        sm.add_widget(AIChatScreen(name='ai_chat'))
+        # 启动时只创建主界面，其他屏幕第一次进入时才创建
+        sm.register_screen('main', MainScreen)
+        sm.register_screen('todo', TodoScreen)
+        sm.register_screen('focus', FocusScreen)
+        sm.register_screen('workshop', QuestionWorkshopScreen)
+        sm.register_screen('ai_chat', AIChatScreen)
 
         sm.current = 'main'
         return sm
 
     def on_start(self):
         """应用启动时调用"""
-        pass
+        Clock.schedule_once(lambda dt: lazy_loader.report_startup(), 0)
+        if self.prewarm_delay is not None:
+            Clock.schedule_once(lambda dt: self.root.prewarm(self.prewarm_order), self.prewarm_delay)
 
     def get_question_bank(self):
         """获取题库"""
@@ -933,6 +962,11 @@ class LearningSpaceApp(App):
 
     def on_stop(self):
         """应用停止时调用"""
+        # 退出时仍在专注，按中断保存这次专注记录（未创建的屏幕不必创建）
+        if self.root and 'focus' in self.root.screen_names:
+            focus_screen = self.root.get_screen('focus')
+            if focus_screen.focus_mode.is_active:
+                focus_screen.stop_focus_mode()
         if hasattr(self, 'global_question_bank') and self.global_question_bank:
             try:
                 self.global_question_bank.close()
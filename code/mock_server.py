@@ -0,0 +1,216 @@
+"""本地模拟的OpenAI兼容接口，用于离线测量题目提取性能
+
+用法:
+    python mock_server.py [--port 8765] [--latency 0.5] [--tokens-per-second 50]
+                          [--error-rate 0.1] [--canned 题目.json]
+
+然后把 AIAssistant 的 base_url 指向 http://127.0.0.1:8765/v1/ 即可。
+只实现 POST /v1/chat/completions（支持 stream），GET /stats 返回请求统计。
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chunker import estimate_tokens, find_question_starts
+
+CHUNK_TEXT_RE = re.compile(r'文本内容（第\d+部分）\s*"(.*)"\s*请严格按以下JSON格式返回', re.S)
+
+
+def generate_questions(prompt):
+    """从提取提示词中取出原文，按题号切分后原样组装成题目JSON，输出量与真实模型相近"""
+    match = CHUNK_TEXT_RE.search(prompt or "")
+    text = match.group(1) if match else (prompt or "")
+    starts = find_question_starts(text) or [0]
+    bounds = starts + [len(text)]
+
+    questions = []
+    for start, end in zip(bounds, bounds[1:]):
+        segment = text[start:end].strip()
+        if len(segment) < 5:
+            continue
+        questions.append({
+            "type": "选择题" if re.search(r'\n\s*[A-D][.．、]', segment) else "简答题",
+            "category": "模拟",
+            "question": segment,
+            "answer": "略",
+            "notes": "",
+            "difficulty": 3,
+        })
+    return questions
+
+
+class MockConfig:
+    def __init__(self, latency=0.5, tokens_per_second=50.0, error_rate=0.0, error_status=500,
+                 canned=None, chars_per_token=4, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.canned = canned
+        self.chars_per_token = chars_per_token
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.completion_tokens = 0
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "completion_tokens": self.completion_tokens}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            self.send_json(200, self.config.stats())
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        config = self.config
+
+        with config.lock:
+            config.requests += 1
+            fail = config.random.random() < config.error_rate
+            if fail:
+                config.errors += 1
+        if fail:
+            headers = {"Retry-After": "1"} if config.error_status == 429 else {}
+            self.send_json(config.error_status, {"error": {"message": "mock error", "type": "server_error"}},
+                           headers)
+            return
+
+        messages = body.get("messages", [])
+        prompt = messages[-1].get("content", "") if messages else ""
+        questions = config.canned if config.canned is not None else generate_questions(prompt)
+        content = json.dumps(questions, ensure_ascii=False, indent=2)
+
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        pieces = [content[i:i + config.chars_per_token] for i in range(0, len(content), config.chars_per_token)]
+        max_tokens = body.get("max_tokens")
+        finish_reason = "stop"
+        if max_tokens and len(pieces) > max_tokens:
+            pieces = pieces[:max_tokens]
+            finish_reason = "length"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                 "total_tokens": prompt_tokens + len(pieces)}
+        with config.lock:
+            config.completion_tokens += len(pieces)
+
+        time.sleep(config.latency)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self.send_stream(body.get("model", "mock"), pieces, finish_reason, usage if include_usage else None)
+        else:
+            if config.tokens_per_second:
+                time.sleep(len(pieces) / config.tokens_per_second)
+            self.send_json(200, {
+                "id": f"chatcmpl-mock-{config.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, model, pieces, finish_reason, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        created = int(time.time())
+        interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+
+        def event(delta, finish=None, usage_payload=None, with_choice=True):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if with_choice else []}
+            if usage_payload is not None:
+                chunk["usage"] = usage_payload
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for piece in pieces:
+                if interval:
+                    time.sleep(interval)
+                event({"content": piece})
+            event({}, finish=finish_reason)
+            if usage is not None:
+                event(None, usage_payload=usage, with_choice=False)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_mock_server(host='127.0.0.1', port=0, **config_kwargs):
+    """在后台线程启动模拟服务器，返回 (server, base_url)；port=0 时自动分配端口"""
+    handler = type('ConfiguredMockHandler', (MockHandler,), {"config": MockConfig(**config_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容接口")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='首个token前的延迟（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='输出速度，0表示不限速')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='请求失败比例（0-1）')
+    parser.add_argument('--error-status', type=int, default=500, help='失败时的HTTP状态码，如429/500/503')
+    parser.add_argument('--canned', help='固定返回的题目JSON文件（数组）')
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned, 'r', encoding='utf-8') as f:
+            canned = json.load(f)
+
+    server, base_url = start_mock_server(args.host, args.port, latency=args.latency,
+                                         tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                                         error_status=args.error_status, canned=canned)
+    print(f"模拟接口已启动: {base_url}（Ctrl+C 退出）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
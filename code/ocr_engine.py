@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import os
+import io
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional
+
+from lazy_loader import lazy_import
+
+# 这些依赖较重，首次使用OCR时才真正导入
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+ImageFilter = lazy_import('PIL.ImageFilter')
+pytesseract = lazy_import('pytesseract')
+cv2 = lazy_import('cv2', optional=True)
+
+try:
+    from config import OCR_WORKERS, OCR_CACHE_DIR
+except ImportError:
+    OCR_WORKERS = None
+    OCR_CACHE_DIR = "ocr_cache"
+
+# 预处理流程变化时递增，使旧的缓存结果失效
+OCR_CACHE_VERSION = 2
+PDF_RENDER_DPI = 300
+
+# Tesseract在行高约30像素（约相当于300DPI下的小四号字）时识别效果最好
+TARGET_LINE_HEIGHT = 32
+TARGET_DPI = 300
+MIN_SCALE, MAX_SCALE = 0.5, 3.0
+
+
+def preprocess_image_for_ocr(img: Image.Image, threshold: str = 'otsu',
+                             deskew: bool = False, crop: bool = False) -> Image.Image:
+    """灰度化、对比度拉伸、去噪、按字高缩放并自适应二值化，全部以NumPy数组运算完成
+
+    Args:
+        img: 原始图片
+        threshold: 'otsu' 全局阈值，适合光照均匀的扫描件；'sauvola' 局部阈值，适合手机拍摄的阴影照片
+        deskew: 是否检测并校正小角度倾斜
+        crop: 是否裁剪到文字区域
+    """
+    gray = np.asarray(img.convert('L'), dtype=np.uint8)
+    gray = _stretch_contrast(gray)
+    gray = _median_blur(gray)
+
+    scale = _choose_scale(gray, img.info.get('dpi'))
+    if scale != 1.0:
+        gray = _resize(gray, scale)
+
+    if threshold == 'sauvola':
+        text_mask = _sauvola_mask(gray)
+    else:
+        text_mask = gray <= _otsu_threshold(gray)
+
+    if crop:
+        text_mask = _crop_to_text(text_mask)
+
+    binary = np.where(text_mask, 0, 255).astype(np.uint8)
+    result = Image.fromarray(binary, mode='L')
+
+    if deskew:
+        angle = _estimate_skew(text_mask)
+        if abs(angle) >= 0.3:
+            result = result.rotate(angle, resample=Image.Resampling.NEAREST, expand=True, fillcolor=255)
+    return result
+
+
+def _stretch_contrast(gray: np.ndarray) -> np.ndarray:
+    low, high = np.percentile(gray, (1, 99))
+    if high - low < 1:
+        return gray
+    stretched = (gray.astype(np.float32) - low) * (255.0 / (high - low))
+    return np.clip(stretched, 0, 255).astype(np.uint8)
+
+
+def _median_blur(gray: np.ndarray) -> np.ndarray:
+    if cv2 is not None:
+        return cv2.medianBlur(gray, 3)
+    return np.asarray(Image.fromarray(gray).filter(ImageFilter.MedianFilter(3)))
+
+
+def _resize(gray: np.ndarray, scale: float) -> np.ndarray:
+    height, width = gray.shape
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    if cv2 is not None:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        return cv2.resize(gray, size, interpolation=interpolation)
+    return np.asarray(Image.fromarray(gray).resize(size, Image.Resampling.LANCZOS))
+
+
+def _otsu_threshold(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    cum_mean = np.cumsum(hist * levels)
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def _box_mean(values: np.ndarray, window: int) -> np.ndarray:
+    if cv2 is not None:
+        return cv2.boxFilter(values, ddepth=-1, ksize=(window, window), borderType=cv2.BORDER_REFLECT)
+    # 积分图求窗口均值，复杂度与窗口大小无关
+    half = window // 2
+    padded = np.pad(values, ((half + 1, half), (half + 1, half)), mode='symmetric')
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    sums = (integral[window:, window:] - integral[:-window, window:]
+            - integral[window:, :-window] + integral[:-window, :-window])
+    return sums / (window * window)
+
+
+def _sauvola_mask(gray: np.ndarray, window: int = 25, k: float = 0.2, dynamic_range: float = 128.0) -> np.ndarray:
+    values = gray.astype(np.float64)
+    mean = _box_mean(values, window)
+    mean_sq = _box_mean(values * values, window)
+    std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+    threshold = mean * (1 + k * (std / dynamic_range - 1))
+    return values <= threshold
+
+
+def _measure_line_height(text_mask: np.ndarray) -> float:
+    # 水平投影：连续含墨行构成一个文本行，取中位行高
+    ink_rows = text_mask.mean(axis=1) > 0.01
+    edges = np.diff(ink_rows.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    heights = ends - starts
+    heights = heights[heights >= 3]
+    if len(heights) < 3:
+        return 0.0
+    return float(np.median(heights))
+
+
+def _choose_scale(gray: np.ndarray, dpi=None) -> float:
+    scale = 1.0
+    line_height = _measure_line_height(gray <= _otsu_threshold(gray))
+    if line_height > 0:
+        scale = TARGET_LINE_HEIGHT / line_height
+    elif dpi:
+        try:
+            scale = TARGET_DPI / float(dpi[0])
+        except (TypeError, ValueError, ZeroDivisionError, IndexError):
+            scale = 1.0
+
+    scale = min(MAX_SCALE, max(MIN_SCALE, scale))
+    # 接近原尺寸时不缩放，省掉一次重采样
+    if 0.85 <= scale <= 1.15:
+        return 1.0
+    return scale
+
+
+def _crop_to_text(text_mask: np.ndarray, margin: int = 10) -> np.ndarray:
+    rows = np.flatnonzero(text_mask.mean(axis=1) > 0.002)
+    cols = np.flatnonzero(text_mask.mean(axis=0) > 0.002)
+    if len(rows) == 0 or len(cols) == 0:
+        return text_mask
+    top = max(0, rows[0] - margin)
+    bottom = min(text_mask.shape[0], rows[-1] + margin + 1)
+    left = max(0, cols[0] - margin)
+    right = min(text_mask.shape[1], cols[-1] + margin + 1)
+    return text_mask[top:bottom, left:right]
+
+
+def _estimate_skew(text_mask: np.ndarray, max_angle: float = 5.0, step: float = 0.25) -> float:
+    # 在缩小后的图上搜索使水平投影方差最大的角度
+    small = Image.fromarray(np.where(text_mask, 255, 0).astype(np.uint8))
+    if small.width > 800:
+        ratio = 800 / small.width
+        small = small.resize((800, max(1, int(small.height * ratio))), Image.Resampling.NEAREST)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rotated = np.asarray(small.rotate(float(angle), resample=Image.Resampling.NEAREST, fillcolor=0))
+        score = float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _cache_key(data: bytes, lang: str, options: dict) -> str:
+    digest = hashlib.blake2b(data, digest_size=20)
+    digest.update(f"|{lang}|{sorted(options.items())}|v{OCR_CACHE_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def _cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], f"{key}.txt")
+
+
+def _read_cache(cache_dir: Optional[str], key: str) -> Optional[str]:
+    if not cache_dir:
+        return None
+    path = _cache_path(cache_dir, key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_cache(cache_dir: Optional[str], key: str, text: str):
+    if not cache_dir:
+        return
+    path = _cache_path(cache_dir, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"写入OCR缓存失败: {e}")
+
+
+def _recognize(img: Image.Image, lang: str, tesseract_cmd: Optional[str], options: dict) -> str:
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    img = preprocess_image_for_ocr(img, **options)
+    text = pytesseract.image_to_string(img, lang=lang)
+    return text.replace('\x0c', '').strip()
+
+
+_tesseract_cmd_override = None
+
+
+def set_tesseract_cmd(path: Optional[str]):
+    """指定tesseract可执行文件路径，不必为此在启动时导入pytesseract"""
+    global _tesseract_cmd_override
+    _tesseract_cmd_override = path
+
+
+def _init_worker():
+    # Tesseract自身会开多线程，多进程并行时限制为单线程以免CPU过度争用
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+def _ocr_image_file(image_path: str, lang: str, cache_dir: Optional[str],
+                    tesseract_cmd: Optional[str], options: dict) -> str:
+    with open(image_path, 'rb') as f:
+        data = f.read()
+
+    key = _cache_key(data, lang, options)
+    cached = _read_cache(cache_dir, key)
+    if cached is not None:
+        return cached
+
+    img = Image.open(io.BytesIO(data))
+    text = _recognize(img, lang, tesseract_cmd, options)
+    _write_cache(cache_dir, key, text)
+    return text
+
+
+def _ocr_pdf_page(pdf_path: str, page_index: int, lang: str, cache_dir: Optional[str],
+                  tesseract_cmd: Optional[str], options: dict, dpi: int = PDF_RENDER_DPI) -> str:
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        page = pdf[page_index]
+        img = page.render(scale=dpi / 72, grayscale=True).to_pil()
+        page.close()
+    finally:
+        pdf.close()
+
+    img.info['dpi'] = (dpi, dpi)
+    key = _cache_key(img.tobytes() + f"{img.size}".encode(), lang, options)
+    cached = _read_cache(cache_dir, key)
+    if cached is not None:
+        return cached
+
+    text = _recognize(img, lang, tesseract_cmd, options)
+    _write_cache(cache_dir, key, text)
+    return text
+
+
+class OCREngine:
+    """批量OCR引擎：进程池并行识别图片与扫描版PDF页面，结果按图像哈希缓存"""
+
+    def __init__(self, workers: int = None, lang: str = 'chi_sim+eng', cache_dir: str = None,
+                 threshold: str = 'otsu', deskew: bool = False, crop: bool = False):
+        if workers is None:
+            workers = OCR_WORKERS or os.cpu_count() or 1
+        self.workers = max(1, workers)
+        self.lang = lang
+        self.cache_dir = cache_dir if cache_dir is not None else OCR_CACHE_DIR
+        self.threshold = threshold
+        self.deskew = deskew
+        self.crop = crop
+
+    @property
+    def preprocess_options(self) -> dict:
+        return {'threshold': self.threshold, 'deskew': self.deskew, 'crop': self.crop}
+
+    def ocr_images(self, image_paths: List[str], lang: str = None,
+                   progress_callback: Callable = None, cancel_check: Callable = None) -> List[str]:
+        """识别一组图片，按输入顺序返回每张图片的文本"""
+        lang = lang or self.lang
+        tasks = [(_ocr_image_file, (path, lang, self.cache_dir, self._tesseract_cmd(), self.preprocess_options))
+                 for path in image_paths]
+        return self._run(tasks, progress_callback, cancel_check)
+
+    def ocr_pdf_pages(self, pdf_path: str, page_indices: List[int], lang: str = None,
+                      progress_callback: Callable = None, cancel_check: Callable = None) -> Dict[int, str]:
+        """栅格化并识别PDF中指定的页面（页码从0开始），返回 {页码: 文本}"""
+        lang = lang or self.lang
+        tasks = [(_ocr_pdf_page, (pdf_path, index, lang, self.cache_dir, self._tesseract_cmd(),
+                                  self.preprocess_options))
+                 for index in page_indices]
+        texts = self._run(tasks, progress_callback, cancel_check)
+        return dict(zip(page_indices, texts))
+
+    def _tesseract_cmd(self) -> Optional[str]:
+        # 子进程（尤其是Windows下的spawn模式）不会继承主进程中对pytesseract的设置，需要显式传入
+        return _tesseract_cmd_override or pytesseract.pytesseract.tesseract_cmd
+
+    def _run(self, tasks, progress_callback=None, cancel_check=None) -> List[str]:
+        results = [""] * len(tasks)
+        if not tasks:
+            return results
+
+        workers = min(self.workers, len(tasks))
+        if workers == 1:
+            for i, (func, args) in enumerate(tasks):
+                if cancel_check:
+                    cancel_check()
+                results[i] = self._safe_call(func, args)
+                if progress_callback:
+                    progress_callback(i + 1, len(tasks))
+            return results
+
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        try:
+            futures = {executor.submit(func, *args): i for i, (func, args) in enumerate(tasks)}
+            done = 0
+            for future in as_completed(futures):
+                if cancel_check:
+                    cancel_check()
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"第{index + 1}项OCR识别失败: {e}")
+                done += 1
+                if progress_callback:
+                    progress_callback(done, len(tasks))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return results
+
+    def _safe_call(self, func, args) -> str:
+        try:
+            return func(*args)
+        except Exception as e:
+            print(f"OCR识别失败: {e}")
+            return ""
@@ -13,6 +13,14 @@ from kivy.uix.filechooser import FileChooserListView
 from kivy.uix.checkbox import CheckBox
 from kivy.graphics import Color, Rectangle
 from kivy.animation import Animation
+from review_scheduler import GRADE_AGAIN, GRADE_HARD, GRADE_GOOD, GRADE_EASY
+from question_prefetcher import QuestionPrefetcher
+from text_cache import CachedTextBlock
+from profiler import span
+
+# 随机闪卡每批题数；剩余不超过 PREFETCH_AHEAD 道时在后台预取下一批
+QUIZ_BATCH_SIZE = 10
+PREFETCH_AHEAD = 3
 
 
 class ProcessingPopup(Popup):
@@ -426,6 +434,16 @@ class QuickQuizPopup(Popup):
 
         self.showing_answer = False
         self.current_question_id = None
+        # 最近一次记录“看题”的题目，从AI对话返回等重新显示同一题时不重复记录
+        self.last_viewed_id = None
+        # 复习到期模式：按间隔重复调度取题，看完答案后评分
+        self.review_mode = False
+        # 后台预取的下一批随机题目，翻过本批最后一题时直接接上
+        self.next_batch = []
+        self.prefetcher = None
+        self.open_prefetcher()
+        # 预先排好版的下一张卡片：(题目ID, 题目文本, 答案文本, 题目区宽度, 答案区宽度)
+        self.staged_key = None
         self._saved_state = {
             'questions': self.current_questions.copy() if questions else [],
             'index': current_index,
@@ -467,17 +485,9 @@ class QuickQuizPopup(Popup):
                                         do_scroll_x=False, scroll_type=['bars', 'content'],
                                         bar_inactive_color=(0.7, 0.7, 0.7, 0.5))
 
-        self.question_label = Label(text="加载题目中...", halign='left', valign='top', size_hint_y=None,
-                                  font_size='18sp', color=(0.15, 0.15, 0.15, 1), line_height=1.3, padding=[15, 15])
-
-        def update_question_height(label, texture_size):
-            if texture_size[1] > 0:
-                label.height = texture_size[1] + 30
-                if label.height < 200:
-                    label.height = 200
-
-        self.question_label.bind(texture_size=update_question_height,
-                               width=lambda label, width: setattr(label, 'text_size', (width - 30, None)))
+        # 每个区域两个标签轮换：一个显示当前卡片，另一个在空闲时为下一张卡片排版
+        self.question_label = self.create_question_label("加载题目中...")
+        self.staged_question_label = self.create_question_label()
 
         self.question_scroll.add_widget(self.question_label)
         question_container.add_widget(self.question_scroll)
@@ -496,16 +506,8 @@ class QuickQuizPopup(Popup):
         self.answer_scroll = ScrollView(size_hint_y=1, bar_width=8, bar_color=(0.7, 0.7, 0.7, 0.8),
                                       do_scroll_x=False, scroll_type=['bars', 'content'])
 
-        self.answer_label = Label(text="", halign='left', valign='top', size_hint_y=None, font_size='16sp',
-                                color=(0.3, 0.3, 0.3, 1), line_height=1.3, padding=[10, 10])
-
-        def update_answer_height(label, texture_size):
-            if texture_size[1] > 0:
-                new_height = max(80, texture_size[1] + 20)
-                label.height = min(new_height, 200)
-
-        self.answer_label.bind(texture_size=update_answer_height,
-                             width=lambda label, width: setattr(label, 'text_size', (width - 30, None)))
+        self.answer_label = self.create_answer_label()
+        self.staged_answer_label = self.create_answer_label()
 
         self.answer_scroll.add_widget(self.answer_label)
         self.answer_area.add_widget(self.answer_scroll)
@@ -514,7 +516,10 @@ class QuickQuizPopup(Popup):
         controls_container = BoxLayout(orientation='vertical', size_hint=(1, 0.15), pos_hint={'bottom': 0.05, 'x': 0},
                                      spacing=2, padding=[10, 2, 10, 2])
 
-        controls = BoxLayout(orientation='horizontal', size_hint_y=0.45, spacing=5)
+        # 普通模式显示翻页按钮，复习模式下显示答案后换成评分按钮
+        self.primary_row = BoxLayout(orientation='horizontal', size_hint_y=0.45)
+        controls = BoxLayout(orientation='horizontal', spacing=5)
+        self.nav_controls = controls
         self.prev_btn = Button(text='上一题', font_size='14sp', background_color=(0.4, 0.6, 0.9, 1),
                              color=(1, 1, 1, 1), size_hint_x=0.3)
         self.prev_btn.bind(on_press=self.prev_question)
@@ -530,30 +535,62 @@ class QuickQuizPopup(Popup):
         controls.add_widget(self.prev_btn)
         controls.add_widget(self.toggle_btn)
         controls.add_widget(self.next_btn)
+        self.primary_row.add_widget(controls)
+
+        self.grade_controls = BoxLayout(orientation='horizontal', spacing=5)
+        for text, grade, color in (('重来', GRADE_AGAIN, (0.85, 0.3, 0.3, 1)),
+                                   ('困难', GRADE_HARD, (0.9, 0.6, 0.2, 1)),
+                                   ('良好', GRADE_GOOD, (0.3, 0.7, 0.4, 1)),
+                                   ('简单', GRADE_EASY, (0.3, 0.5, 0.9, 1))):
+            grade_btn = Button(text=text, font_size='14sp', background_color=color, color=(1, 1, 1, 1))
+            grade_btn.bind(on_press=lambda instance, g=grade: self.rate_current_question(g))
+            self.grade_controls.add_widget(grade_btn)
 
         functions = BoxLayout(orientation='horizontal', size_hint_y=0.45, spacing=8, padding=[0, 2, 0, 0])
         self.note_btn = Button(text='记笔记', font_size='14sp', background_color=(0.8, 0.5, 0.2, 1),
-                             color=(1, 1, 1, 1), size_hint_x=0.33, bold=True)
+                             color=(1, 1, 1, 1), size_hint_x=0.25, bold=True)
         self.note_btn.bind(on_press=self.edit_note)
 
         self.ai_btn = Button(text='AI助手', font_size='14sp', background_color=(0.9, 0.6, 0.2, 1),
-                           color=(1, 1, 1, 1), size_hint_x=0.33, bold=True)
+                           color=(1, 1, 1, 1), size_hint_x=0.25, bold=True)
         self.ai_btn.bind(on_press=self.goto_ai_chat)
 
         new_set_btn = Button(text='新题集', font_size='14sp', background_color=(0.2, 0.7, 0.3, 1),
-                           color=(1, 1, 1, 1), size_hint_x=0.33, bold=True)
+                           color=(1, 1, 1, 1), size_hint_x=0.25, bold=True)
         new_set_btn.bind(on_press=self.load_new_questions)
 
+        self.review_btn = Button(text='复习到期', font_size='14sp', background_color=(0.5, 0.4, 0.8, 1),
+                               color=(1, 1, 1, 1), size_hint_x=0.25, bold=True)
+        self.review_btn.bind(on_press=self.toggle_review_mode)
+
         functions.add_widget(self.note_btn)
         functions.add_widget(self.ai_btn)
         functions.add_widget(new_set_btn)
+        functions.add_widget(self.review_btn)
 
-        controls_container.add_widget(controls)
+        controls_container.add_widget(self.primary_row)
         controls_container.add_widget(functions)
         layout.add_widget(controls_container)
 
         self.content = layout
 
+    def create_question_label(self, text=""):
+        return CachedTextBlock(text=text, padding=[15, 15, 15, 15], min_height=200,
+                               label_options={'font_size': '18sp', 'color': (0.15, 0.15, 0.15, 1), 'line_height': 1.3})
+
+    def create_answer_label(self):
+        return CachedTextBlock(padding=[10, 10, 10, 10], min_height=80,
+                               label_options={'font_size': '16sp', 'color': (0.3, 0.3, 0.3, 1), 'line_height': 1.3})
+
+    @staticmethod
+    def card_texts(question):
+        question_text = question.get('question', '')
+        answer_text = question.get('answer', '')
+
+        if question_text and not question_text.startswith('\n'):
+            question_text = '\n' + question_text
+        return question_text, answer_text
+
     def show_current_question(self):
         if not self.current_questions or self.current_index >= len(self.current_questions):
             self.show_empty_state()
@@ -561,47 +598,124 @@ class QuickQuizPopup(Popup):
 
         current = self.current_questions[self.current_index]
         self.current_question_id = current.get('id')
+        if self.current_question_id is not None and self.current_question_id != self.last_viewed_id:
+            self.last_viewed_id = self.current_question_id
+            self.record_learning_event('record_view', self.current_question_id)
 
-        if self.use_external_questions:
+        if self.review_mode:
+            self.question_num_label.text = f"复习到期 ({self.current_index + 1}/{len(self.current_questions)})"
+        elif self.use_external_questions:
             self.question_num_label.text = f"题目作坊 ({self.current_index + 1}/{len(self.current_questions)})"
         else:
             self.question_num_label.text = f"快速闪卡 ({self.current_index + 1}/{len(self.current_questions)})"
 
-        question_text = current.get('question', '')
-        answer_text = current.get('answer', '')
-
-        if question_text and not question_text.startswith('\n'):
-            question_text = '\n' + question_text
-
-        self.question_label.text = question_text
-        if answer_text and len(answer_text) > 1500:
-            answer_text = answer_text[:1497] + "..."
-        self.answer_label.text = answer_text
+        question_text, answer_text = self.card_texts(current)
+        staged = self.use_staged_card(current.get('id'), question_text, answer_text)
+        if not staged:
+            self.question_label.text = question_text
+            self.answer_label.text = answer_text
 
         self.showing_answer = False
         self.toggle_btn.text = '显示答案'
         self.answer_area.height = 0
         self.answer_area.opacity = 0
+        self.show_primary_controls(self.nav_controls)
         self.update_button_states()
 
-        Clock.schedule_once(lambda dt: setattr(self.question_scroll, 'scroll_y', 1), 0.1)
-        Clock.schedule_once(lambda dt: setattr(self.answer_scroll, 'scroll_y', 1), 0.1)
-        Clock.schedule_once(self.update_text_width, 0.2)
+        if staged:
+            # 已排好版，高度已确定，可以立即回到顶部
+            self.question_scroll.scroll_y = 1
+            self.answer_scroll.scroll_y = 1
+        else:
+            Clock.schedule_once(lambda dt: setattr(self.question_scroll, 'scroll_y', 1), 0.1)
+            Clock.schedule_once(lambda dt: setattr(self.answer_scroll, 'scroll_y', 1), 0.1)
+            Clock.schedule_once(self.update_text_width, 0.2)
+        self.maybe_prefetch()
+        Clock.schedule_once(self.stage_next_card, 0)
+
+    def upcoming_question(self):
+        """下一张要显示的卡片，本批已到最后时取预取的下一批的第一题"""
+        if self.current_index + 1 < len(self.current_questions):
+            return self.current_questions[self.current_index + 1]
+        if self.next_batch and not self.review_mode and not self.use_external_questions:
+            return self.next_batch[0]
+        return None
+
+    def stage_next_card(self, dt=None):
+        """空闲时在不显示的标签上为下一张卡片生成文字纹理，翻页时直接换上"""
+        question = self.upcoming_question()
+        question_width = self.question_scroll.width
+        answer_width = self.answer_scroll.width
+        if question is None or question_width <= 30 or answer_width <= 30:
+            return
+        question_text, answer_text = self.card_texts(question)
+        key = (question.get('id'), question_text, answer_text, question_width, answer_width)
+        if key == self.staged_key:
+            return
+
+        with span('quiz.stage_card', 'ui'):
+            for label, text, width in ((self.staged_question_label, question_text, question_width),
+                                       (self.staged_answer_label, answer_text, answer_width)):
+                label.width = width
+                label.text = text
+                label.texture_update()
+        self.staged_key = key
+
+    def use_staged_card(self, question_id, question_text, answer_text):
+        """要显示的卡片已预先排版时，把预备标签换到滚动区域中"""
+        key = (question_id, question_text, answer_text, self.question_scroll.width, self.answer_scroll.width)
+        if self.staged_key is None or key != self.staged_key:
+            return False
+        self.staged_key = None
+
+        self.question_scroll.remove_widget(self.question_label)
+        self.question_scroll.add_widget(self.staged_question_label)
+        self.question_label, self.staged_question_label = self.staged_question_label, self.question_label
+
+        self.answer_scroll.remove_widget(self.answer_label)
+        self.answer_scroll.add_widget(self.staged_answer_label)
+        self.answer_label, self.staged_answer_label = self.staged_answer_label, self.answer_label
+        return True
+
+    def maybe_prefetch(self):
+        """随机闪卡剩余题目不多时，在后台预取下一批"""
+        if self.prefetcher is None or self.review_mode or self.use_external_questions or self.next_batch:
+            return
+        if len(self.current_questions) - self.current_index - 1 > PREFETCH_AHEAD:
+            return
+        exclude_ids = [q['id'] for q in self.current_questions if q.get('id') is not None]
+        self.prefetcher.fetch(QUIZ_BATCH_SIZE, self.on_batch_prefetched, exclude_ids)
+
+    def on_batch_prefetched(self, questions, notes):
+        # 在预取线程中调用，切回主线程处理
+        Clock.schedule_once(lambda dt: self.receive_prefetched_batch(questions, notes), 0)
+
+    def receive_prefetched_batch(self, questions, notes):
+        # 弹窗关闭前已排进主线程的结果直接丢弃
+        if self.prefetcher is None or self.prefetcher.closed:
+            return
+        if self.review_mode or self.use_external_questions:
+            return
+        for question_id, note in notes.items():
+            self.note_manager.notes_cache.setdefault(str(question_id), note)
+        self.next_batch = questions
+        self.update_button_states()
+        Clock.schedule_once(self.stage_next_card, 0)
+
+    def take_next_batch(self):
+        """换上预取的下一批随机题目，没有时返回False"""
+        if not self.next_batch or self.review_mode or self.use_external_questions:
+            return False
+        self.current_questions = self.next_batch
+        self.current_index = 0
+        self.next_batch = []
+        return True
 
     def update_text_width(self, dt=None):
-        if hasattr(self, 'question_label') and self.question_label:
-            if hasattr(self.question_label, 'texture_size'):
-                available_width = self.question_scroll.width - 30
-                if available_width > 0:
-                    self.question_label.text_size = (available_width, None)
-                    self.question_label.texture_update()
-
-        if hasattr(self, 'answer_label') and self.answer_label:
-            if hasattr(self.answer_label, 'texture_size'):
-                available_width = self.answer_scroll.width - 30
-                if available_width > 0:
-                    self.answer_label.text_size = (available_width, None)
-                    self.answer_label.texture_update()
+        # 文字块随宽度自动换行，这里只是立即完成排版；重复显示的内容直接取缓存的纹理
+        for label, scroll in ((self.question_label, self.question_scroll), (self.answer_label, self.answer_scroll)):
+            if scroll.width > 30:
+                label.texture_update()
 
     def toggle_answer(self, instance):
         if not self.current_questions:
@@ -615,6 +729,8 @@ class QuickQuizPopup(Popup):
         self.showing_answer = not self.showing_answer
         if self.showing_answer:
             self.toggle_btn.text = '隐藏答案'
+            if current_question.get('id') is not None:
+                self.record_learning_event('record_answer_shown', current_question['id'])
             answer_text = current_question.get('answer', '')
             if answer_text:
                 lines = len(answer_text) // 50 + 1
@@ -627,11 +743,23 @@ class QuickQuizPopup(Popup):
             anim.start(self.answer_area)
             Clock.schedule_once(self.update_text_width, 0.1)
             Clock.schedule_once(lambda dt: setattr(self.answer_scroll, 'scroll_y', 1), 0.2)
+            if self.review_mode:
+                self.show_primary_controls(self.grade_controls)
         else:
             self.toggle_btn.text = '显示答案'
             anim = Animation(height=0, opacity=0, duration=0.3)
             anim.start(self.answer_area)
 
+    def record_learning_event(self, method, *args):
+        """写入学习记录，题库不支持或出错时忽略"""
+        analytics = getattr(self.question_bank, 'analytics', None)
+        if analytics is None:
+            return
+        try:
+            getattr(analytics, method)(*args)
+        except Exception as e:
+            print(f"记录学习事件失败: {e}")
+
     def goto_ai_chat(self, instance):
         if not self.current_questions:
             return
@@ -659,6 +787,7 @@ class QuickQuizPopup(Popup):
                 'questions': self.current_questions.copy(),
                 'index': self.current_index,
                 'external': self.use_external_questions,
+                'review_mode': self.review_mode,
                 'question_id': self.current_question_id,
                 'showing_answer': self.showing_answer
             }
@@ -668,6 +797,7 @@ class QuickQuizPopup(Popup):
             self.current_questions = self._saved_state['questions']
             self.current_index = self._saved_state['index']
             self.use_external_questions = self._saved_state.get('external', False)
+            self.review_mode = self._saved_state.get('review_mode', False)
             self.current_question_id = self._saved_state.get('question_id')
             self.showing_answer = self._saved_state.get('showing_answer', False)
 
@@ -687,6 +817,8 @@ class QuickQuizPopup(Popup):
                 self.answer_area.height = answer_height + 40
                 self.answer_area.opacity = 1
                 self.toggle_btn.text = '隐藏答案'
+                if self.review_mode:
+                    self.show_primary_controls(self.grade_controls)
 
     def prev_question(self, instance):
         if self.current_index > 0:
@@ -699,6 +831,9 @@ class QuickQuizPopup(Popup):
             self.hide_answer_before_navigate()
             self.current_index += 1
             self.show_current_question()
+        elif self.take_next_batch():
+            self.hide_answer_before_navigate()
+            self.show_current_question()
 
     def hide_answer_before_navigate(self):
         if self.showing_answer:
@@ -707,9 +842,85 @@ class QuickQuizPopup(Popup):
             self.answer_area.height = 0
             self.answer_area.opacity = 0
 
+    def show_primary_controls(self, controls):
+        if controls.parent is not self.primary_row:
+            self.primary_row.clear_widgets()
+            self.primary_row.add_widget(controls)
+
+    def toggle_review_mode(self, instance=None):
+        self.review_mode = not self.review_mode
+        self.use_external_questions = False
+        self.review_btn.text = '随机闪卡' if self.review_mode else '复习到期'
+        self.hide_answer_before_navigate()
+        if self.review_mode:
+            self.load_due_questions()
+        else:
+            self.load_random_questions()
+
+    def load_due_questions(self, instance=None):
+        try:
+            questions = self.question_bank.get_due_questions(20)
+        except Exception as e:
+            print(f"加载复习题目失败: {e}")
+            questions = []
+        if not questions:
+            self.current_questions = []
+            self.show_primary_controls(self.nav_controls)
+            self.show_empty_state()
+            self.question_label.text = '\n当前没有到期需要复习的题目。\n可以切换回随机闪卡继续练习。'
+            self.question_num_label.text = "复习到期: 0"
+            return
+
+        self.current_questions = questions
+        self.current_index = 0
+        self.show_current_question()
+
+    def rate_current_question(self, grade):
+        """记录评分，把该题移出本轮队列并显示下一道"""
+        if not self.current_questions:
+            return
+        current = self.current_questions.pop(self.current_index)
+        try:
+            self.question_bank.record_review(current['id'], grade)
+        except Exception as e:
+            print(f"记录复习结果失败: {e}")
+
+        self.hide_answer_before_navigate()
+        if self.current_index >= len(self.current_questions):
+            self.current_index = 0
+        if self.current_questions:
+            self.show_current_question()
+        else:
+            self.load_due_questions()
+
+    def open_prefetcher(self):
+        """创建预取器；关闭后的预取器不能再用，重新打开弹窗时换一个新的"""
+        if self.prefetcher is not None and not self.prefetcher.closed:
+            return
+        db_path = getattr(self.question_bank, 'db_path', None)
+        self.prefetcher = QuestionPrefetcher(db_path, self.note_manager.notes_file) if db_path else None
+
+    def on_open(self):
+        # 去AI对话时弹窗会先关闭再重新打开，这里恢复预取
+        self.open_prefetcher()
+
+    def on_dismiss(self):
+        # 关闭后不再预取，进行中的预取结果不会再回到这个弹窗
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        # 评分按批写入，关闭弹窗时把剩余的写入数据库
+        if hasattr(self.question_bank, 'flush_reviews'):
+            try:
+                self.question_bank.flush_reviews()
+            except Exception as e:
+                print(f"保存复习记录失败: {e}")
+
     def load_random_questions(self, instance=None):
+        if self.take_next_batch():
+            self.show_current_question()
+            return
         try:
-            questions = self.question_bank.get_random_questions(10)
+            questions = self.question_bank.get_random_questions(QUIZ_BATCH_SIZE)
             if not questions:
                 self.show_empty_state()
                 return
@@ -717,12 +928,14 @@ class QuickQuizPopup(Popup):
             self.current_questions = questions
             self.current_index = 0
             self.show_current_question()
-            Clock.schedule_once(self.update_text_width, 0.2)
         except Exception as e:
             print(f"加载随机题目失败: {e}")
             self.show_empty_state()
 
     def load_new_questions(self, instance=None):
+        if self.review_mode:
+            self.load_due_questions()
+            return
         if self.use_external_questions:
             if self.current_questions:
                 self.current_index = 0
@@ -759,7 +972,7 @@ class QuickQuizPopup(Popup):
             return
 
         self.prev_btn.disabled = self.current_index == 0
-        self.next_btn.disabled = self.current_index == len(self.current_questions) - 1
+        self.next_btn.disabled = self.upcoming_question() is None
         current_question = self.current_questions[self.current_index]
         has_answer = current_question.get('answer', '').strip() != ''
         self.toggle_btn.disabled = not has_answer
@@ -0,0 +1,142 @@
+"""耗时埋点
+
+设置环境变量 LEARNING_SPACE_TRACE 后生效：
+    LEARNING_SPACE_TRACE=1              退出时写入 trace_<时间>.json
+    LEARNING_SPACE_TRACE=路径.json       退出时写入指定文件
+生成的文件可在 chrome://tracing 或 https://ui.perfetto.dev 中打开。
+
+    with span('workshop.load_content', 'ui', category_id=3):
+        ...
+
+    @traced('db')
+    def get_questions_by_category(self, category_id): ...
+
+未开启时 span 返回共享的空对象，traced 直接返回原函数，几乎没有额外开销。
+"""
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from collections import deque
+
+TRACE_ENV = "LEARNING_SPACE_TRACE"
+# 环形缓冲区容量，超出后丢弃最早的记录
+RING_SIZE = 50000
+
+ENABLED = bool(os.getenv(TRACE_ENV))
+_events = deque(maxlen=RING_SIZE)
+_pid = os.getpid()
+_origin = time.perf_counter_ns()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        event = {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": (self.start - _origin) / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": _pid,
+            "tid": threading.get_ident(),
+        }
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        if self.args:
+            event["args"] = {key: str(value) for key, value in self.args.items()}
+        # deque.append 是线程安全的
+        _events.append(event)
+        return False
+
+
+def span(name: str, category: str = "app", **args):
+    """记录一段代码的耗时，用作 with 语句"""
+    if not ENABLED:
+        return _NULL_SPAN
+    return Span(name, category, args)
+
+
+def traced(category: str = "app", name: str = None):
+    """函数装饰器，名称默认为 类名.方法名"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(span_name, category, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def events():
+    return list(_events)
+
+
+def clear():
+    _events.clear()
+
+
+def dump_chrome_trace(path: str = None) -> str:
+    """把缓冲区中的记录写成Chrome trace JSON，返回文件路径"""
+    if path is None:
+        path = f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    thread_names = [{"name": "thread_name", "ph": "M", "pid": _pid, "tid": thread.ident,
+                     "args": {"name": thread.name}} for thread in threading.enumerate()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": thread_names + events(), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return path
+
+
+def print_summary(top: int = 20):
+    """按名称汇总调用次数与总耗时"""
+    totals = {}
+    for event in events():
+        count, total, longest = totals.get(event["name"], (0, 0.0, 0.0))
+        totals[event["name"]] = (count + 1, total + event["dur"], max(longest, event["dur"]))
+    print(f"\n{'名称':<40}{'次数':>8}{'总耗时(ms)':>14}{'最长(ms)':>12}")
+    for name, (count, total, longest) in sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+        print(f"{name:<40}{count:>8}{total / 1000:>14.1f}{longest / 1000:>12.1f}")
+
+
+def _dump_at_exit():
+    if not _events:
+        return
+    value = os.getenv(TRACE_ENV, "")
+    path = value if value.lower().endswith('.json') else None
+    try:
+        path = dump_chrome_trace(path)
+        print_summary()
+        print(f"耗时记录已写入: {os.path.abspath(path)}")
+    except Exception as e:
+        print(f"写入耗时记录失败: {e}")
+
+
+if ENABLED:
+    atexit.register(_dump_at_exit)
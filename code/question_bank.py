@@ -1,13 +1,55 @@
 import sqlite3
+from datetime import date
+
+from dedup_index import NearDuplicateIndex
+from review_scheduler import ReviewScheduler
+from learning_analytics import LearningAnalytics
+from profiler import traced
+
+
+def query_random_questions(conn, limit=10, category_id=None, exclude_ids=()):
+    """随机取题，可指定分类并排除已取到的题目；供题库与后台预取（使用独立连接）共用"""
+    conditions, params = [], []
+    if category_id:
+        conditions.append("category_id = ?")
+        params.append(category_id)
+    exclude_ids = list(exclude_ids)
+    if exclude_ids:
+        conditions.append(f"id NOT IN ({','.join('?' * len(exclude_ids))})")
+        params.extend(exclude_ids)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor = conn.execute(f'''
+        SELECT id, type, question, answer, difficulty, needs_review
+        FROM questions
+        {where}
+        ORDER BY RANDOM()
+        LIMIT ?
+    ''', (*params, limit))
+
+    questions = []
+    for row in cursor.fetchall():
+        questions.append({
+            'id': row[0],
+            'type': row[1],
+            'question': row[2],
+            'answer': row[3] or '',
+            'difficulty': row[4],
+            'needs_review': bool(row[5])
+        })
+    return questions
 
 
 class QuestionBankV2:
     """题目库管理器 - 支持多级分类版本"""
 
-    def __init__(self):
-        self.db_path = 'learning_space.db'
+    def __init__(self, db_path='learning_space.db'):
+        self.db_path = db_path
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.init_database()
+        self.init_dedup_index()
+        self.init_review_scheduler()
+        self.init_learning_analytics()
 
     def init_database(self):
         """初始化数据库，创建多级分类表和题目表，并确保根分类存在"""
@@ -39,6 +81,25 @@ class QuestionBankV2:
             )
         ''')
 
+        # 已导入文件记录，按文件摘要判断是否重复导入
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingested_files (
+                digest TEXT PRIMARY KEY,
+                path TEXT,
+                category_id INTEGER,
+                question_count INTEGER DEFAULT 0,
+                ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # 一次性升级步骤的完成标记等
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS app_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
         # 初始化根分类
         cursor.execute("SELECT id FROM categories WHERE parent_id = 0 AND name = '根目录'")
         if not cursor.fetchone():
@@ -47,6 +108,45 @@ class QuestionBankV2:
         self.conn.commit()
         print("数据库v2结构初始化完成")
 
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)", (key, str(value)))
+        self.conn.commit()
+
+    def init_dedup_index(self):
+        """初始化近似重复索引；旧数据库只在第一次打开时补建MinHash签名"""
+        self.dedup_index = NearDuplicateIndex(self.conn)
+        if self.get_meta('dedup_backfilled'):
+            return
+        backfilled = self.dedup_index.backfill()
+        self.set_meta('dedup_backfilled', 1)
+        if backfilled:
+            print(f"近似重复索引补建完成，共 {backfilled} 道题目")
+
+    def init_review_scheduler(self):
+        """初始化间隔重复调度；旧数据库只在第一次打开时为已有题目补建复习卡片"""
+        self.review_scheduler = ReviewScheduler(self.conn)
+        if self.get_meta('review_cards_backfilled'):
+            return
+        backfilled = self.review_scheduler.backfill()
+        self.set_meta('review_cards_backfilled', 1)
+        if backfilled:
+            print(f"复习卡片补建完成，共 {backfilled} 道题目")
+
+    def init_learning_analytics(self):
+        """初始化学习记录；每天第一次打开时清理超过保留期的原始事件"""
+        self.analytics = LearningAnalytics(self.conn)
+        today = date.today().isoformat()
+        if self.get_meta('events_compacted_on') == today:
+            return
+        removed = self.analytics.compact()
+        self.set_meta('events_compacted_on', today)
+        if removed:
+            print(f"已清理 {removed} 条过期学习记录")
+
     def create_category(self, name, parent_id=0):
         """创建新分类，自动生成分类路径"""
         cursor = self.conn.cursor()
@@ -78,6 +178,7 @@ class QuestionBankV2:
         print(f"创建分类成功: {name} (ID: {category_id}), 父分类: {parent_id}")
         return category_id
 
+    @traced('db')
     def get_categories_by_parent(self, parent_id=0):
         """获取指定父分类下的所有子分类，包含子分类数和题目数统计"""
         cursor = self.conn.cursor()
@@ -109,6 +210,7 @@ class QuestionBankV2:
 
         return categories
 
+    @traced('db')
     def get_category_info(self, category_id):
         """获取指定分类的详细信息，包含子分类数和题目数统计"""
         cursor = self.conn.cursor()
@@ -133,6 +235,7 @@ class QuestionBankV2:
             }
         return None
 
+    @traced('db')
     def get_category_path_info(self, category_id):
         """递归获取分类的路径信息（从根到当前分类）"""
         if category_id == 0:
@@ -173,6 +276,7 @@ class QuestionBankV2:
 
         return path_info
 
+    @traced('db')
     def get_questions_by_category(self, category_id):
         """获取指定分类下的所有题目，按创建时间倒序排列"""
         cursor = self.conn.cursor()
@@ -215,42 +319,138 @@ class QuestionBankV2:
         ))
 
         question_id = cursor.lastrowid
+        self.dedup_index.add(question_id, question_data.get('question', ''), commit=False)
+        self.review_scheduler.add_cards([question_id], commit=False)
         self.conn.commit()
         print(f"添加题目成功，ID: {question_id}, 分类ID: {category_id}")
         return question_id
 
-    def get_random_questions(self, limit=10, category_id=None):
-        """获取随机题目，可指定分类和数量"""
+    @traced('db')
+    def add_questions_bulk(self, category_id, questions, skip_duplicates=True):
+        """在一个事务中批量添加题目，返回 (新增题目ID列表, 跳过的重复题目数)"""
+        cursor = self.conn.cursor()
+        question_ids = []
+        skipped = 0
+        try:
+            for question_data in questions:
+                text = question_data.get('question', '')
+                if skip_duplicates and self.dedup_index.find(text):
+                    skipped += 1
+                    continue
+                cursor.execute('''
+                    INSERT INTO questions (category_id, type, question, answer, difficulty, needs_review)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    category_id,
+                    question_data.get('type', '简答题'),
+                    text,
+                    question_data.get('answer', ''),
+                    question_data.get('difficulty', 3),
+                    question_data.get('needs_review', True)
+                ))
+                question_ids.append(cursor.lastrowid)
+                # 逐题写入索引，同一批次内的重复题也能被识别
+                self.dedup_index.add(cursor.lastrowid, text, commit=False)
+            self.review_scheduler.add_cards(question_ids, commit=False)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        print(f"批量添加题目成功: {len(question_ids)} 道，跳过重复 {skipped} 道，分类ID: {category_id}")
+        return question_ids, skipped
+
+    def is_file_ingested(self, digest):
         cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM ingested_files WHERE digest = ?", (digest,))
+        return cursor.fetchone() is not None
+
+    def mark_file_ingested(self, digest, path, category_id, question_count):
+        self.conn.execute('''
+            INSERT OR REPLACE INTO ingested_files (digest, path, category_id, question_count)
+            VALUES (?, ?, ?, ?)
+        ''', (digest, path, category_id, question_count))
+        self.conn.commit()
 
-        if category_id:
-            cursor.execute('''
-                SELECT id, type, question, answer, difficulty, needs_review
-                FROM questions 
-                WHERE category_id = ? 
-                ORDER BY RANDOM() 
-                LIMIT ?
-            ''', (category_id, limit))
-        else:
-            cursor.execute('''
-                SELECT id, type, question, answer, difficulty, needs_review
-                FROM questions 
-                ORDER BY RANDOM() 
-                LIMIT ?
-            ''', (limit,))
+    def get_or_create_category_path(self, category_path):
+        """按 "数学/函数" 形式的路径逐级查找分类，不存在的层级自动创建，返回最末级分类ID"""
+        cursor = self.conn.cursor()
+        # 根分类是 init_database 创建的唯一 parent_id = 0 的分类；用户分类可能也叫"根目录"，不能按名称找
+        cursor.execute("SELECT id FROM categories WHERE parent_id = 0 ORDER BY id LIMIT 1")
+        parent_id = cursor.fetchone()[0]
+
+        for name in [part.strip() for part in category_path.split('/') if part.strip()]:
+            cursor.execute("SELECT id FROM categories WHERE parent_id = ? AND name = ?", (parent_id, name))
+            row = cursor.fetchone()
+            parent_id = row[0] if row else self.create_category(name, parent_id)
+        return parent_id
+
+    @traced('db')
+    def find_near_duplicates(self, question_text, exclude_id=None):
+        """在整个题库中查找与给定题目近似重复的题目，按相似度排序"""
+        matches = self.dedup_index.find(question_text, exclude_id=exclude_id)
+        if not matches:
+            return []
+
+        similarities = dict(matches)
+        placeholders = ','.join(['?'] * len(similarities))
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT id, category_id, type, question, answer
+            FROM questions
+            WHERE id IN ({placeholders})
+        ''', list(similarities))
 
-        questions = []
+        duplicates = []
         for row in cursor.fetchall():
-            questions.append({
+            duplicates.append({
                 'id': row[0],
-                'type': row[1],
-                'question': row[2],
-                'answer': row[3] or '',
-                'difficulty': row[4],
-                'needs_review': bool(row[5])
+                'category_id': row[1],
+                'type': row[2],
+                'question': row[3],
+                'answer': row[4] or '',
+                'similarity': similarities[row[0]]
             })
-        return questions
+        duplicates.sort(key=lambda q: (-q['similarity'], q['id']))
+        return duplicates
+
+    @traced('db')
+    def find_all_duplicates(self):
+        """全库查找近似重复题目，返回分组列表，每组为题目ID列表"""
+        groups = self.dedup_index.find_all_duplicates()
+        print(f"全库近似重复检查完成，共 {len(groups)} 组")
+        return groups
+
+    @traced('db')
+    def get_random_questions(self, limit=10, category_id=None):
+        """获取随机题目，可指定分类和数量"""
+        return query_random_questions(self.conn, limit, category_id)
+
+    def delete_question(self, question_id):
+        """删除单道题目及其近似重复索引和复习卡片"""
+        self.dedup_index.remove_many([question_id], commit=False)
+        self.review_scheduler.remove_cards([question_id], commit=False)
+        self.conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+        self.conn.commit()
+
+    @traced('db')
+    def get_due_questions(self, limit=20):
+        """按到期时间取需要复习的题目"""
+        return self.review_scheduler.due_questions(limit)
+
+    def count_due_questions(self):
+        return self.review_scheduler.due_count()
+
+    def record_review(self, question_id, grade):
+        """记录复习评分（1重来/3困难/4良好/5简单），返回下次复习时间"""
+        self.analytics.record_review(question_id, grade)
+        return self.review_scheduler.record_review(question_id, grade)
+
+    def flush_reviews(self):
+        self.review_scheduler.flush()
+        self.analytics.flush()
 
+    @traced('db')
     def delete_category(self, category_id):
         """递归删除分类及其所有子分类、关联题目"""
         cursor = self.conn.cursor()
@@ -265,8 +465,12 @@ class QuestionBankV2:
 
         all_categories = get_all_subcategories(category_id)
 
-        # 删除关联题目
+        # 删除关联题目及其近似重复索引
         placeholders = ','.join(['?'] * len(all_categories))
+        cursor.execute(f"SELECT id FROM questions WHERE category_id IN ({placeholders})", all_categories)
+        question_ids = [row[0] for row in cursor.fetchall()]
+        self.dedup_index.remove_many(question_ids, commit=False)
+        self.review_scheduler.remove_cards(question_ids, commit=False)
         cursor.execute(f"DELETE FROM questions WHERE category_id IN ({placeholders})", all_categories)
 
         # 逆序删除分类（先删子分类，再删父分类）
@@ -314,6 +518,7 @@ class QuestionBankV2:
         print(f"更新分类名称成功: {old_path} -> {new_path}")
         return True
 
+    @traced('db')
     def search_categories(self, keyword):
         """根据关键词搜索分类（匹配名称或路径）"""
         cursor = self.conn.cursor()
@@ -337,6 +542,7 @@ class QuestionBankV2:
 
         return categories
 
+    @traced('db')
     def get_statistics(self):
         """获取题库统计信息：分类总数、题目总数、根分类数"""
         cursor = self.conn.cursor()
@@ -358,4 +564,6 @@ class QuestionBankV2:
 
     def close(self):
         """关闭数据库连接"""
+        self.review_scheduler.flush()
+        self.analytics.flush()
         self.conn.close()
\ No newline at end of file
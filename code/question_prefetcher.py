@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List
+
+from note import QuestionNoteManager
+from question_bank import query_random_questions
+from profiler import span
+
+
+class QuestionPrefetcher:
+    """后台预取下一批闪卡题目
+
+    在后台线程中用独立的数据库连接取题（sqlite连接不在线程间共用），
+    并用 batch_get_notes 一次读出这批题目的笔记。同一时间最多只有一个预取在进行；
+    结果通过 on_ready(questions, notes) 回调交给调用方，回调在后台线程中执行，
+    界面代码需要用 Clock.schedule_once 切回主线程。
+    """
+
+    def __init__(self, db_path: str, notes_file: str = None):
+        self.db_path = db_path
+        self.notes_file = notes_file
+        self.lock = threading.Lock()
+        self.in_flight = False
+        self.closed = False
+
+    def fetch(self, limit: int, on_ready: Callable[[List[Dict], Dict[int, str]], None],
+              exclude_ids: Iterable[int] = (), category_id=None) -> bool:
+        """开始一次预取，已有预取在进行或已关闭时返回False"""
+        with self.lock:
+            if self.in_flight or self.closed:
+                return False
+            self.in_flight = True
+        thread = threading.Thread(target=self._run, args=(limit, on_ready, list(exclude_ids), category_id),
+                                  name="question-prefetch", daemon=True)
+        thread.start()
+        return True
+
+    def _run(self, limit, on_ready, exclude_ids, category_id):
+        questions, notes = [], {}
+        try:
+            with span('quiz.prefetch', 'db', limit=limit):
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    questions = query_random_questions(conn, limit, category_id, exclude_ids)
+                finally:
+                    conn.close()
+                # 独立的笔记管理器，不与界面线程共用缓存
+                note_manager = QuestionNoteManager()
+                if self.notes_file:
+                    note_manager.notes_file = self.notes_file
+                notes = note_manager.batch_get_notes([q['id'] for q in questions])
+        except Exception as e:
+            print(f"预取题目失败: {e}")
+        finally:
+            with self.lock:
+                self.in_flight = False
+                closed = self.closed
+        if questions and not closed:
+            on_ready(questions, notes)
+
+    def close(self):
+        """关闭后不再发起预取，进行中的预取结果会被丢弃"""
+        with self.lock:
+            self.closed = True
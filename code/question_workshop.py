@@ -26,6 +26,7 @@ except ImportError:
 
 from popup import QuickQuizPopup
 from note import QuestionNoteManager
+from profiler import span, traced
 
 
 class ProcessingPopup(Popup):
@@ -50,6 +51,14 @@ class ProcessingPopup(Popup):
 
         self.progress_label = Label(text="AI正在提取题目内容，请耐心等待...", font_size='14sp', color=(0.5, 0.5, 0.5, 1))
         info_layout.add_widget(self.progress_label)
+
+        self.question_count = 0
+        self.count_label = Label(text="", font_size='14sp', color=(0.3, 0.5, 0.8, 1))
+        info_layout.add_widget(self.count_label)
+        self.latest_question_label = Label(text="", font_size='12sp', color=(0.4, 0.4, 0.4, 1),
+                                           halign='left', valign='top')
+        self.latest_question_label.bind(size=self.latest_question_label.setter('text_size'))
+        info_layout.add_widget(self.latest_question_label)
         layout.add_widget(info_layout)
 
         button_layout = BoxLayout(orientation='horizontal', size_hint_y=0.3, spacing=10)
@@ -71,6 +80,13 @@ class ProcessingPopup(Popup):
     def update_progress_with_percentage(self, percentage, message):
         self.progress_label.text = f"{message} ({percentage:.1f}%)"
 
+    def add_question_preview(self, question):
+        """流式解析出一道题目时实时显示"""
+        self.question_count += 1
+        self.count_label.text = f"已识别 {self.question_count} 道题目"
+        text = str(question.get('question', '')).replace('\n', ' ')
+        self.latest_question_label.text = text[:80] + ("..." if len(text) > 80 else "")
+
 
 class MultiQuestionPreviewPopup(Popup):
     """多题目预览弹窗"""
@@ -306,7 +322,8 @@ class EnhancedFileChooserPopup(Popup):
         notice_label = Label(text=notice_text, size_hint_y=0.1, font_size='14sp')
         layout.add_widget(notice_label)
 
-        self.file_chooser = FileChooserListView(filters=self.filters, size_hint_y=0.7)
+        self.file_chooser = FileChooserListView(filters=self.filters, size_hint_y=0.7,
+                                                multiselect=self.file_type == 'image')
         layout.add_widget(self.file_chooser)
 
         button_layout = BoxLayout(orientation='horizontal', size_hint_y=0.2, spacing=10)
@@ -321,7 +338,9 @@ class EnhancedFileChooserPopup(Popup):
 
     def select_file(self, instance):
         if self.file_chooser.selection:
-            file_path = self.file_chooser.selection[0]
+            selection = list(self.file_chooser.selection)
+            # 多选图片时整体作为一个任务交给OCR引擎
+            file_path = selection if len(selection) > 1 else selection[0]
             self.dismiss()
             if self.upload_callback:
                 self.upload_callback(file_path, self.file_type)
@@ -341,6 +360,7 @@ class QuestionWorkshopScreen(Screen):
         self.note_manager = QuestionNoteManager()
         Clock.schedule_once(self.init_components, 0.1)
 
+    @traced('ui')
     def init_components(self, dt=None):
         """初始化组件"""
         try:
@@ -350,9 +370,7 @@ class QuestionWorkshopScreen(Screen):
             else:
                 self.question_bank = QuestionBankV2()
 
-            if self.ai_assistant is None:
-                self.ai_assistant = AIAssistant()
-
+            # AIAssistant在处理上传文件时才创建（见process_selected_file），浏览题库用不到
             self.load_content()
         except Exception as e:
             print(f"初始化组件失败: {e}")
@@ -364,6 +382,7 @@ class QuestionWorkshopScreen(Screen):
         else:
             Clock.schedule_once(self.load_content, 0.1)
 
+    @traced('ui')
     def load_content(self, dt=None):
         """加载当前分类的内容"""
         try:
@@ -380,15 +399,17 @@ class QuestionWorkshopScreen(Screen):
 
             categories = self.question_bank.get_categories_by_parent(self.current_category_id)
             if categories:
-                for cat in categories:
-                    self.add_category_card(cat)
+                with span('workshop.category_cards', 'widgets', count=len(categories)):
+                    for cat in categories:
+                        self.add_category_card(cat)
 
             if self.current_category_id != 0:
                 questions = self.question_bank.get_questions_by_category(self.current_category_id)
                 self.questions_cache = questions
                 if questions:
-                    for question in questions:
-                        self.add_question_card(question)
+                    with span('workshop.question_cards', 'widgets', count=len(questions)):
+                        for question in questions:
+                            self.add_question_card(question)
 
             if not categories and (self.current_category_id == 0 or not questions):
                 self.show_empty_state()
@@ -705,8 +726,10 @@ class QuestionWorkshopScreen(Screen):
 
     def process_selected_file(self, file_path, file_type):
         """处理选择的文件"""
-        if not os.path.exists(file_path):
-            self.show_message("错误", f"文件不存在: {file_path}")
+        paths = file_path if isinstance(file_path, list) else [file_path]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            self.show_message("错误", f"文件不存在: {missing[0]}")
             return
 
         self.processing_popup = ProcessingPopup(cancel_callback=self.cancel_processing, file_type=file_type)
@@ -722,16 +745,21 @@ class QuestionWorkshopScreen(Screen):
                 if self.ai_assistant is None:
                     self.ai_assistant = AIAssistant()
 
+                popup = self.processing_popup
+
+                def on_question(question):
+                    Clock.schedule_once(lambda dt: popup.add_question_preview(question), 0)
+
                 questions = []
                 if file_type == 'image':
                     questions = self.ai_assistant.process_large_file_and_extract_questions(
-                        file_path, 'image', max_chunk_size=800, progress_callback=None)
+                        file_path, 'image', progress_callback=None, question_callback=on_question)
                 elif file_type == 'pdf':
                     questions = self.ai_assistant.process_large_file_and_extract_questions(
-                        file_path, 'pdf', max_chunk_size=800, progress_callback=None)
+                        file_path, 'pdf', progress_callback=None, question_callback=on_question)
                 else:
                     questions = self.ai_assistant.process_large_file_and_extract_questions(
-                        file_path, 'file', max_chunk_size=800, progress_callback=None)
+                        file_path, 'file', progress_callback=None, question_callback=on_question)
 
                 Clock.schedule_once(lambda dt: self.show_questions_preview(questions), 0)
             except Exception as e:
@@ -772,14 +800,22 @@ class QuestionWorkshopScreen(Screen):
                 return
 
             saved_count = 0
+            skipped_count = 0
             for question_data in selected_questions:
                 try:
+                    duplicates = self.question_bank.find_near_duplicates(question_data.get('question', ''))
+                    if duplicates:
+                        print(f"跳过重复题目，与已有题目ID {duplicates[0]['id']} 近似")
+                        skipped_count += 1
+                        continue
                     self.question_bank.add_question_to_category(self.current_category_id, question_data)
                     saved_count += 1
                 except Exception as e:
                     print(f"保存单个题目失败: {e}")
                     continue
 
+            if skipped_count:
+                self.show_message("提示", f"已保存 {saved_count} 道题目，跳过 {skipped_count} 道题库中已有的重复题目")
             Clock.schedule_once(self.load_content, 0.5)
         except Exception as e:
             print(f"保存题目失败: {e}")
@@ -877,9 +913,7 @@ class QuestionWorkshopScreen(Screen):
 
         def delete_question(instance):
             try:
-                cursor = self.question_bank.conn.cursor()
-                cursor.execute("DELETE FROM questions WHERE id = ?", (question_id,))
-                self.question_bank.conn.commit()
+                self.question_bank.delete_question(question_id)
                 popup.dismiss()
                 Clock.schedule_once(self.load_content, 0.1)
             except Exception as e:
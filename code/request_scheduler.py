@@ -0,0 +1,126 @@
+import time
+from collections import deque
+from threading import Condition, Lock
+from typing import Callable, Dict
+
+# 请求优先级：交互请求（AI对话）优先于后台请求（批量提取）
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class RequestScheduler:
+    """按优先级分配API调用速率，同一接口地址的所有调用方共用
+
+    总速率为每 min_interval 秒一次请求，拆成两个令牌桶：
+    - 预留桶按 interactive_share 的比例补充，只给交互请求使用；预留桶满时多出的部分转入共享桶，
+      没有对话时后台任务仍能用满全部速率；
+    - 共享桶按其余比例补充，两类请求都可使用。
+    有交互请求在等待时，后台请求一律让行。acquire 只负责放行，不在请求进行期间持有锁，
+    所以一个慢请求不会挡住后面的对话。
+    """
+
+    def __init__(self, min_interval: float = 2.0, interactive_share: float = 0.3, burst: float = 1.0):
+        self.condition = Condition()
+        self.min_interval = min_interval
+        self.interactive_share = interactive_share
+        self.burst = burst
+        self.reserved_tokens = burst
+        self.shared_tokens = burst
+        self.updated_at = time.monotonic()
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        # 最近的排队等待时间，供基准测试统计
+        self.wait_records = {INTERACTIVE: deque(maxlen=1000), BACKGROUND: deque(maxlen=1000)}
+
+    def set_min_interval(self, min_interval: float):
+        with self.condition:
+            if min_interval != self.min_interval:
+                self._refill(time.monotonic())
+                self.min_interval = min_interval
+                self.condition.notify_all()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.min_interval <= 0:
+            self.reserved_tokens = self.shared_tokens = self.burst
+            return
+
+        added = elapsed / self.min_interval
+        reserved = self.reserved_tokens + added * self.interactive_share
+        overflow = max(0.0, reserved - self.burst)
+        self.reserved_tokens = min(reserved, self.burst)
+        self.shared_tokens = min(self.burst, self.shared_tokens + added * (1 - self.interactive_share) + overflow)
+
+    def _try_take(self, priority: str) -> float:
+        """能放行时扣除令牌并返回0，否则返回预计还需等待的秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.min_interval <= 0:
+            return 0.0
+        rate = 1.0 / self.min_interval
+
+        if priority == INTERACTIVE:
+            available = self.reserved_tokens + self.shared_tokens
+            if available >= 1:
+                from_reserved = min(1.0, self.reserved_tokens)
+                self.reserved_tokens -= from_reserved
+                self.shared_tokens -= 1.0 - from_reserved
+                return 0.0
+            return (1 - available) / rate
+
+        if self.waiting[INTERACTIVE]:
+            return self.min_interval
+        if self.shared_tokens >= 1:
+            self.shared_tokens -= 1.0
+            return 0.0
+        # 预留桶已满时后台请求按全部速率补充，否则只按剩余份额补充
+        if self.reserved_tokens < self.burst:
+            rate *= 1 - self.interactive_share
+        return (1 - self.shared_tokens) / rate
+
+    def acquire(self, priority: str = BACKGROUND, check_cancelled: Callable[[], None] = None) -> float:
+        """阻塞到允许发起请求，返回排队等待的秒数；check_cancelled 抛出异常时放弃排队"""
+        started = time.monotonic()
+        with self.condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    wait = self._try_take(priority)
+                    if wait <= 0:
+                        break
+                    if check_cancelled:
+                        check_cancelled()
+                    self.condition.wait(min(wait, 0.5))
+            finally:
+                self.waiting[priority] -= 1
+                # 令牌或等待队列有变化，让其他等待者重新判断
+                self.condition.notify_all()
+
+            waited = time.monotonic() - started
+            self.wait_records[priority].append(waited)
+            return waited
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self.condition:
+            result = {}
+            for priority, records in self.wait_records.items():
+                waits = list(records)
+                result[priority] = {
+                    'count': len(waits),
+                    'mean_wait': sum(waits) / len(waits) if waits else 0.0,
+                    'max_wait': max(waits) if waits else 0.0,
+                }
+            return result
+
+
+_schedulers: Dict[str, RequestScheduler] = {}
+_schedulers_lock = Lock()
+
+
+def get_request_scheduler(endpoint: str) -> RequestScheduler:
+    """按接口地址取共享的调度器，同一进程内访问同一地址的AIAssistant共用速率"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(endpoint)
+        if scheduler is None:
+            scheduler = _schedulers[endpoint] = RequestScheduler()
+        return scheduler
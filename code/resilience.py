@@ -0,0 +1,217 @@
+import sys
+import time
+import random
+import socket
+from email.utils import parsedate_to_datetime
+from threading import Lock, get_ident
+from typing import Callable, Dict, Optional
+
+# 错误分类
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+AUTH = "auth"
+BAD_REQUEST = "bad_request"
+EMPTY = "empty"
+UNKNOWN = "unknown"
+
+RETRYABLE_KINDS = {RATE_LIMIT, SERVER, TIMEOUT, CONNECTION, EMPTY, UNKNOWN}
+# 这些错误说明服务端不可用，计入熔断器
+OUTAGE_KINDS = {SERVER, TIMEOUT, CONNECTION}
+
+
+class Failure:
+    def __init__(self, kind: str, retry_after: float = None, status: int = None, message: str = ""):
+        self.kind = kind
+        self.retry_after = retry_after
+        self.status = status
+        self.message = message
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE_KINDS
+
+    def __repr__(self):
+        return f"Failure({self.kind}, status={self.status}, retry_after={self.retry_after})"
+
+
+class ApiCallError(Exception):
+    """重试用尽或遇到不可重试错误时抛出，携带最后一次失败的分类"""
+
+    def __init__(self, failure: Failure, message: str = None):
+        super().__init__(message or f"API请求失败({failure.kind}): {failure.message}")
+        self.failure = failure
+
+
+class EmptyResponseError(Exception):
+    pass
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """解析 retry-after-ms / Retry-After（秒数或HTTP日期），返回秒数"""
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value:
+            return max(0.0, float(value) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def classify_error(error: Exception) -> Failure:
+    message = str(error)
+    if isinstance(error, EmptyResponseError):
+        return Failure(EMPTY, message=message)
+
+    # openai尚未导入时不可能出现它的异常，不必为分类而导入
+    openai = sys.modules.get('openai')
+    if openai is not None:
+        if isinstance(error, openai.APITimeoutError):
+            return Failure(TIMEOUT, message=message)
+        if isinstance(error, openai.APIConnectionError):
+            return Failure(CONNECTION, message=message)
+
+    status = getattr(error, 'status_code', None)
+    response = getattr(error, 'response', None)
+    retry_after = parse_retry_after(getattr(response, 'headers', None))
+    if status is not None:
+        if status == 429:
+            return Failure(RATE_LIMIT, retry_after, status, message)
+        if status in (401, 403):
+            return Failure(AUTH, status=status, message=message)
+        if status == 408:
+            return Failure(TIMEOUT, retry_after, status, message)
+        if status >= 500:
+            return Failure(SERVER, retry_after, status, message)
+        if 400 <= status < 500:
+            return Failure(BAD_REQUEST, status=status, message=message)
+
+    if isinstance(error, (TimeoutError, socket.timeout)):
+        return Failure(TIMEOUT, message=message)
+    if isinstance(error, ConnectionError):
+        return Failure(CONNECTION, message=message)
+    return Failure(UNKNOWN, message=message)
+
+
+class BackoffPolicy:
+    """带抖动的指数退避：在上限的一半到上限之间随机取值，服务端给出 Retry-After 时以其为下限"""
+
+    def __init__(self, base: float = 1.0, cap: float = 30.0, multiplier: float = 2.0):
+        self.base = base
+        self.cap = cap
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        ceiling = min(self.cap, self.base * (self.multiplier ** attempt))
+        wait = random.uniform(ceiling / 2, ceiling)
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, self.cap * 4))
+        return wait
+
+
+class CircuitBreaker:
+    """熔断器，同一接口地址的所有调用方共用
+
+    连续 failure_threshold 次服务不可用错误后断开 reset_timeout 秒，期间所有调用在 before_call 中等待；
+    到期后放行一个探测请求（半开），成功则恢复，失败则再次断开。限流时按 Retry-After 整体暂停。
+    探测请求既没有成功也没有失败（如被取消）时必须调用 release_probe，否则其他调用方会一直等待。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.paused_until = 0.0
+        self.probe_in_flight = False
+        self.probe_owner = None
+        self.lock = Lock()
+
+    def wait_time(self) -> float:
+        """当前需要等待的秒数，0表示可以发起请求"""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.state == self.OPEN:
+                if now < self.open_until:
+                    return max(wait, self.open_until - now)
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self.probe_in_flight:
+                    return max(wait, 0.5)
+                if wait == 0:
+                    self.probe_in_flight = True
+                    self.probe_owner = get_ident()
+            return wait
+
+    def before_call(self, check_cancelled: Callable[[], None] = None):
+        announced = False
+        while True:
+            wait = self.wait_time()
+            if wait <= 0:
+                return
+            if not announced:
+                print(f"接口暂不可用，所有请求暂停 {wait:.1f} 秒...")
+                announced = True
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                if check_cancelled:
+                    check_cancelled()
+                time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+
+    def release_probe(self):
+        """当前线程持有的探测名额在请求没有结果时归还，下一个调用方可以重新探测"""
+        with self.lock:
+            if self.probe_in_flight and self.probe_owner == get_ident():
+                self.probe_in_flight = False
+                self.probe_owner = None
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self, failure: Failure):
+        with self.lock:
+            now = time.monotonic()
+            if failure.kind == RATE_LIMIT and failure.retry_after:
+                self.paused_until = max(self.paused_until, now + failure.retry_after)
+            if failure.kind not in OUTAGE_KINDS:
+                self.probe_in_flight = False
+                return
+
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.open_until = now + max(self.reset_timeout, failure.retry_after or 0)
+                self.probe_in_flight = False
+                print(f"接口连续失败 {self.consecutive_failures} 次，熔断 {self.open_until - now:.0f} 秒")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = Lock()
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """按接口地址取共享的熔断器，同一进程内访问同一地址的AIAssistant共用"""
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker()
+        return breaker
@@ -0,0 +1,194 @@
+import time
+from typing import Dict, Iterable, List, Tuple
+
+DAY_SECONDS = 86400
+# 答错后多久再复习（秒）
+RELEARN_SECONDS = 10 * 60
+MIN_EASE = 1.3
+DEFAULT_EASE = 2.5
+
+# 界面上的四个评分按钮对应SM-2的0-5分
+GRADE_AGAIN = 1
+GRADE_HARD = 3
+GRADE_GOOD = 4
+GRADE_EASY = 5
+
+
+def next_state(ease: float, interval_days: float, repetitions: int, grade: int) -> Tuple[float, float, int]:
+    """SM-2：根据本次评分计算新的 (难易系数, 间隔天数, 连续答对次数)"""
+    if grade < 3:
+        return max(MIN_EASE, ease - 0.2), RELEARN_SECONDS / DAY_SECONDS, 0
+
+    if repetitions == 0:
+        interval_days = 1.0
+    elif repetitions == 1:
+        interval_days = 6.0
+    else:
+        interval_days = max(1.0, interval_days) * ease
+    if grade == GRADE_HARD:
+        interval_days = max(1.0, interval_days * 0.6)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    return ease, interval_days, repetitions + 1
+
+
+class ReviewScheduler:
+    """间隔重复调度（SM-2）
+
+    review_cards 每题一行，保存难易系数、间隔与下次复习时间，按 due_at 建索引，
+    取“最早到期的k道题”是一次索引范围查询，与题库大小无关。
+    评分先记在内存里，攒够 flush_size 条或调用 flush 时在一个事务里批量写入，
+    review_log 追加保存每次评分，供日后统计。
+    """
+
+    def __init__(self, conn, flush_size: int = 20):
+        self.conn = conn
+        self.flush_size = flush_size
+        # 尚未写入的卡片状态与评分记录
+        self.pending_cards: Dict[int, Tuple[float, float, int, int, float, float]] = {}
+        self.pending_logs: List[Tuple[int, int, float, float, float]] = []
+        self.init_tables()
+
+    def init_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS review_cards (
+                question_id INTEGER PRIMARY KEY,
+                ease REAL NOT NULL DEFAULT 2.5,
+                interval_days REAL NOT NULL DEFAULT 0,
+                repetitions INTEGER NOT NULL DEFAULT 0,
+                lapses INTEGER NOT NULL DEFAULT 0,
+                due_at REAL NOT NULL,
+                last_reviewed_at REAL,
+                FOREIGN KEY (question_id) REFERENCES questions (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS review_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question_id INTEGER NOT NULL,
+                grade INTEGER NOT NULL,
+                reviewed_at REAL NOT NULL,
+                interval_days REAL,
+                ease REAL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_cards_due ON review_cards (due_at)")
+        self.conn.commit()
+
+    def add_cards(self, question_ids: Iterable[int], commit: bool = True):
+        """为新题目建卡，立即到期"""
+        now = time.time()
+        self.conn.executemany("INSERT OR IGNORE INTO review_cards (question_id, due_at) VALUES (?, ?)",
+                              [(question_id, now) for question_id in question_ids])
+        if commit:
+            self.conn.commit()
+
+    def remove_cards(self, question_ids: Iterable[int], commit: bool = True):
+        question_ids = list(question_ids)
+        for question_id in question_ids:
+            self.pending_cards.pop(question_id, None)
+        self.conn.executemany("DELETE FROM review_cards WHERE question_id = ?", [(q,) for q in question_ids])
+        if commit:
+            self.conn.commit()
+
+    def backfill(self) -> int:
+        """为还没有复习卡片的已有题目建卡；标记了需要复习的题目排在前面
+
+        需要扫描全部题目，只在旧数据库升级时调用一次；之后增删题目时卡片随之增删。
+        """
+        now = time.time()
+        cursor = self.conn.execute('''
+            INSERT INTO review_cards (question_id, due_at)
+            SELECT q.id, CASE WHEN q.needs_review THEN ? ELSE ? END
+            FROM questions q
+            LEFT JOIN review_cards c ON c.question_id = q.id
+            WHERE c.question_id IS NULL
+        ''', (now - 1, now))
+        added = cursor.rowcount
+        self.conn.commit()
+        return added
+
+    def due_questions(self, limit: int = 20, now: float = None) -> List[Dict]:
+        """最早到期的 limit 道题目（含题目内容），按到期时间排序"""
+        now = time.time() if now is None else now
+        # 已评分但尚未写入的题目不应再出现，多取几行再过滤
+        rows = self.conn.execute('''
+            SELECT q.id, q.type, q.question, q.answer, q.difficulty, q.needs_review,
+                   c.due_at, c.repetitions, c.interval_days
+            FROM review_cards c
+            JOIN questions q ON q.id = c.question_id
+            WHERE c.due_at <= ?
+            ORDER BY c.due_at
+            LIMIT ?
+        ''', (now, limit + len(self.pending_cards))).fetchall()
+
+        questions = []
+        for row in rows:
+            if row[0] in self.pending_cards:
+                continue
+            questions.append({
+                'id': row[0],
+                'type': row[1],
+                'question': row[2],
+                'answer': row[3] or '',
+                'difficulty': row[4],
+                'needs_review': bool(row[5]),
+                'due_at': row[6],
+                'repetitions': row[7],
+                'interval_days': row[8],
+            })
+            if len(questions) >= limit:
+                break
+        return questions
+
+    def due_count(self, now: float = None) -> int:
+        now = time.time() if now is None else now
+        count = self.conn.execute("SELECT COUNT(*) FROM review_cards WHERE due_at <= ?", (now,)).fetchone()[0]
+        return max(0, count - len(self.pending_cards))
+
+    def _current_state(self, question_id: int):
+        pending = self.pending_cards.get(question_id)
+        if pending is not None:
+            return pending[0], pending[1], pending[2], pending[3]
+        row = self.conn.execute(
+            "SELECT ease, interval_days, repetitions, lapses FROM review_cards WHERE question_id = ?",
+            (question_id,)).fetchone()
+        return row if row else (DEFAULT_EASE, 0.0, 0, 0)
+
+    def record_review(self, question_id: int, grade: int, now: float = None) -> float:
+        """记录一次评分，返回下次复习时间；写入按批进行"""
+        now = time.time() if now is None else now
+        ease, interval_days, repetitions, lapses = self._current_state(question_id)
+        ease, interval_days, repetitions = next_state(ease, interval_days, repetitions, grade)
+        if grade < 3:
+            lapses += 1
+        due_at = now + interval_days * DAY_SECONDS
+
+        self.pending_cards[question_id] = (ease, interval_days, repetitions, lapses, due_at, now)
+        self.pending_logs.append((question_id, grade, now, interval_days, ease))
+        if len(self.pending_logs) >= self.flush_size:
+            self.flush()
+        return due_at
+
+    def flush(self):
+        """把内存中的评分在一个事务中写入数据库"""
+        if not self.pending_logs:
+            return
+        cards = [(question_id, *state) for question_id, state in self.pending_cards.items()]
+        try:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO review_cards
+                    (question_id, ease, interval_days, repetitions, lapses, due_at, last_reviewed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', cards)
+            self.conn.executemany('''
+                INSERT INTO review_log (question_id, grade, reviewed_at, interval_days, ease)
+                VALUES (?, ?, ?, ?, ?)
+            ''', self.pending_logs)
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            print(f"保存复习记录失败: {e}")
+            return
+        self.pending_cards.clear()
+        self.pending_logs.clear()
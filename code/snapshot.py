@@ -0,0 +1,493 @@
+"""学习空间快照：把数据库、笔记与题目库目录导出为一个压缩文件，或从中恢复
+
+用法:
+    python snapshot.py export 备份.lss [--db learning_space.db] [--notes question_notes.json] [--library questions_library]
+    python snapshot.py import 备份.lss [--db ...] [--notes ...] [--library ...]
+    python snapshot.py verify 备份.lss
+
+快照是一个zip文件：
+    manifest.json          格式版本、各表的建表语句/列/行数、索引与触发器、所有条目的sha256
+    tables/<表名>.bin      按批写入的列式二进制数据（见 encode_batch）
+    files/question_notes.json
+    library/...            questions_library 目录下的文件，原样保存
+
+导出在一个读事务中进行，得到一致的数据，各表按存储顺序（rowid或主键）导出。
+导入先写入临时数据库：关闭日志与同步，在一个事务中建表、按顺序追加数据，最后再建索引，
+校验行数与sha256全部通过后才一起替换数据库、笔记与题目库（任一步失败则全部撤销），原数据保留为 .bak。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import base64
+import sqlite3
+import hashlib
+import zipfile
+import zlib
+import argparse
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+from profiler import span
+
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+# 每批行数：批越大插入越快，但内存占用越高
+BATCH_ROWS = 20000
+# 已压缩的文件不再压缩
+_STORED_SUFFIXES = ('.gz', '.zst', '.zip', '.png', '.jpg', '.jpeg')
+# 表数据试压缩后仍大于原大小的该比例时不压缩
+INCOMPRESSIBLE_RATIO = 0.9
+
+_FRAME_HEADER = struct.Struct('<II')
+# 列编码：i 整数，f 双精度浮点，t 文本（可为空），b 二进制（可为空），j 混合类型（JSON）
+# 整数列按取值范围选用1/2/4/8字节，宽度由数据长度/行数得出
+_INT_TYPECODES = {array(code).itemsize: code for code in ('q', 'i', 'h', 'b')}
+
+
+def _first_value(values):
+    for value in values:
+        if value is not None:
+            return value
+    return None
+
+
+def _encode_ints(values: array) -> bytes:
+    low, high = min(values), max(values)
+    for size in sorted(_INT_TYPECODES):
+        limit = 1 << (size * 8 - 1)
+        if -limit <= low and high < limit:
+            return array(_INT_TYPECODES[size], values).tobytes()
+    return values.tobytes()
+
+
+def _encode_column(values) -> Tuple[str, bytes]:
+    # 按第一个非空值选择编码，整数与二进制列由 array/join 顺带校验整列，不再逐个值判断类型
+    first = _first_value(values)
+    try:
+        if type(first) is int:
+            return 'i', _encode_ints(array('q', values))
+        if type(first) is float and all(type(value) is float for value in values):
+            return 'f', array('d', values).tobytes()
+        if type(first) is bytes:
+            lengths = array('q', [-1 if value is None else len(value) for value in values])
+            return 'b', lengths.tobytes() + b"".join([value for value in values if value is not None])
+    except (TypeError, OverflowError):
+        pass
+    if first is None or type(first) is str:
+        try:
+            if all(type(value) is str or value is None for value in values):
+                return 't', json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        except TypeError:
+            pass
+    mixed = [{'$b64': base64.b64encode(value).decode('ascii')} if isinstance(value, bytes) else value
+             for value in values]
+    return 'j', json.dumps(mixed, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _decode_column(kind: str, data: bytes, count: int) -> list:
+    if kind == 'i':
+        values = array(_INT_TYPECODES[len(data) // count if count else 8])
+        values.frombytes(data)
+        return values.tolist()
+    if kind == 'f':
+        values = array('d')
+        values.frombytes(data)
+        return values.tolist()
+    if kind == 't':
+        return json.loads(data)
+    if kind == 'b':
+        lengths = array('q')
+        lengths.frombytes(data[:count * 8])
+        values, position = [], count * 8
+        for length in lengths:
+            if length < 0:
+                values.append(None)
+            else:
+                values.append(data[position:position + length])
+                position += length
+        return values
+    if kind == 'j':
+        return [base64.b64decode(value['$b64']) if isinstance(value, dict) else value
+                for value in json.loads(data)]
+    raise ValueError(f"未知的列编码: {kind}")
+
+
+def encode_batch(rows: List[tuple], column_count: int) -> bytes:
+    """把一批行编码为一帧：帧头(头部长度, 数据长度) + JSON头部(行数与各列编码/长度) + 各列数据"""
+    columns = list(zip(*rows)) if rows else [()] * column_count
+    encoded = [_encode_column(list(values)) for values in columns]
+    header = json.dumps({'rows': len(rows), 'columns': [[kind, len(data)] for kind, data in encoded]},
+                        separators=(',', ':')).encode('utf-8')
+    payload = b"".join(data for _, data in encoded)
+    return _FRAME_HEADER.pack(len(header), len(payload)) + header + payload
+
+
+def decode_batches(stream) -> Iterator[List[tuple]]:
+    while True:
+        head = stream.read(_FRAME_HEADER.size)
+        if not head:
+            return
+        if len(head) < _FRAME_HEADER.size:
+            raise ValueError("快照数据不完整")
+        header_length, payload_length = _FRAME_HEADER.unpack(head)
+        header = json.loads(stream.read(header_length))
+        payload = stream.read(payload_length)
+        if len(payload) != payload_length:
+            raise ValueError("快照数据不完整")
+
+        count = header['rows']
+        columns, position = [], 0
+        for kind, length in header['columns']:
+            columns.append(_decode_column(kind, payload[position:position + length], count))
+            position += length
+        yield list(zip(*columns))
+
+
+class _HashingReader:
+    """读取时顺带计算sha256与字节数"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _safe_entry_path(base_dir: str, relative: str) -> str:
+    """压缩包中的相对路径转为 base_dir 下的路径，拒绝绝对路径与 .. """
+    parts = relative.replace('\\', '/').split('/')
+    if relative.startswith('/') or any(part in ('', '.', '..') for part in parts):
+        raise ValueError(f"快照中的路径不合法: {relative}")
+    return os.path.join(base_dir, *parts)
+
+
+def _entry_info(archive: zipfile.ZipFile, entry_name: str, compress_type: int, source_path: str = None):
+    if source_path:
+        info = zipfile.ZipInfo.from_file(source_path, entry_name)
+    else:
+        info = zipfile.ZipInfo(entry_name, time.localtime()[:6])
+    info.compress_type = compress_type
+    # 直接传 ZipInfo 时 zipfile 不会套用压缩包的压缩级别
+    info._compresslevel = archive.compresslevel
+    return info
+
+
+def _write_file_entry(archive: zipfile.ZipFile, source_path: str, entry_name: str) -> Dict:
+    compress_type = zipfile.ZIP_STORED if source_path.lower().endswith(_STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+    digest = hashlib.sha256()
+    size = 0
+    info = _entry_info(archive, entry_name, compress_type, source_path)
+    with open(source_path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as target:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+            size += len(chunk)
+            target.write(chunk)
+    return {'entry': entry_name, 'size': size, 'sha256': digest.hexdigest()}
+
+
+def export_snapshot(output_path: str, db_path: str = 'learning_space.db', notes_file: str = 'question_notes.json',
+                    library_dir: str = 'questions_library', batch_rows: int = BATCH_ROWS) -> Dict:
+    """导出快照，返回manifest"""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"数据库不存在: {db_path}")
+
+    manifest = {'version': SNAPSHOT_VERSION, 'created_at': time.time(), 'tables': [], 'schema': [], 'files': []}
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # 整个导出在一个读事务中，期间的写入不会混进快照
+        conn.execute("BEGIN")
+        tables = conn.execute('''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid
+        ''').fetchall()
+        manifest['schema'] = [{'type': row[0], 'name': row[1], 'sql': row[2]} for row in conn.execute('''
+            SELECT type, name, sql FROM sqlite_master
+            WHERE type IN ('index', 'trigger', 'view') AND sql IS NOT NULL ORDER BY rowid
+        ''')]
+        # AUTOINCREMENT 的计数也要保留，否则导入后新题目可能复用已删除题目的ID
+        has_sequence = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'").fetchone()
+        if has_sequence:
+            tables.append(('sqlite_sequence', None))
+
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1,
+                             allowZip64=True) as archive:
+            for name, sql in tables:
+                with span('snapshot.export_table', 'db', table=name):
+                    manifest['tables'].append(_export_table(conn, archive, name, sql, batch_rows))
+
+            if notes_file and os.path.exists(notes_file):
+                entry = _write_file_entry(archive, notes_file, 'files/question_notes.json')
+                entry['path'] = 'question_notes.json'
+                manifest['files'].append(entry)
+
+            if library_dir and os.path.isdir(library_dir):
+                for root, _, filenames in os.walk(library_dir):
+                    for filename in sorted(filenames):
+                        path = os.path.join(root, filename)
+                        relative = os.path.relpath(path, library_dir).replace(os.sep, '/')
+                        entry = _write_file_entry(archive, path, f'library/{relative}')
+                        entry['path'] = relative
+                        manifest['files'].append(entry)
+
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1))
+        os.replace(temp_path, output_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        conn.close()
+    return manifest
+
+
+def _order_by(conn, name: str, sql: str) -> str:
+    """按存储顺序导出：WITHOUT ROWID 表按主键，其余按rowid。导入时按此顺序追加，B树只在末尾写入"""
+    if sql and 'WITHOUT ROWID' in sql.upper():
+        keys = sorted((row[5], row[1]) for row in conn.execute(f"PRAGMA table_info({_quote(name)})") if row[5])
+        return ", ".join(_quote(column) for _, column in keys)
+    return "rowid"
+
+
+def _export_table(conn, archive: zipfile.ZipFile, name: str, sql: str, batch_rows: int) -> Dict:
+    cursor = conn.execute(f"SELECT * FROM {_quote(name)} ORDER BY {_order_by(conn, name, sql)}")
+    columns = [description[0] for description in cursor.description]
+    entry_name = f"tables/{name}.bin"
+    digest = hashlib.sha256()
+    row_count = 0
+    rows = cursor.fetchmany(batch_rows)
+    frame = encode_batch(rows, len(columns))
+    # 用第一批试压缩，压不小的表（如minhash签名）直接存储，省下大部分压缩耗时
+    compress_type = zipfile.ZIP_DEFLATED
+    if len(zlib.compress(frame, 1)) > len(frame) * INCOMPRESSIBLE_RATIO:
+        compress_type = zipfile.ZIP_STORED
+    info = _entry_info(archive, entry_name, compress_type)
+    with archive.open(info, 'w', force_zip64=True) as target:
+        while True:
+            digest.update(frame)
+            target.write(frame)
+            row_count += len(rows)
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            frame = encode_batch(rows, len(columns))
+    return {'name': name, 'sql': sql, 'columns': columns, 'rows': row_count,
+            'entry': entry_name, 'sha256': digest.hexdigest()}
+
+
+def read_manifest(archive: zipfile.ZipFile) -> Dict:
+    try:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    except KeyError:
+        raise ValueError("不是学习空间快照：缺少 manifest.json")
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照版本: {manifest.get('version')}")
+    return manifest
+
+
+def verify_snapshot(snapshot_path: str) -> List[str]:
+    """逐个条目校验sha256，返回出错的条目（空列表表示完好）"""
+    errors = []
+    with zipfile.ZipFile(snapshot_path) as archive:
+        manifest = read_manifest(archive)
+        for item in manifest['tables'] + manifest['files']:
+            digest = hashlib.sha256()
+            try:
+                with archive.open(item['entry']) as source:
+                    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+                        digest.update(chunk)
+            except (KeyError, zipfile.BadZipFile) as e:
+                errors.append(f"{item['entry']}: {e}")
+                continue
+            if digest.hexdigest() != item['sha256']:
+                errors.append(f"{item['entry']}: 校验和不一致")
+    return errors
+
+
+def _import_database(archive: zipfile.ZipFile, manifest: Dict, temp_db: str):
+    conn = sqlite3.connect(temp_db, isolation_level=None)
+    try:
+        # 临时文件，出错直接丢弃，不需要回滚日志与落盘同步
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -512000")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        # 建索引时的排序可以多线程进行
+        conn.execute(f"PRAGMA threads = {min(4, os.cpu_count() or 1)}")
+        conn.execute("BEGIN")
+        for table in manifest['tables']:
+            if table['sql']:
+                conn.execute(table['sql'])
+
+        for table in manifest['tables']:
+            name = table['name']
+            if name == 'sqlite_sequence':
+                conn.execute("DELETE FROM sqlite_sequence")
+            placeholders = ", ".join("?" * len(table['columns']))
+            columns = ", ".join(_quote(column) for column in table['columns'])
+            insert = f"INSERT INTO {_quote(name)} ({columns}) VALUES ({placeholders})"
+            row_count = 0
+            with span('snapshot.import_table', 'db', table=name), archive.open(table['entry']) as source:
+                reader = _HashingReader(source)
+                for rows in decode_batches(reader):
+                    conn.executemany(insert, rows)
+                    row_count += len(rows)
+            if reader.digest.hexdigest() != table['sha256'] or row_count != table['rows']:
+                raise ValueError(f"表 {name} 的数据校验失败，快照可能已损坏")
+
+        # 数据全部写入后再建索引，比边插入边维护索引快得多
+        with span('snapshot.create_indexes', 'db'):
+            for item in manifest['schema']:
+                conn.execute(item['sql'])
+        conn.execute("COMMIT")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+
+
+def _extract_entry(archive: zipfile.ZipFile, item: Dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    digest = hashlib.sha256()
+    with archive.open(item['entry']) as source, open(path, 'wb') as target:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+            target.write(chunk)
+    if digest.hexdigest() != item['sha256']:
+        raise ValueError(f"文件 {item['path']} 校验失败，快照可能已损坏")
+
+
+def import_snapshot(snapshot_path: str, db_path: str = 'learning_space.db', notes_file: str = 'question_notes.json',
+                    library_dir: str = 'questions_library', keep_backup: bool = True) -> Dict:
+    """从快照恢复；全部写入并校验成功后才替换现有数据，原数据保留为 .bak。导入前请先关闭应用
+
+    快照中没有的笔记文件或题目库目录也会被移走（保留为 .bak），与导入的数据库保持一致。
+    """
+    suffix = f".import-{os.getpid()}.tmp"
+    temp_db = db_path + suffix
+    temp_notes = notes_file + suffix if notes_file else None
+    temp_library = library_dir.rstrip('/\\') + suffix if library_dir else None
+    try:
+        with zipfile.ZipFile(snapshot_path) as archive:
+            manifest = read_manifest(archive)
+            if os.path.exists(temp_db):
+                os.remove(temp_db)
+            _import_database(archive, manifest, temp_db)
+
+            notes_items = [item for item in manifest['files'] if item['entry'].startswith('files/')]
+            library_items = [item for item in manifest['files'] if item['entry'].startswith('library/')]
+            if temp_notes and notes_items:
+                _extract_entry(archive, notes_items[0], temp_notes)
+            if temp_library and library_items:
+                for item in library_items:
+                    _extract_entry(archive, item, _safe_entry_path(temp_library, item['path']))
+
+        # 全部成功后再替换，原数据留作备份。快照中没有笔记或题目库时也要移走现有的，
+        # 否则旧笔记会按题目ID挂到导入后的无关题目上
+        replacements = [(temp_db, db_path)]
+        if notes_file:
+            replacements.append((temp_notes if notes_items else None, notes_file))
+        if library_dir:
+            replacements.append((temp_library if library_items else None, library_dir))
+        _replace_all(replacements, keep_backup)
+    finally:
+        for path in (temp_db, temp_notes, temp_library):
+            if path:
+                _remove_path(path)
+    return manifest
+
+
+def _remove_path(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _replace_all(replacements: List[Tuple[str, str]], keep_backup: bool):
+    """按 (新文件, 目标) 逐个替换，新文件为None表示只移走目标；任一步失败时撤销已完成的替换
+
+    现有目标先改名为备份（keep_backup 时为 .bak），已有的 .bak 先挪到临时名，全部成功后才删除。
+    """
+    suffix = f".replaced-{os.getpid()}.tmp"
+    moved = []  # (原路径, 现路径)，撤销时逆序改回
+    try:
+        for source, target in replacements:
+            backup = target + '.bak' if keep_backup else target + suffix
+            if keep_backup and os.path.lexists(backup):
+                os.replace(backup, backup + suffix)
+                moved.append((backup, backup + suffix))
+            if os.path.lexists(target):
+                os.replace(target, backup)
+                moved.append((target, backup))
+            if source:
+                os.replace(source, target)
+                moved.append((source, target))
+    except Exception:
+        for original, current in reversed(moved):
+            try:
+                os.replace(current, original)
+            except OSError as e:
+                print(f"恢复 {original} 失败: {e}")
+        raise
+
+    for original, current in moved:
+        if current.endswith(suffix):
+            _remove_path(current)
+
+
+def _describe(manifest: Dict) -> str:
+    tables = {table['name']: table['rows'] for table in manifest['tables']}
+    return (f"题目 {tables.get('questions', 0)} 道，分类 {tables.get('categories', 0)} 个，"
+            f"共 {len(tables)} 张表，{len(manifest['files'])} 个文件")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="学习空间快照导出/导入")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('export', '导出快照'), ('import', '从快照恢复（会替换现有数据）')):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('snapshot', help='快照文件路径')
+        sub.add_argument('--db', default='learning_space.db', help='数据库文件路径')
+        sub.add_argument('--notes', default='question_notes.json', help='笔记文件路径')
+        sub.add_argument('--library', default='questions_library', help='题目库目录')
+    verify_parser = subparsers.add_parser('verify', help='校验快照完整性')
+    verify_parser.add_argument('snapshot', help='快照文件路径')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        if args.command == 'export':
+            manifest = export_snapshot(args.snapshot, args.db, args.notes, args.library)
+            size = os.path.getsize(args.snapshot)
+            print(f"导出完成: {_describe(manifest)}，{size / 1024 / 1024:.1f}MB，"
+                  f"耗时 {time.perf_counter() - start:.1f}秒")
+        elif args.command == 'import':
+            manifest = import_snapshot(args.snapshot, args.db, args.notes, args.library)
+            print(f"导入完成: {_describe(manifest)}，耗时 {time.perf_counter() - start:.1f}秒")
+        else:
+            errors = verify_snapshot(args.snapshot)
+            for error in errors:
+                print(error)
+            print("快照完好" if not errors else f"发现 {len(errors)} 处错误")
+            return 1 if errors else 0
+    except (OSError, ValueError, sqlite3.Error, zipfile.BadZipFile) as e:
+        print(f"{'导出' if args.command == 'export' else '导入'}失败: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
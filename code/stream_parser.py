@@ -0,0 +1,143 @@
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+
+class IncrementalJSONArrayParser:
+    """流式JSON数组解析器
+
+    逐段喂入模型输出，跟踪字符串/转义/括号深度，每当一个顶层对象的右花括号到达就立即解析并回调，
+    不必等整个数组生成完毕。数组前后的说明文字、```json 代码块标记都会被忽略。
+    """
+
+    def __init__(self, on_object: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_object = on_object
+        self.reset()
+
+    def reset(self):
+        self.objects: List[Dict[str, Any]] = []
+        self.errors = 0
+        self._parts: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """喂入一段文本，返回本次新完成的对象"""
+        if not text:
+            return []
+
+        completed = []
+        segment_start = 0 if self._stack else None
+        for i, ch in enumerate(text):
+            if not self._stack:
+                # 对象外部：只关心下一个对象的起点
+                if ch == '{':
+                    self._stack.append('}')
+                    segment_start = i
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._stack.append('}')
+            elif ch == '[':
+                self._stack.append(']')
+            elif ch in '}]':
+                if ch == self._stack[-1]:
+                    self._stack.pop()
+                if not self._stack:
+                    self._parts.append(text[segment_start:i + 1])
+                    obj = self._load("".join(self._parts))
+                    self._parts = []
+                    segment_start = None
+                    if obj is not None:
+                        completed.append(obj)
+
+        if self._stack and segment_start is not None:
+            self._parts.append(text[segment_start:])
+
+        for obj in completed:
+            self._emit(obj)
+        return completed
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """输出结束时调用，尝试补全被截断的最后一个对象"""
+        if not self._stack:
+            return []
+
+        pending = "".join(self._parts)
+        obj = self._recover(pending, list(self._stack), self._in_string)
+        self._parts = []
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        if obj is None:
+            return []
+        self._emit(obj)
+        return [obj]
+
+    def _emit(self, obj: Dict[str, Any]):
+        self.objects.append(obj)
+        if self.on_object:
+            self.on_object(obj)
+
+    def _load(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return None
+        return obj if isinstance(obj, dict) else None
+
+    def _recover(self, pending: str, stack: List[str], in_string: bool) -> Optional[Dict[str, Any]]:
+        # 先直接补齐引号和括号；不行再退回到最后一个顶层逗号，丢弃写了一半的字段
+        closing = "".join(reversed(stack))
+        candidates = [pending + ('"' if in_string else '') + closing]
+
+        cut = self._last_top_level_comma(pending)
+        if cut is not None:
+            candidates.append(pending[:cut] + '}')
+
+        for candidate in candidates:
+            try:
+                obj = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(obj, dict):
+                return obj
+        self.errors += 1
+        return None
+
+    @staticmethod
+    def _last_top_level_comma(text: str) -> Optional[int]:
+        depth = 0
+        in_string = False
+        escape = False
+        last = None
+        for i, ch in enumerate(text):
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == '\\':
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch in '{[':
+                depth += 1
+            elif ch in '}]':
+                depth -= 1
+            elif ch == ',' and depth == 1:
+                last = i
+        return last
@@ -0,0 +1,234 @@
+"""文字纹理缓存
+
+Kivy 的 Label 每次文字或宽度变化都要重新排版并生成纹理，长文本耗时明显。
+这里按 文字内容摘要 + 影响渲染的全部属性（宽度、字体、字号、颜色、行高……）缓存生成好的纹理，
+同样的内容在同样的宽度下再次显示时直接复用，纹理尺寸即排版后的高度。
+缓存按纹理占用的显存（宽×高×4字节）做LRU淘汰。
+
+    CachedTextLabel   可替换 Label 的缓存版本
+    CachedTextBlock   长文本按段落拆成多个 CachedTextLabel 纵向排列，
+                      单个纹理不会超过显卡的纹理尺寸上限，长答案可以完整显示
+"""
+import hashlib
+import weakref
+from collections import OrderedDict
+
+from kivy.uix.label import Label
+from kivy.uix.boxlayout import BoxLayout
+from kivy.properties import NumericProperty, StringProperty
+
+try:
+    from config import TEXT_CACHE_MB
+except ImportError:
+    TEXT_CACHE_MB = 64
+
+# CachedTextBlock 每块的大致字数，块越小单个纹理越小，排版一块的耗时也越短
+BLOCK_CHARS = 600
+# 块内找不到换行时，优先在这些字符之后断开
+_BREAK_CHARS = "。！？；.!?; "
+# 影响渲染结果的 Label 公开属性（不含 text），作为缓存键的一部分；
+# 当前 Kivy 版本没有的属性按 None 计入，不影响结果
+_RENDER_PROPERTIES = (
+    'font_size', 'font_name', 'font_family', 'font_context', 'font_features',
+    'font_hinting', 'font_kerning', 'font_blended', 'font_script_name', 'font_direction',
+    'base_direction', 'text_language', 'bold', 'italic', 'underline', 'strikethrough',
+    'color', 'disabled_color', 'outline_width', 'outline_color', 'disabled_outline_color',
+    'halign', 'valign', 'padding', 'padding_x', 'padding_y', 'text_size', 'line_height',
+    'max_lines', 'strip', 'shorten', 'shorten_from', 'split_str', 'ellipsis_options',
+    'unicode_errors', 'mipmap', 'limit_render_to_text_bbox',
+)
+
+
+class TextureCache:
+    """按显存占用淘汰的LRU纹理缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def texture_bytes(texture) -> int:
+        width, height = texture.size
+        return int(width) * int(height) * 4
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, texture, is_shortened=False):
+        size = self.texture_bytes(texture)
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= self.texture_bytes(old[0])
+        self.entries[key] = (texture, is_shortened)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.total_bytes -= self.texture_bytes(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+texture_cache = TextureCache(TEXT_CACHE_MB * 1024 * 1024)
+_live_labels = weakref.WeakSet()
+_reload_observer_installed = False
+
+
+def _on_context_reload(*args):
+    # GL上下文重建（如安卓从后台恢复）后缓存的纹理内容已丢失，清空缓存并让标签重新渲染
+    texture_cache.clear()
+    for label in list(_live_labels):
+        label._trigger_texture()
+
+
+def _install_reload_observer():
+    global _reload_observer_installed
+    if _reload_observer_installed:
+        return
+    _reload_observer_installed = True
+    try:
+        from kivy.graphics.context import get_context
+        get_context().add_reload_observer(_on_context_reload)
+    except Exception as e:
+        print(f"注册纹理重建回调失败: {e}")
+
+
+def text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+class CachedTextLabel(Label):
+    """生成纹理前先查缓存的 Label，用法与 Label 相同；markup 文本不缓存"""
+
+    def __init__(self, **kwargs):
+        super(CachedTextLabel, self).__init__(**kwargs)
+        _install_reload_observer()
+        _live_labels.add(self)
+
+    def texture_key(self):
+        options = tuple(repr(getattr(self, name, None)) for name in _RENDER_PROPERTIES)
+        return text_digest(self.text), self.disabled, options
+
+    def texture_update(self, *largs):
+        if self.markup or not self.text:
+            return super(CachedTextLabel, self).texture_update(*largs)
+
+        key = self.texture_key()
+        entry = texture_cache.get(key)
+        if entry is not None:
+            texture, is_shortened = entry
+            self.texture = texture
+            self.texture_size = list(texture.size)
+            self.is_shortened = is_shortened
+            return
+
+        super(CachedTextLabel, self).texture_update(*largs)
+        # 内部的文字渲染对象（Kivy 私有的 _label）在尺寸不变时会把下一段文字画进同一个纹理，
+        # 已缓存的纹理必须与它断开；Kivy 版本中没有这个对象时不缓存，行为与普通 Label 相同
+        core_label = getattr(self, '_label', None)
+        if self.texture is not None and hasattr(core_label, 'texture'):
+            texture_cache.put(key, self.texture, self.is_shortened)
+            core_label.texture = None
+
+
+def split_text_blocks(text: str, block_chars: int = BLOCK_CHARS):
+    """把长文本拆成约 block_chars 字的块，尽量在换行处、其次在句末断开"""
+    blocks = []
+    start = 0
+    while len(text) - start > block_chars:
+        end = start + block_chars
+        cut = text.rfind('\n', start + block_chars // 2, end)
+        if cut != -1:
+            blocks.append(text[start:cut])
+            start = cut + 1
+            continue
+        cut = max(text.rfind(char, start + block_chars // 2, end) for char in _BREAK_CHARS)
+        cut = cut + 1 if cut != -1 else end
+        blocks.append(text[start:cut])
+        start = cut
+    blocks.append(text[start:])
+    return blocks
+
+
+class CachedTextBlock(BoxLayout):
+    """长文本标签：按段落拆成若干 CachedTextLabel 纵向排列，高度随内容变化，不低于 min_height
+
+    label_options 传给每个内部标签（font_size、color、line_height 等），
+    内边距用 BoxLayout 的 padding 设置。
+    """
+    text = StringProperty("")
+    min_height = NumericProperty(0)
+
+    def __init__(self, label_options=None, block_chars: int = BLOCK_CHARS, **kwargs):
+        kwargs.setdefault('orientation', 'vertical')
+        kwargs.setdefault('size_hint_y', None)
+        super(CachedTextBlock, self).__init__(**kwargs)
+        self.label_options = dict(label_options or {})
+        self.block_chars = block_chars
+        self.labels = []
+        self.active_count = 0
+        self.bind(text=self.update_blocks, width=self.update_text_width,
+                  minimum_height=self.update_height, min_height=self.update_height)
+        self.update_blocks()
+
+    def create_label(self):
+        label = CachedTextLabel(halign='left', valign='top', size_hint_y=None, **self.label_options)
+        label.bind(texture_size=lambda instance, size: setattr(instance, 'height', size[1]))
+        return label
+
+    def update_blocks(self, *args):
+        blocks = split_text_blocks(self.text, self.block_chars) if self.text else []
+        while len(self.labels) < len(blocks):
+            self.labels.append(self.create_label())
+        self.clear_widgets()
+        for label, block in zip(self.labels, blocks):
+            label.text = block
+            self.add_widget(label)
+        for label in self.labels[len(blocks):]:
+            label.text = ""
+            label.height = 0
+        self.active_count = len(blocks)
+        self.update_text_width()
+        self.update_height()
+
+    def inner_width(self):
+        return self.width - self.padding[0] - self.padding[2]
+
+    def update_text_width(self, *args):
+        width = self.inner_width()
+        if width <= 0:
+            return
+        for label in self.labels[:self.active_count]:
+            label.text_size = (width, None)
+
+    def texture_update(self, *args):
+        """立即完成排版（命中缓存时只是取出纹理），之后高度即为最终高度"""
+        self.update_text_width()
+        for label in self.labels[:self.active_count]:
+            label.texture_update()
+
+    def update_height(self, *args):
+        self.height = max(self.min_height, self.minimum_height)
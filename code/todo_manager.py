@@ -1,5 +1,6 @@
 import sqlite3
 from components import DraggableTaskItem
+from profiler import traced
 
 
 class TodoManager:
@@ -41,6 +42,7 @@ class TodoManager:
         if self.refresh_tasks:
             self.refresh_tasks()
 
+    @traced('db')
     def add_task(self, task_text, description="", priority=0):
         """添加任务"""
         cursor = self.conn.cursor()
@@ -87,6 +89,7 @@ class TodoManager:
         if self.refresh_tasks:
             self.refresh_tasks()
 
+    @traced('db')
     def load_tasks(self):
         """加载任务"""
         cursor = self.conn.cursor()
@@ -0,0 +1,107 @@
+import math
+from threading import Lock
+from typing import Dict, Any
+
+from chunker import estimate_tokens
+
+# 常用模型的上下文窗口与单次最大输出（token）
+MODEL_LIMITS = {
+    "Qwen/Qwen2.5-Coder-32B-Instruct": {"context_window": 32768, "max_output_tokens": 8192},
+    "Qwen/Qwen2.5-72B-Instruct": {"context_window": 32768, "max_output_tokens": 8192},
+}
+DEFAULT_LIMITS = {"context_window": 32768, "max_output_tokens": 8192}
+
+
+class TokenBudgetPlanner:
+    """token预算规划器
+
+    以启发式估算为基础，用API返回的实际 prompt_tokens 持续校准，
+    据此决定每块输入的token数与每次请求的 max_tokens，并按文档统计实际用量。
+    """
+
+    def __init__(self, model: str = None, context_window: int = None, max_output_tokens: int = None,
+                 output_ratio: float = 1.6, output_overhead: int = 200, safety_margin: float = 0.1,
+                 max_chunk_tokens: int = None):
+        limits = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+        self.context_window = context_window or limits["context_window"]
+        self.max_output_tokens = max_output_tokens or limits["max_output_tokens"]
+        # 题目JSON会复述原题并补充答案，输出量约为输入的1.6倍
+        self.output_ratio = output_ratio
+        self.output_overhead = output_overhead
+        self.safety_margin = safety_margin
+        self.max_chunk_tokens = max_chunk_tokens
+
+        # 实际token数 / 估算token数，按指数滑动平均更新
+        self.calibration = 1.0
+        self.calibration_samples = 0
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.lock = Lock()
+
+    def count_tokens(self, text: str) -> int:
+        return math.ceil(estimate_tokens(text) * self.calibration)
+
+    def to_estimate_units(self, tokens: int) -> int:
+        """把真实token数换算回 estimate_tokens 的计量单位，供分块器使用"""
+        return max(1, int(tokens / self.calibration))
+
+    def expected_output_tokens(self, input_tokens: int) -> int:
+        return math.ceil(input_tokens * self.output_ratio + self.output_overhead)
+
+    def plan_chunk_tokens(self, prompt_overhead_tokens: int) -> int:
+        """在上下文窗口与最大输出两个约束下，求每块可容纳的最大输入token数"""
+        usable_context = self.context_window * (1 - self.safety_margin) - prompt_overhead_tokens
+        by_context = (usable_context - self.output_overhead) / (1 + self.output_ratio)
+        by_output = (self.max_output_tokens * (1 - self.safety_margin) - self.output_overhead) / self.output_ratio
+        chunk_tokens = int(min(by_context, by_output))
+        if self.max_chunk_tokens:
+            chunk_tokens = min(chunk_tokens, self.max_chunk_tokens)
+        return max(200, chunk_tokens)
+
+    def plan_max_tokens(self, input_tokens: int, prompt_tokens: int = 0) -> int:
+        expected = math.ceil(self.expected_output_tokens(input_tokens) * 1.25)
+        room = self.context_window - prompt_tokens
+        return max(256, min(self.max_output_tokens, expected, room))
+
+    def max_input_tokens(self, prompt_overhead_tokens: int) -> int:
+        return int(self.context_window * (1 - self.safety_margin) - prompt_overhead_tokens - 256)
+
+    def start_document(self, name: str, chunk_tokens: int):
+        with self.lock:
+            self.documents[name] = {
+                "chunk_budget": chunk_tokens,
+                "chunks": 0,
+                "estimated_prompt_tokens": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "max_tokens_requested": 0,
+            }
+
+    def record_request(self, name: str, estimated_prompt_tokens: int, max_tokens: int, usage=None):
+        with self.lock:
+            stats = self.documents.setdefault(name, {
+                "chunk_budget": 0, "chunks": 0, "estimated_prompt_tokens": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "max_tokens_requested": 0,
+            })
+            stats["chunks"] += 1
+            stats["estimated_prompt_tokens"] += estimated_prompt_tokens
+            stats["max_tokens_requested"] += max_tokens
+
+            if usage is None:
+                return
+            prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+            completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+            if prompt_tokens and estimated_prompt_tokens:
+                raw_estimate = estimated_prompt_tokens / self.calibration
+                observed = prompt_tokens / raw_estimate
+                weight = 0.5 if self.calibration_samples < 3 else 0.2
+                self.calibration = self.calibration * (1 - weight) + observed * weight
+                self.calibration_samples += 1
+
+    def report(self, name: str) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.documents.get(name, {}))
+        stats["calibration"] = round(self.calibration, 3)
+        return stats